@@ -10,6 +10,7 @@ import datetime
 import functools
 import inspect
 import math
+import os
 
 import astromodels
 import astropy.units as u
@@ -35,6 +36,18 @@ else:
 
     has_chainconsumer = True
 
+try:
+
+    import h5py
+
+except ImportError:
+
+    has_h5py = False
+
+else:
+
+    has_h5py = True
+
 from threeML.exceptions.custom_exceptions import custom_warnings
 from threeML.io.file_utils import sanitize_filename
 from threeML.io.fits_file import fits, FITSFile, FITSExtension
@@ -74,12 +87,24 @@ def _escape_back_yaml_from_fits(yaml_code):
 
 def load_analysis_results(fits_file):
     """
-    Load the results of one or more analysis from a FITS file produced by 3ML
+    Load the results of one or more analysis from a FITS or HDF5 file produced by 3ML
 
-    :param fits_file: path to the FITS file containing the results, as output by MLEResults or BayesianResults
+    Results are read from HDF5 files lazily: the model of each result is only deserialized, and the samples
+    are only read, when they are first needed (so the file must not be removed while the results are in use).
+    The samples of a single parameter can be read without reading the others nor the model with get_variates,
+    for example:
+
+    > results_set = load_analysis_results("time_resolved.h5")
+    > medians = [ar.get_variates("grb.spectrum.main.Band.alpha").median for ar in results_set]
+
+    :param fits_file: path to the FITS or HDF5 file containing the results, as output by MLEResults or BayesianResults
     :return: a new instance of either MLEResults or Bayesian results dending on the type of the input FITS file
     """
 
+    if _is_hdf5_file(fits_file):
+
+        return _load_results_hdf5(fits_file)
+
     with fits.open(fits_file) as f:
 
         n_results = [x.name for x in f].count("ANALYSIS_RESULTS")
@@ -195,6 +220,309 @@ def _load_set_of_results(open_fits_file, n_results):
     return this_set
 
 
+# Number of samples of each parameter in a chunk of the HDF5 SAMPLES dataset. Each parameter is stored
+# in its own chunks, so that the samples of one parameter can be read without reading the others
+_HDF5_SAMPLES_CHUNK_SIZE = 2 ** 16
+
+
+def _is_hdf5_file_name(filename):
+
+    return os.path.splitext(filename)[1].lower() in (".h5", ".hdf5", ".hdf")
+
+
+def _is_hdf5_file(filename):
+
+    if has_h5py:
+
+        filename = sanitize_filename(filename)
+
+        return os.path.exists(filename) and h5py.is_hdf5(filename)
+
+    assert not _is_hdf5_file_name(
+        filename
+    ), "You need to install h5py to read results from HDF5 files"
+
+    return False
+
+
+def _hdf5_string_dtype():
+
+    return h5py.special_dtype(vlen=str)
+
+
+def _hdf5_strings(strings):
+
+    return np.array([str(x) for x in strings], dtype=_hdf5_string_dtype())
+
+
+def _read_hdf5_string(dataset):
+
+    value = dataset[()]
+
+    if isinstance(value, bytes):
+
+        value = value.decode("utf-8")
+
+    return value
+
+
+class _HDF5ResultsSource(object):
+    def __init__(self, filename, group_name, analysis_type):
+        """
+        Reads the parts of one analysis result stored in a HDF5 file on demand. The file is opened only for the
+        duration of each read.
+
+        :param filename: absolute path of the HDF5 file
+        :param group_name: the name of the group containing the result
+        :param analysis_type: MLE or Bayesian
+        """
+
+        self._filename = filename
+        self._group_name = group_name
+        self._analysis_type = analysis_type
+
+    @property
+    def analysis_type(self):
+
+        return self._analysis_type
+
+    def _open(self):
+
+        return h5py.File(self._filename, "r")
+
+    def read_serialized_model(self):
+
+        with self._open() as f:
+
+            return _read_hdf5_string(f[self._group_name]["MODEL"])
+
+    def read_model(self):
+
+        model_dict = my_yaml.load(self.read_serialized_model())
+
+        return ModelParser(model_dict=model_dict).get_model()
+
+    def read_samples(self, param_index=None):
+        """
+        :param param_index: if given, read only the samples of this parameter
+        :return: the samples with shape (n_parameters, n_samples), or (n_samples,) if param_index is given
+        """
+
+        with self._open() as f:
+
+            samples = f[self._group_name]["SAMPLES"]
+
+            if param_index is None:
+
+                return samples[()]
+
+            else:
+
+                return samples[param_index]
+
+    def read_covariance(self):
+
+        with self._open() as f:
+
+            return f[self._group_name]["COVARIANCE"][()]
+
+
+def _write_one_results_hdf5(group, analysis_results):
+
+    group.attrs["RESUTYPE"] = analysis_results.analysis_type
+    group.attrs["PARAMETERS"] = _hdf5_strings(analysis_results._parameter_names)
+    group.attrs["UNITS"] = _hdf5_strings(
+        [unit.to_string() for unit in analysis_results._parameter_units]
+    )
+
+    stat_series = analysis_results.optimal_statistic_values  # type: pd.Series
+
+    group.attrs["STAT_NAMES"] = _hdf5_strings(stat_series.index)
+    group.attrs["STAT_VALUES"] = np.array(stat_series.values, dtype=float)
+
+    measure_series = analysis_results.statistical_measures  # type: pd.Series
+
+    group.attrs["MEAS_NAMES"] = _hdf5_strings(measure_series.index)
+    group.attrs["MEAS_VALUES"] = np.array(measure_series.values, dtype=float)
+
+    # A result which was itself loaded from a HDF5 file does not need to deserialize its model
+
+    if analysis_results._model is None:
+
+        yaml_model_serialization = analysis_results._source.read_serialized_model()
+
+    else:
+
+        yaml_model_serialization = my_yaml.dump(
+            analysis_results._model.to_dict_with_types()
+        )
+
+    group.create_dataset(
+        "MODEL", data=yaml_model_serialization, dtype=_hdf5_string_dtype()
+    )
+
+    group.create_dataset("VALUES", data=analysis_results._values)
+
+    # Samples are stored as (n_parameters, n_samples), one parameter per chunk
+
+    samples = np.asarray(analysis_results._samples_transposed, dtype=float)
+
+    group.create_dataset(
+        "SAMPLES",
+        data=samples,
+        chunks=(1, max(1, min(samples.shape[1], _HDF5_SAMPLES_CHUNK_SIZE))),
+        compression="gzip",
+        shuffle=True,
+    )
+
+    if analysis_results.analysis_type == "MLE":
+
+        group.create_dataset("COVARIANCE", data=analysis_results.covariance_matrix)
+
+
+def _write_results_hdf5(
+    filename, results, overwrite, sequence_name=None, sequence_tuple=None
+):
+    """
+    Write one or more results (and the description of the sequence for a set of results) to a HDF5 file
+
+    :param filename: name of the output file
+    :param results: list of results
+    :param overwrite: whether to overwrite an existing file
+    :param sequence_name: name of the sequence (for sets of results)
+    :param sequence_tuple: columns describing the sequence (for sets of results)
+    :return: none
+    """
+
+    assert has_h5py, "You need to install h5py to write results to HDF5 files"
+
+    filename_sanitized = sanitize_filename(filename)
+
+    if os.path.exists(filename_sanitized) and not overwrite:
+
+        raise IOError("The file %s already exists!" % filename_sanitized)
+
+    # Write to a temporary file first: the results might have been loaded lazily from the file we are
+    # overwriting
+
+    tmp_filename = "%s.tmp" % filename_sanitized
+
+    with h5py.File(tmp_filename, "w") as f:
+
+        f.attrs["ORIGIN"] = "3ML"
+        f.attrs["VERSION"] = str(__version__)
+        f.attrs["DATE"] = datetime.datetime.now().isoformat()
+        f.attrs["N_RESULTS"] = len(results)
+
+        for i, analysis_results in enumerate(results):
+
+            _write_one_results_hdf5(f.create_group("RESULTS/%i" % i), analysis_results)
+
+        if sequence_name is not None:
+
+            sequence_group = f.create_group("SEQUENCE")
+
+            sequence_group.attrs["SEQ_TYPE"] = sequence_name
+            sequence_group.attrs["COLUMNS"] = _hdf5_strings(
+                [name for name, _ in sequence_tuple]
+            )
+
+            for name, column in sequence_tuple:
+
+                if isinstance(column, u.Quantity):
+
+                    dataset = sequence_group.create_dataset(name, data=column.value)
+
+                    dataset.attrs["UNIT"] = column.unit.to_string()
+
+                else:
+
+                    sequence_group.create_dataset(name, data=np.asarray(column))
+
+    os.replace(tmp_filename, filename_sanitized)
+
+
+def _load_one_results_hdf5(filename, group, group_name):
+
+    analysis_type = str(group.attrs["RESUTYPE"])
+
+    statistic_values = collections.OrderedDict(
+        zip([str(x) for x in group.attrs["STAT_NAMES"]], group.attrs["STAT_VALUES"])
+    )
+
+    measure_values = collections.OrderedDict(
+        zip([str(x) for x in group.attrs["MEAS_NAMES"]], group.attrs["MEAS_VALUES"])
+    )
+
+    source = _HDF5ResultsSource(filename, group_name, analysis_type)
+
+    results_class = MLEResults if analysis_type == "MLE" else BayesianResults
+
+    units = [u.Unit(str(x)) for x in group.attrs["UNITS"]]
+
+    return results_class._from_hdf5_source(
+        source,
+        [str(x) for x in group.attrs["PARAMETERS"]],
+        group["VALUES"][()],
+        units,
+        statistic_values,
+        measure_values,
+    )
+
+
+def _load_results_hdf5(filename):
+
+    assert has_h5py, "You need to install h5py to read results from HDF5 files"
+
+    # The sources need the absolute path, as they will open the file again later
+
+    filename = sanitize_filename(filename, abspath=True)
+
+    with h5py.File(filename, "r") as f:
+
+        all_results = []
+
+        for i in range(int(f.attrs["N_RESULTS"])):
+
+            group_name = "RESULTS/%i" % i
+
+            all_results.append(
+                _load_one_results_hdf5(filename, f[group_name], group_name)
+            )
+
+        if "SEQUENCE" not in f:
+
+            return all_results[0]
+
+        this_set = AnalysisResultsSet(all_results)
+
+        sequence_group = f["SEQUENCE"]
+
+        data_list = []
+
+        for name in sequence_group.attrs["COLUMNS"]:
+
+            name = str(name)
+
+            dataset = sequence_group[name]
+
+            if "UNIT" in dataset.attrs:
+
+                this_tuple = (name, dataset[()] * u.Unit(str(dataset.attrs["UNIT"])))
+
+            else:
+
+                this_tuple = (name, dataset[()])
+
+            data_list.append(this_tuple)
+
+        this_set.characterize_sequence(
+            str(sequence_group.attrs["SEQ_TYPE"]), tuple(data_list)
+        )
+
+    return this_set
+
+
 class SEQUENCE(FITSExtension):
     """
     Represents the SEQUENCE extension of a FITS file containing a set of results from a set of analysis
@@ -410,14 +738,19 @@ class _AnalysisResults(object):
             "do not agree." % (samples.shape[1], self._n_free_parameters)
         )
 
+        # Results loaded from an HDF5 file read the model and the samples from there when they are first needed
+        # (see _from_hdf5_source). These are always in memory.
+
+        self._source = None
+
         # NOTE: we clone the model so that whatever happens outside or after, this copy of the model will not be
         # changed
 
-        self._optimized_model = astromodels.clone_model(optimized_model)
+        self._model = astromodels.clone_model(optimized_model)
 
         # Save a transposed version of the samples for easier access
 
-        self._samples_transposed = samples.T
+        self._samples = samples.T
 
         # Store likelihood values in a pandas Series
 
@@ -429,14 +762,110 @@ class _AnalysisResults(object):
 
         # The .free_parameters property of the model is pretty costly because it needs to update all the parameters
         # to see if they are free. Since the saved model will not be touched we can cache that
-        self._free_parameters = self._optimized_model.free_parameters
+        self._free_parameters_cache = self._model.free_parameters
+
+        self._parameter_names = list(self._free_parameters_cache.keys())
 
         # Gather also the optimized values of the parameters
-        self._values = np.array([x.value for x in list(self._free_parameters.values())])
+        self._values = np.array(
+            [x.value for x in list(self._free_parameters_cache.values())]
+        )
+
+        # Units of the free parameters (from the model when needed)
+        self._units = None
 
         # Set the analysis type
         self._analysis_type = analysis_type
 
+    @classmethod
+    def _from_hdf5_source(
+        cls,
+        source,
+        parameter_names,
+        values,
+        units,
+        statistic_values,
+        statistical_measures,
+    ):
+        """
+        Build an instance whose model and samples are read from an HDF5 file only when they are first accessed
+
+        :param source: a _HDF5ResultsSource instance
+        :param parameter_names: the paths of the free parameters
+        :param values: the best fit values of the free parameters
+        :param units: the units of the free parameters
+        :param statistic_values: a dictionary with the statistic values for the different datasets
+        :param statistical_measures: a dictionary with the statistical measures
+        :return: a new instance
+        """
+
+        instance = cls.__new__(cls)
+
+        instance._source = source
+        instance._model = None
+        instance._samples = None
+        instance._free_parameters_cache = None
+        instance._parameter_names = list(parameter_names)
+        instance._n_free_parameters = len(instance._parameter_names)
+        instance._values = np.array(values, dtype=float)
+        instance._units = list(units)
+        instance._optimal_statistic_values = pd.Series(statistic_values)
+        instance._statistical_measures = pd.Series(statistical_measures)
+        instance._analysis_type = source.analysis_type
+
+        return instance
+
+    @property
+    def _optimized_model(self):
+
+        if self._model is None:
+
+            self._model = self._source.read_model()
+
+        return self._model
+
+    @property
+    def _free_parameters(self):
+
+        if self._free_parameters_cache is None:
+
+            self._free_parameters_cache = self._optimized_model.free_parameters
+
+        return self._free_parameters_cache
+
+    @property
+    def _samples_transposed(self):
+
+        if self._samples is None:
+
+            self._samples = self._source.read_samples()
+
+        return self._samples
+
+    @property
+    def _parameter_units(self):
+
+        if self._units is None:
+
+            self._units = [x.unit for x in list(self._free_parameters.values())]
+
+        return self._units
+
+    def _get_parameter_samples(self, param_index=None):
+
+        # Only read the samples of this parameter (or all of them if param_index is None) if the samples
+        # have not been loaded yet. What is read is not kept in memory.
+
+        if self._samples is None:
+
+            return self._source.read_samples(param_index)
+
+        if param_index is None:
+
+            return self._samples
+
+        return self._samples[param_index]
+
     @property
     def samples(self):
         """
@@ -454,28 +883,35 @@ class _AnalysisResults(object):
 
     def write_to(self, filename, overwrite=False):
         """
-        Write results to a FITS file
+        Write results to a FITS file, or to a HDF5 file if the extension of filename is .h5, .hdf5 or .hdf
+        (see load_analysis_results)
 
         :param filename:
         :param overwrite:
         :return: None
         """
 
-        fits_file = AnalysisResultsFITS(self)
+        if _is_hdf5_file_name(filename):
+
+            _write_results_hdf5(filename, [self], overwrite)
+
+        else:
+
+            fits_file = AnalysisResultsFITS(self)
 
-        fits_file.writeto(sanitize_filename(filename), overwrite=overwrite)
+            fits_file.writeto(sanitize_filename(filename), overwrite=overwrite)
 
     def get_variates(self, param_path):
 
-        assert param_path in self._optimized_model.free_parameters, (
+        assert param_path in self._parameter_names, (
             "Parameter %s is not a " "free parameters of the model" % param_path
         )
 
-        param_index = list(self._free_parameters.keys()).index(param_path)
+        param_index = self._parameter_names.index(param_path)
 
         this_value = self._values[param_index]
 
-        these_samples = self._samples_transposed[param_index]
+        these_samples = self._get_parameter_samples(param_index)
 
         this_variate = RandomVariates(these_samples, value=this_value)
 
@@ -1504,6 +1940,17 @@ class MLEResults(_AnalysisResults):
 
         self._covariance_matrix = covariance_matrix
 
+    @classmethod
+    def _from_hdf5_source(cls, source, *args):
+
+        instance = super(MLEResults, cls)._from_hdf5_source(source, *args)
+
+        # Read on first access, like the samples
+
+        instance._covariance_matrix = None
+
+        return instance
+
     @property
     def covariance_matrix(self):
         """
@@ -1513,6 +1960,10 @@ class MLEResults(_AnalysisResults):
                  Use estimate_covariance_matrix in that case)
         """
 
+        if self._covariance_matrix is None and self._source is not None:
+
+            self._covariance_matrix = self._source.read_covariance()
+
         return self._covariance_matrix
 
     def get_correlation_matrix(self):
@@ -1522,7 +1973,7 @@ class MLEResults(_AnalysisResults):
         :return: the correlation matrix
         """
 
-        return self._get_correlation_matrix(self._covariance_matrix)
+        return self._get_correlation_matrix(self.covariance_matrix)
 
     def get_statistic_frame(self):
 
@@ -1665,9 +2116,120 @@ class AnalysisResultsSet(collections.Sequence):
 
         self._sequence_tuple = data_tuple
 
+    def to_frame(self, cl=0.68):
+        """
+        Summarize all the results of the set in one (tidy) pandas DataFrame, with one row for each free parameter
+        of each result. The medians and the equal-tail intervals are computed at once for all the results from
+        their stacked samples, without copying (or, for results loaded lazily from HDF5 files, deserializing) the
+        models. This is much faster than calling get_data_frame() on each result.
+
+        The columns are: result (the index of the result in the set), parameter, value (best fit value), median,
+        negative_error and positive_error (bounds of the equal-tail interval with respect to the best fit value,
+        as in get_data_frame), error, unit, statistic (the total statistic value of the result) and the columns
+        describing the sequence (see characterize_sequence), if any.
+
+        :param cl: confidence/credibility level of the equal-tail intervals (0 < cl < 1)
+        :return: a pandas DataFrame instance
+        """
+
+        assert 0 < cl < 1, "Confidence level must be 0 < cl < 1"
+
+        half_cl = cl / 2.0 * 100.0
+
+        result_index = []
+        parameter_paths = []
+        values = []
+        units = []
+        statistic_values = []
+
+        # The samples of each result, grouped by their number so that they can be stacked. Each
+        # entry is (index of the first row of the result, samples with shape (n_parameters, n_samples))
+
+        samples_by_size = collections.OrderedDict()
+
+        for i, analysis_results in enumerate(self._results):
+
+            n_parameters = analysis_results._n_free_parameters
+
+            samples = np.asarray(analysis_results._get_parameter_samples(), dtype=float)
+
+            samples_by_size.setdefault(samples.shape[1], []).append(
+                (len(values), samples)
+            )
+
+            result_index.extend([i] * n_parameters)
+            parameter_paths.extend(analysis_results._parameter_names)
+            values.extend(analysis_results._values)
+            units.extend(analysis_results._parameter_units)
+            statistic_values.extend(
+                [np.sum(analysis_results.optimal_statistic_values.values)]
+                * n_parameters
+            )
+
+        values = np.array(values, dtype=float)
+
+        percentiles = np.zeros((3, values.shape[0]))
+
+        for entries in samples_by_size.values():
+
+            rows = np.concatenate(
+                [
+                    np.arange(first, first + samples.shape[0])
+                    for first, samples in entries
+                ]
+            )
+
+            stacked_samples = np.concatenate([samples for _, samples in entries])
+
+            percentiles[:, rows] = np.percentile(
+                stacked_samples, [50.0 - half_cl, 50.0, 50.0 + half_cl], axis=1
+            )
+
+        low_bounds, medians, hi_bounds = percentiles
+
+        # As in get_data_frame, parameters in log10 scale (dex units) are reported in linear scale
+
+        is_dex = np.array([unit.to_string().find("dex") >= 0 for unit in units], bool)
+
+        for array in (values, low_bounds, medians, hi_bounds):
+
+            array[is_dex] = 10 ** array[is_dex]
+
+        negative_errors = low_bounds - values
+        positive_errors = hi_bounds - values
+
+        frame = pd.DataFrame(
+            collections.OrderedDict(
+                [
+                    ("result", result_index),
+                    ("parameter", parameter_paths),
+                    ("value", values),
+                    ("median", medians),
+                    ("negative_error", negative_errors),
+                    ("positive_error", positive_errors),
+                    ("error", (np.abs(negative_errors) + positive_errors) / 2.0),
+                    ("unit", units),
+                    ("statistic", statistic_values),
+                ]
+            )
+        )
+
+        if hasattr(self, "_sequence_name"):
+
+            for name, column in self._sequence_tuple:
+
+                if isinstance(column, u.Quantity):
+
+                    column = column.value
+
+                frame[name] = np.asarray(column)[result_index]
+
+        return frame
+
     def write_to(self, filename, overwrite=False):
         """
-        Write this set of results to a FITS file.
+        Write this set of results to a FITS file, or to a HDF5 file if the extension of filename is .h5, .hdf5
+        or .hdf (see load_analysis_results)
 
         :param filename: name for the output file
         :param overwrite: True or False
@@ -1682,6 +2244,18 @@ class AnalysisResultsSet(collections.Sequence):
 
             self.characterize_sequence("unspecified", frame_tuple)
 
+        if _is_hdf5_file_name(filename):
+
+            _write_results_hdf5(
+                filename,
+                self,
+                overwrite,
+                sequence_name=self._sequence_name,
+                sequence_tuple=self._sequence_tuple,
+            )
+
+            return
+
         fits = AnalysisResultsFITS(
             *self,
             sequence_tuple=self._sequence_tuple,
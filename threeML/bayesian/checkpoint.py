@@ -0,0 +1,181 @@
+import os
+import pickle
+
+import numpy as np
+
+
+class MCMCCheckpoint(object):
+    def __init__(self, directory):
+        """
+        Periodic on-disk snapshot of an ensemble MCMC run (emcee, zeus).
+
+        The chain and the log. probabilities are streamed to two flat binary files (float64, C order)
+        which are only ever appended to, so that they can be memory-mapped instead of being
+        loaded in memory. The state of the sampler (positions of the walkers, their log. probability,
+        the state of the random number generator...) is kept in a small pickle file which is
+        replaced atomically after every append, and which records how many steps of the chain are
+        valid. A run killed at any time can therefore be resumed consistently.
+
+        The partial chain can be read with read_chain() while the sampler is still running.
+
+        :param directory: the directory where to store the checkpoint (created if needed)
+        """
+
+        self._directory = os.path.abspath(
+            os.path.expandvars(os.path.expanduser(directory))
+        )
+
+        if not os.path.exists(self._directory):
+
+            os.makedirs(self._directory)
+
+    @property
+    def directory(self):
+
+        return self._directory
+
+    @property
+    def _state_file(self):
+
+        return os.path.join(self._directory, "state.pkl")
+
+    @property
+    def _chain_file(self):
+
+        return os.path.join(self._directory, "chain.dat")
+
+    @property
+    def _log_prob_file(self):
+
+        return os.path.join(self._directory, "log_prob.dat")
+
+    @property
+    def has_state(self):
+        """
+        :return: whether this directory contains a checkpoint that can be resumed
+        """
+
+        return os.path.exists(self._state_file)
+
+    def clear(self):
+        """
+        Remove a previous checkpoint (if any) from the directory
+        """
+
+        for f in [self._state_file, self._chain_file, self._log_prob_file]:
+
+            if os.path.exists(f):
+
+                os.remove(f)
+
+    def load_state(self):
+        """
+        :return: the dictionary describing the state of the sampler at the last checkpoint
+        """
+
+        with open(self._state_file, "rb") as f:
+
+            return pickle.load(f)
+
+    @staticmethod
+    def _append(file_name, array, n_valid_bytes):
+
+        # Remove whatever has been written after the last valid checkpoint (if the
+        # job was killed between the write of the data and the write of the state)
+
+        if os.path.exists(file_name) and os.path.getsize(file_name) > n_valid_bytes:
+
+            os.truncate(file_name, n_valid_bytes)
+
+        with open(file_name, "ab") as f:
+
+            np.ascontiguousarray(array, dtype=np.float64).tofile(f)
+
+    def save(self, chain_chunk, log_prob_chunk, **state):
+        """
+        Append a chunk of the chain and update the state of the sampler
+
+        :param chain_chunk: the new samples, with shape (n_steps, n_walkers, n_dim)
+        :param log_prob_chunk: the corresponding log. probabilities, with shape (n_steps, n_walkers)
+        :param state: the state of the sampler after the last step (any picklable keywords)
+        :return: none
+        """
+
+        chain_chunk = np.asarray(chain_chunk)
+
+        n_steps, n_walkers, n_dim = chain_chunk.shape
+
+        n_stored = self.load_state()["n_stored"] if self.has_state else 0
+
+        # 8 bytes per float64
+
+        self._append(self._chain_file, chain_chunk, n_stored * n_walkers * n_dim * 8)
+        self._append(self._log_prob_file, log_prob_chunk, n_stored * n_walkers * 8)
+
+        state["n_stored"] = n_stored + n_steps
+        state["n_walkers"] = n_walkers
+        state["n_dim"] = n_dim
+
+        # Write the state to a temporary file first, so that a job killed during the
+        # write does not corrupt the checkpoint
+
+        tmp_file = "%s.tmp" % self._state_file
+
+        with open(tmp_file, "wb") as f:
+
+            pickle.dump(state, f)
+
+        os.replace(tmp_file, self._state_file)
+
+    def read_chain(self):
+        """
+        Memory-map the chain stored so far. This can be used while the sampler is still running.
+        Nothing is read from disk until the arrays are accessed, so slicing them (for example to
+        remove the burn-in or to thin the chain) is cheap.
+
+        :return: (chain, log_prob) with shapes (n_steps, n_walkers, n_dim) and (n_steps, n_walkers)
+        """
+
+        if not self.has_state:
+
+            raise RuntimeError("No checkpoint found in %s" % self._directory)
+
+        state = self.load_state()
+
+        n_steps, n_walkers, n_dim = (
+            state["n_stored"],
+            state["n_walkers"],
+            state["n_dim"],
+        )
+
+        chain = np.memmap(
+            self._chain_file,
+            dtype=np.float64,
+            mode="r",
+            shape=(n_steps, n_walkers, n_dim),
+        )
+        log_prob = np.memmap(
+            self._log_prob_file, dtype=np.float64, mode="r", shape=(n_steps, n_walkers)
+        )
+
+        return chain, log_prob
+
+    def get_samples(self, n_burn_in=0, thin=1):
+        """
+        Return the samples stored so far, flattened over the walkers, after removing the burn-in
+        and thinning the chain. Without thinning, the returned arrays are views of the memory-mapped
+        files, i.e., they do not occupy memory.
+
+        :param n_burn_in: number of steps to discard at the beginning of the chain
+        :param thin: keep only one step every thin steps
+        :return: (samples, log_prob) with shapes (n_samples, n_dim) and (n_samples,)
+        """
+
+        chain, log_prob = self.read_chain()
+
+        n_dim = chain.shape[2]
+
+        return (
+            chain[n_burn_in::thin].reshape(-1, n_dim),
+            log_prob[n_burn_in::thin].reshape(-1),
+        )
@@ -0,0 +1,280 @@
+import numpy as np
+
+# minimum number of steps after the burn-in needed to compute the (split) Gelman-Rubin statistic
+
+MIN_CHAIN_LENGTH = 4
+
+
+def _next_power_of_two(n):
+
+    i = 1
+
+    while i < n:
+
+        i = i << 1
+
+    return i
+
+
+def _auto_window(taus, c):
+
+    # Sokal's adaptive truncation: the smallest window M such that M >= c * tau(M)
+
+    m = np.arange(len(taus)) < c * taus
+
+    if np.any(m):
+
+        return np.argmin(m)
+
+    return len(taus) - 1
+
+
+def integrated_autocorrelation_time(chain, c=5.0):
+    """
+    Estimate the integrated autocorrelation time of an ensemble chain, for each parameter.
+
+    The normalized autocorrelation function is computed with FFTs for each walker and averaged
+    over the walkers before being integrated, using Sokal's adaptive window. This is more robust
+    than averaging the autocorrelation times of the single walkers for short chains
+    (see https://emcee.readthedocs.io/en/stable/tutorials/autocorr/).
+
+    :param chain: the chain, with shape (n_steps, n_walkers, n_dim)
+    :param c: the window constant
+    :return: the autocorrelation time for each parameter, with shape (n_dim,)
+    """
+
+    chain = np.asarray(chain, dtype=float)
+
+    n_steps = chain.shape[0]
+
+    n = _next_power_of_two(n_steps)
+
+    # FFT of all walkers and parameters at once, along the steps
+
+    centered = chain - np.mean(chain, axis=0)
+
+    f = np.fft.rfft(centered, n=2 * n, axis=0)
+
+    acf = np.fft.irfft(f * np.conjugate(f), axis=0)[:n_steps].real
+
+    # Normalize each walker, then average over the walkers (a constant walker,
+    # e.g., stuck on a boundary, does not contribute)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+
+        acf = acf / acf[0]
+
+    acf = np.nanmean(acf, axis=1)
+
+    taus = 2.0 * np.cumsum(acf, axis=0) - 1.0
+
+    tau = np.empty(chain.shape[2])
+
+    for i in range(chain.shape[2]):
+
+        tau[i] = taus[_auto_window(taus[:, i], c), i]
+
+    return tau
+
+
+def gelman_rubin(chain):
+    """
+    Compute the (split) Gelman-Rubin statistic R-hat for each parameter, treating each walker as an
+    independent chain. Each walker is split in two halves, so that trends within the walkers are
+    detected as well. Values close to 1 indicate that the walkers sample the same distribution.
+
+    :param chain: the chain, with shape (n_steps, n_walkers, n_dim)
+    :return: R-hat for each parameter, with shape (n_dim,)
+    """
+
+    chain = np.asarray(chain, dtype=float)
+
+    n_half = chain.shape[0] // 2
+
+    assert (
+        n_half >= MIN_CHAIN_LENGTH // 2
+    ), "The chain is too short to compute the Gelman-Rubin statistic"
+
+    # (n_half, 2 * n_walkers, n_dim)
+
+    chains = np.concatenate([chain[:n_half], chain[chain.shape[0] - n_half :]], axis=1)
+
+    within = np.mean(np.var(chains, axis=0, ddof=1), axis=0)
+
+    between_over_n = np.var(np.mean(chains, axis=0), axis=0, ddof=1)
+
+    variance = (n_half - 1.0) / n_half * within + between_over_n
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+
+        return np.sqrt(variance / within)
+
+
+class ConvergenceMonitor(object):
+    def __init__(
+        self,
+        target_ess=1000,
+        max_r_hat=1.01,
+        n_burn_in=None,
+        tau_factor=50.0,
+        tau_tolerance=0.01,
+        burn_in_factor=2.0,
+        max_check_length=5000,
+    ):
+        """
+        Monitor the convergence of an ensemble MCMC run while it is running. The chain is declared
+        converged when all the following conditions are met for all the parameters:
+
+        * the chain is longer than tau_factor times the integrated autocorrelation time tau, so
+          that tau can be trusted;
+        * the estimate of tau changed by less than tau_tolerance (relative) since the previous check;
+        * the split Gelman-Rubin statistic of the chain after the burn-in is below max_r_hat;
+        * the effective sample size after the burn-in (n_walkers * n_steps / tau) reaches target_ess.
+
+        Unless fixed, the burn-in is taken as burn_in_factor times the largest autocorrelation time, but
+        never more than half of the chain. A fixed burn-in is always discarded entirely: the checks
+        are skipped (the chain is not converged) until at least MIN_CHAIN_LENGTH steps follow it.
+
+        :param target_ess: the required effective sample size for each parameter
+        :param max_r_hat: the maximum allowed value for the Gelman-Rubin statistic
+        :param n_burn_in: a fixed burn-in (default: determined from the autocorrelation time)
+        :param tau_factor: minimum length of the chain in units of the autocorrelation time
+        :param tau_tolerance: maximum relative change of the autocorrelation time between checks
+        :param burn_in_factor: burn-in in units of the autocorrelation time
+        :param max_check_length: longer chains are thinned to about this number of steps before
+        computing the diagnostics, so that the cost of a check does not grow with the length of the run
+        """
+
+        self._target_ess = float(target_ess)
+        self._max_r_hat = float(max_r_hat)
+        self._fixed_burn_in = n_burn_in
+        self._tau_factor = float(tau_factor)
+        self._tau_tolerance = float(tau_tolerance)
+        self._burn_in_factor = float(burn_in_factor)
+        self._max_check_length = int(max_check_length)
+
+        self._tau = None
+        self._thin = None
+        self._ess = None
+        self._r_hat = None
+        self._n_burn_in = 0
+        self._n_steps = 0
+        self._converged = False
+
+    @property
+    def converged(self):
+
+        return self._converged
+
+    @property
+    def n_steps(self):
+        """
+        :return: the length of the chain at the last check
+        """
+
+        return self._n_steps
+
+    @property
+    def n_burn_in(self):
+        """
+        :return: the burn-in determined at the last check (the fixed one, if provided)
+        """
+
+        if self._fixed_burn_in is not None:
+
+            return int(self._fixed_burn_in)
+
+        return self._n_burn_in
+
+    @property
+    def tau(self):
+
+        return self._tau
+
+    @property
+    def ess(self):
+
+        return self._ess
+
+    @property
+    def r_hat(self):
+
+        return self._r_hat
+
+    def check(self, chain):
+        """
+        Update the diagnostics with the current chain
+
+        :param chain: the whole chain so far (including the burn-in), with shape (n_steps, n_walkers, n_dim)
+        :return: True if the chain has converged, False otherwise
+        """
+
+        n_steps, n_walkers, _ = chain.shape
+
+        if self._fixed_burn_in is not None:
+
+            n_kept = n_steps - int(self._fixed_burn_in)
+
+        else:
+
+            n_kept = n_steps - n_steps // 2
+
+        if n_kept < MIN_CHAIN_LENGTH:
+
+            # too short to say anything yet: keep the diagnostics of the previous check
+
+            self._converged = False
+            self._n_steps = n_steps
+
+            return self._converged
+
+        # Thin long chains, so that the cost of a check stays bounded. Slicing a memory-mapped chain
+        # only reads the selected steps. The autocorrelation time of the thinned chain is converted
+        # back to steps (it is slightly overestimated, which is conservative). The thinning is a power
+        # of two, so that it changes rarely: tau is only compared between checks with the same thinning
+
+        thin = _next_power_of_two(np.ceil(n_steps / float(self._max_check_length)))
+
+        tau = thin * integrated_autocorrelation_time(chain[::thin])
+
+        max_tau = np.max(tau)
+
+        if self._fixed_burn_in is not None:
+
+            n_burn_in = int(self._fixed_burn_in)
+
+        else:
+
+            # Always keep at least half of the chain
+
+            n_burn_in = min(int(np.ceil(self._burn_in_factor * max_tau)), n_steps // 2)
+
+        n_kept = n_steps - n_burn_in
+
+        ess = n_walkers * n_kept / tau
+
+        r_hat = gelman_rubin(
+            chain[n_burn_in :: max(1, min(thin, n_kept // MIN_CHAIN_LENGTH))]
+        )
+
+        is_stable = (
+            self._tau is not None
+            and self._thin == thin
+            and np.all(np.abs(self._tau - tau) / tau < self._tau_tolerance)
+        )
+
+        self._converged = bool(
+            is_stable
+            and n_steps > self._tau_factor * max_tau
+            and np.all(ess >= self._target_ess)
+            and np.all(r_hat < self._max_r_hat)
+        )
+
+        self._tau = tau
+        self._thin = thin
+        self._ess = ess
+        self._r_hat = r_hat
+        self._n_burn_in = n_burn_in
+        self._n_steps = n_steps
+
+        return self._converged
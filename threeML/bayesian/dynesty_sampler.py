@@ -1,5 +1,6 @@
 import math
 import os
+import pickle
 import time
 import numpy as np
 
@@ -7,6 +8,7 @@ from astromodels import ModelAssertionViolation, use_astromodels_memoization
 from threeML.bayesian.sampler_base import UnitCubeSampler
 from threeML.config.config import threeML_config
 from threeML.parallel.parallel_client import ParallelClient
+from threeML.parallel.local_pool import LocalPool
 
 try:
 
@@ -32,6 +34,70 @@ class DynestyPool(object):
         return self.dview.map_sync(function, tasks)
 
 
+def _save_dynesty_checkpoint(sampler, file_name):
+    """
+    Pickle a dynesty sampler. The likelihood and prior (which refer to the whole model and
+    data list), the pool and the random generator are detached before pickling and
+    re-attached afterwards, so the sampler can continue
+
+    :param sampler: a dynesty sampler
+    :param file_name: the output file
+    :return: none
+    """
+
+    functions = (sampler.loglikelihood.func, sampler.prior_transform.func)
+    parallel = (sampler.pool, sampler.M, sampler.rstate)
+
+    random_state = sampler.rstate.get_state()
+
+    sampler.loglikelihood.func = None
+    sampler.prior_transform.func = None
+    sampler.pool = None
+    sampler.M = None
+    sampler.rstate = None
+
+    try:
+
+        tmp_file = "%s.tmp" % file_name
+
+        with open(tmp_file, "wb") as f:
+
+            pickle.dump({"sampler": sampler, "random_state": random_state}, f)
+
+        os.replace(tmp_file, file_name)
+
+    finally:
+
+        sampler.loglikelihood.func, sampler.prior_transform.func = functions
+        sampler.pool, sampler.M, sampler.rstate = parallel
+
+
+def _load_dynesty_checkpoint(file_name, loglike, prior, pool=None, rstate=None):
+    """
+    Load a dynesty sampler saved with _save_dynesty_checkpoint and attach to it the
+    current likelihood, prior and pool
+
+    :return: the sampler
+    """
+
+    with open(file_name, "rb") as f:
+
+        saved = pickle.load(f)
+
+    sampler = saved["sampler"]
+
+    sampler.loglikelihood.func = loglike
+    sampler.prior_transform.func = prior
+
+    sampler.pool = pool
+    sampler.M = map if pool is None else pool.map
+
+    sampler.rstate = np.random if rstate is None else rstate
+    sampler.rstate.set_state(saved["random_state"])
+
+    return sampler
+
+
 class DynestyNestedSampler(UnitCubeSampler):
     def __init__(self, likelihood_model=None, data_list=None, **kwargs):
 
@@ -81,9 +147,17 @@ class DynestyNestedSampler(UnitCubeSampler):
         fmove=0.9,
         max_move=100,
         update_func=None,
+        n_processes=None,
+        checkpoint_dir=None,
+        checkpoint_every=1000,
+        resume=False,
         **kwargs
     ):
 
+        self._checkpoint_dir = checkpoint_dir
+        self._checkpoint_every = int(checkpoint_every)
+        self._resume = resume
+
         self._sampler_kwargs = {}
         self._sampler_kwargs["maxiter"] = maxiter
         self._sampler_kwargs["maxcall"] = maxcall
@@ -109,7 +183,7 @@ class DynestyNestedSampler(UnitCubeSampler):
 
         # TODO: have to figure out why
         # this is not working properly
-        if use_pool is None:
+        if use_pool is None and n_processes is None:
             use_pool = dict(
                 prior_transform=False,
                 loglikelihood=False,
@@ -117,6 +191,20 @@ class DynestyNestedSampler(UnitCubeSampler):
                 update_bound=True,
             )
 
+        elif use_pool is None:
+
+            # with a local pool the closures are never pickled
+            # so everything can be sent to the workers
+
+            use_pool = dict(
+                prior_transform=True,
+                loglikelihood=True,
+                propose_point=True,
+                update_bound=True,
+            )
+
+        self._n_processes = n_processes
+
         self._kwargs["use_pool"] = use_pool
 
         self._kwargs["live_points"] = live_points
@@ -170,23 +258,45 @@ class DynestyNestedSampler(UnitCubeSampler):
 
         loglike, dynesty_prior = self._construct_unitcube_posterior(return_copy=True)
 
-        # check if we are doing to do things in parallel
+        self._sampler_kwargs["print_progress"] = loud
 
-        if threeML_config["parallel"]["use-parallel"]:
+        with use_astromodels_memoization(False):
 
-            c = ParallelClient()
-            view = c[:]
+            # check if we are doing to do things in parallel
 
-            self._kwargs["pool"] = view
-            self._kwargs["queue_size"] = len(view)
+            if self._n_processes is not None:
 
-        sampler = NestedSampler(loglike, dynesty_prior, **self._kwargs)
+                # the workers are forked here, so that they inherit
+                # the likelihood and the prior without pickling them
 
-        self._sampler_kwargs["print_progress"] = loud
+                pool = LocalPool(
+                    self._n_processes, loglike=loglike, prior=dynesty_prior
+                )
 
-        with use_astromodels_memoization(False):
+                self._kwargs["pool"] = pool
+                self._kwargs["queue_size"] = pool.size
 
-            sampler.run_nested(**self._sampler_kwargs)
+                try:
+
+                    sampler = self._run_nested(pool.loglike, pool.prior, loud)
+
+                finally:
+
+                    pool.close()
+
+                    self._kwargs["pool"] = None
+
+            else:
+
+                if threeML_config["parallel"]["use-parallel"]:
+
+                    c = ParallelClient()
+                    view = c[:]
+
+                    self._kwargs["pool"] = view
+                    self._kwargs["queue_size"] = len(view)
+
+                sampler = self._run_nested(loglike, dynesty_prior, loud)
 
         self._sampler = sampler
 
@@ -227,8 +337,8 @@ class DynestyNestedSampler(UnitCubeSampler):
 
         self._log_like_values = logl_dynesty
 
-        self._log_probability_values = self._log_like_values + np.array(
-            [self._log_prior(samples) for samples in self._raw_samples]
+        self._log_probability_values = self._log_like_values + self._log_priors(
+            self._raw_samples
         )
 
         self._marginal_likelihood = self._sampler.results["logz"][-1] / np.log(10.0)
@@ -244,6 +354,80 @@ class DynestyNestedSampler(UnitCubeSampler):
         return self.samples
 
 
+    def _run_nested(self, loglike, prior, loud):
+        """
+        Run the nested sampling, checkpointing the sampler every checkpoint_every
+        iterations if a checkpoint directory was provided
+
+        :returns: the dynesty sampler
+        """
+
+        if self._checkpoint_dir is None:
+
+            sampler = NestedSampler(loglike, prior, **self._kwargs)
+
+            sampler.run_nested(**self._sampler_kwargs)
+
+            return sampler
+
+        if not os.path.exists(self._checkpoint_dir):
+
+            os.makedirs(self._checkpoint_dir)
+
+        checkpoint_file = os.path.join(self._checkpoint_dir, "dynesty_sampler.pkl")
+
+        if self._resume and os.path.exists(checkpoint_file):
+
+            sampler = _load_dynesty_checkpoint(
+                checkpoint_file,
+                loglike,
+                prior,
+                pool=self._kwargs["pool"],
+                rstate=self._kwargs["rstate"],
+            )
+
+            print("Resuming from iteration %i" % (sampler.it - 1))
+
+        else:
+
+            sampler = NestedSampler(loglike, prior, **self._kwargs)
+
+        sample_kwargs = dict(self._sampler_kwargs)
+
+        sample_kwargs.pop("print_progress")
+        sample_kwargs.pop("print_func")
+
+        # same default as run_nested
+
+        if sample_kwargs["dlogz"] is None:
+
+            if sample_kwargs["add_live"]:
+
+                sample_kwargs["dlogz"] = 1e-3 * (sampler.nlive - 1.0) + 0.01
+
+            else:
+
+                sample_kwargs["dlogz"] = 0.01
+
+        for i, _ in enumerate(sampler.sample(save_samples=True, **sample_kwargs)):
+
+            if (i + 1) % self._checkpoint_every == 0:
+
+                _save_dynesty_checkpoint(sampler, checkpoint_file)
+
+                if loud:
+
+                    print("Checkpoint saved at iteration %i" % (sampler.it - 1))
+
+        _save_dynesty_checkpoint(sampler, checkpoint_file)
+
+        if sample_kwargs["add_live"]:
+
+            sampler.add_final_live(print_progress=loud)
+
+        return sampler
+
+
 class DynestyDynamicSampler(UnitCubeSampler):
     def __init__(self, likelihood_model=None, data_list=None, **kwargs):
 
@@ -304,6 +488,7 @@ class DynestyDynamicSampler(UnitCubeSampler):
         fmove=0.9,
         max_move=100,
         update_func=None,
+        n_processes=None,
         **kwargs
     ):
 
@@ -345,7 +530,7 @@ class DynestyDynamicSampler(UnitCubeSampler):
 
         # TODO: have to figure out why
         # this is not working properly
-        if use_pool is None:
+        if use_pool is None and n_processes is None:
             use_pool = dict(
                 prior_transform=False,
                 loglikelihood=False,
@@ -353,6 +538,20 @@ class DynestyDynamicSampler(UnitCubeSampler):
                 update_bound=True,
             )
 
+        elif use_pool is None:
+
+            # with a local pool the closures are never pickled
+            # so everything can be sent to the workers
+
+            use_pool = dict(
+                prior_transform=True,
+                loglikelihood=True,
+                propose_point=True,
+                update_bound=True,
+            )
+
+        self._n_processes = n_processes
+
         self._kwargs["use_pool"] = use_pool
 
  
@@ -406,23 +605,51 @@ class DynestyDynamicSampler(UnitCubeSampler):
 
         loglike, dynesty_prior = self._construct_unitcube_posterior(return_copy=True)
 
-        # check if we are doing to do things in parallel
+        self._sampler_kwargs["print_progress"] = loud
 
-        if threeML_config["parallel"]["use-parallel"]:
+        with use_astromodels_memoization(False):
 
-            c = ParallelClient()
-            view = c[:]
+            # check if we are doing to do things in parallel
 
-            self._kwargs["pool"] = view
-            self._kwargs["queue_size"] = len(view)
+            if self._n_processes is not None:
 
-        sampler = DynamicNestedSampler(loglike, dynesty_prior, **self._kwargs)
+                # the workers are forked here, so that they inherit
+                # the likelihood and the prior without pickling them
 
-        self._sampler_kwargs["print_progress"] = loud
+                pool = LocalPool(
+                    self._n_processes, loglike=loglike, prior=dynesty_prior
+                )
 
-        with use_astromodels_memoization(False):
+                self._kwargs["pool"] = pool
+                self._kwargs["queue_size"] = pool.size
 
-            sampler.run_nested(**self._sampler_kwargs)
+                try:
+
+                    sampler = DynamicNestedSampler(
+                        pool.loglike, pool.prior, **self._kwargs
+                    )
+
+                    sampler.run_nested(**self._sampler_kwargs)
+
+                finally:
+
+                    pool.close()
+
+                    self._kwargs["pool"] = None
+
+            else:
+
+                if threeML_config["parallel"]["use-parallel"]:
+
+                    c = ParallelClient()
+                    view = c[:]
+
+                    self._kwargs["pool"] = view
+                    self._kwargs["queue_size"] = len(view)
+
+                sampler = DynamicNestedSampler(loglike, dynesty_prior, **self._kwargs)
+
+                sampler.run_nested(**self._sampler_kwargs)
 
         self._sampler = sampler
 
@@ -463,8 +690,8 @@ class DynestyDynamicSampler(UnitCubeSampler):
 
         self._log_like_values = logl_dynesty
 
-        self._log_probability_values = self._log_like_values + np.array(
-            [self._log_prior(samples) for samples in self._raw_samples]
+        self._log_probability_values = self._log_like_values + self._log_priors(
+            self._raw_samples
         )
 
         self._marginal_likelihood = self._sampler.results["logz"][-1] / np.log(10.0)
@@ -1,6 +1,7 @@
 import emcee
 import numpy as np
 
+from threeML.bayesian.checkpoint import MCMCCheckpoint
 from threeML.bayesian.sampler_base import MCMCSampler
 from threeML.config.config import threeML_config
 from threeML.parallel.parallel_client import ParallelClient
@@ -22,13 +23,55 @@ class EmceeSampler(MCMCSampler):
 
         super(EmceeSampler, self).__init__(likelihood_model, data_list, **kwargs)
 
-    def setup(self, n_iterations, n_burn_in=None, n_walkers=20, seed=None):
+    def setup(
+        self,
+        n_iterations,
+        n_burn_in=None,
+        n_walkers=20,
+        seed=None,
+        thin=1,
+        checkpoint_dir=None,
+        checkpoint_every=100,
+        resume=False,
+        adaptive=False,
+        target_ess=1000,
+        max_r_hat=1.01,
+        check_every=100,
+    ):
+        """
+        Setup the emcee sampler
+
+        :param n_iterations: number of iterations (after the burn-in)
+        :param n_burn_in: number of burn-in iterations (default: n_iterations / 4)
+        :param n_walkers: number of walkers
+        :param seed: seed for the random number generator
+        :param thin: keep only one iteration every thin iterations
+        :param checkpoint_dir: if provided, the chain is streamed to this directory instead of being kept
+        in memory, and the state of the sampler is saved every checkpoint_every iterations. The results
+        memory-map the chain
+        :param checkpoint_every: number of iterations between checkpoints
+        :param resume: if True and checkpoint_dir contains a checkpoint, continue from there
+        :param adaptive: if True, n_iterations is the maximum number of iterations (including the burn-in)
+        and the sampling stops as soon as the chain has converged, i.e., when the integrated autocorrelation
+        time is reliably estimated, the effective sample size of each parameter reaches target_ess and the
+        Gelman-Rubin statistic is below max_r_hat. Unless n_burn_in is provided, the burn-in is determined
+        from the autocorrelation time
+        :param target_ess: the effective sample size to reach for each parameter (adaptive mode)
+        :param max_r_hat: the maximum Gelman-Rubin statistic (adaptive mode)
+        :param check_every: number of iterations between convergence checks (adaptive mode). When
+        checkpointing, the convergence is checked at the first checkpoint after every check_every iterations
+        :returns:
+        :rtype:
+
+        """
 
         self._n_iterations = int(n_iterations)
 
         if n_burn_in is None:
 
-            self._n_burn_in = int(np.floor(n_iterations / 4.0))
+            # in adaptive mode, the burn-in is determined during the sampling
+
+            self._n_burn_in = None if adaptive else int(np.floor(n_iterations / 4.0))
 
         else:
 
@@ -38,6 +81,16 @@ class EmceeSampler(MCMCSampler):
 
         self._seed = seed
 
+        self._thin = int(thin)
+
+        self._checkpoint_dir = checkpoint_dir
+
+        self._checkpoint_every = int(checkpoint_every)
+
+        self._resume = resume
+
+        self._setup_adaptive(adaptive, target_ess, max_r_hat, check_every)
+
         self._is_setup = True
 
     def sample(self, quiet=False):
@@ -78,42 +131,64 @@ class EmceeSampler(MCMCSampler):
 
                 sampler._random.seed(self._seed)
 
-            # Sample the burn-in
-            pos, prob, state = sampler.run_mcmc(
-                initial_state=p0, nsteps=self._n_burn_in, progress=loud
-            )
+            if self._checkpoint_dir is not None:
 
-            # Reset sampler
+                samples, log_prob, acceptance_fraction = self._sample_with_checkpoints(
+                    sampler, p0, n_dim, loud
+                )
 
-            sampler.reset()
+            elif self._adaptive:
 
-            state = emcee.State(pos, prob, random_state=state)
+                samples, log_prob = self._sample_adaptively(sampler, p0, loud)
 
-            # Run the true sampling
+                acceptance_fraction = sampler.acceptance_fraction
 
-            _ = sampler.run_mcmc(
-                initial_state=state, nsteps=self._n_iterations, progress=loud
-            )
+            else:
+
+                self._convergence_monitor = None
+
+                # Sample the burn-in
+                pos, prob, state = sampler.run_mcmc(
+                    initial_state=p0, nsteps=self._n_burn_in, progress=loud
+                )
+
+                # Reset sampler
+
+                sampler.reset()
+
+                state = emcee.State(pos, prob, random_state=state)
+
+                # Run the true sampling
+
+                _ = sampler.run_mcmc(
+                    initial_state=state, nsteps=self._n_iterations, progress=loud
+                )
 
-        acc = np.mean(sampler.acceptance_fraction)
+                samples = sampler.get_chain(flat=True, thin=self._thin)
+
+                log_prob = sampler.get_log_prob(flat=True, thin=self._thin)
+
+                acceptance_fraction = sampler.acceptance_fraction
+
+        acc = np.mean(acceptance_fraction)
 
         print("\nMean acceptance fraction: %s\n" % acc)
 
         self._sampler = sampler
-        self._raw_samples = sampler.get_chain(flat=True)
+        self._raw_samples = samples
 
         # Compute the corresponding values of the likelihood
 
         # First we need the prior
-        log_prior = [self._log_prior(x) for x in self._raw_samples]
+        log_prior = self._log_priors(self._raw_samples)
 
         # Now we get the log posterior and we remove the log prior
 
-        self._log_like_values = sampler.get_log_prob(flat=True) - log_prior
+        self._log_like_values = log_prob - log_prior
 
         # we also want to store the log probability
 
-        self._log_probability_values = sampler.get_log_prob(flat=True)
+        self._log_probability_values = log_prob
 
         self._marginal_likelihood = None
 
@@ -126,3 +201,148 @@ class EmceeSampler(MCMCSampler):
             self._results.display()
 
         return self.samples
+
+    def _sample_with_checkpoints(self, sampler, p0, n_dim, loud):
+        """
+        Run burn-in and sampling in blocks of checkpoint_every iterations, saving the
+        chain and the state of the sampler after each block. The number of accepted moves
+        of each walker is kept in the state as well, since the sampler is reset after each block
+
+        :returns: the flattened samples and log. probabilities after the burn-in, and the acceptance
+        fraction of each walker over the whole run
+        """
+
+        checkpoint = MCMCCheckpoint(self._checkpoint_dir)
+
+        monitor = self._get_convergence_monitor()
+
+        if monitor is not None:
+
+            n_total = self._n_iterations
+
+        else:
+
+            n_total = self._n_burn_in + self._n_iterations
+
+        if self._resume and checkpoint.has_state:
+
+            saved = checkpoint.load_state()
+
+            assert saved["coords"].shape == (self._n_walkers, n_dim), (
+                "The checkpoint in %s is not compatible with the current setup"
+                % checkpoint.directory
+            )
+
+            state = emcee.State(
+                saved["coords"],
+                log_prob=saved["log_prob"],
+                random_state=saved["random_state"],
+            )
+
+            n_done = saved["n_steps"]
+
+            n_accepted = saved["n_accepted"]
+
+            print("Resuming from iteration %i of %i" % (n_done, n_total))
+
+        else:
+
+            checkpoint.clear()
+
+            state = p0
+
+            n_done = 0
+
+            n_accepted = np.zeros(self._n_walkers, dtype=int)
+
+        converged = False
+
+        n_last_check = n_done
+
+        if monitor is not None and n_done > 0:
+
+            # Restore the convergence history of the resumed run
+
+            chain = checkpoint.read_chain()[0]
+
+            if n_done > self._check_every:
+
+                monitor.check(chain[: n_done - self._check_every])
+
+            converged = monitor.check(chain)
+
+        while not converged and n_done < n_total:
+
+            n_steps = min(self._checkpoint_every, n_total - n_done)
+
+            # the previous samples are on disk already, no need to keep them in memory
+
+            sampler.reset()
+
+            state = sampler.run_mcmc(initial_state=state, nsteps=n_steps, progress=loud)
+
+            n_done += n_steps
+
+            n_accepted = n_accepted + sampler.backend.accepted
+
+            checkpoint.save(
+                sampler.get_chain(),
+                sampler.get_log_prob(),
+                coords=state.coords,
+                log_prob=state.log_prob,
+                random_state=state.random_state,
+                n_steps=n_done,
+                n_accepted=n_accepted,
+            )
+
+            if monitor is not None and (
+                n_done - n_last_check >= self._check_every or n_done == n_total
+            ):
+
+                converged = monitor.check(checkpoint.read_chain()[0])
+
+                n_last_check = n_done
+
+        samples, log_prob = checkpoint.get_samples(
+            self._finalize_burn_in(checkpoint), self._thin
+        )
+
+        return samples, log_prob, n_accepted / float(n_done)
+
+    def _sample_adaptively(self, sampler, p0, loud):
+        """
+        Run the sampler in blocks of check_every iterations until the chain has converged
+        or the maximum number of iterations is reached
+
+        :returns: the flattened samples and log. probabilities after the burn-in
+        """
+
+        monitor = self._get_convergence_monitor()
+
+        state = p0
+
+        n_done = 0
+
+        while n_done < self._n_iterations:
+
+            n_steps = min(self._check_every, self._n_iterations - n_done)
+
+            state = sampler.run_mcmc(initial_state=state, nsteps=n_steps, progress=loud)
+
+            n_done += n_steps
+
+            if monitor.check(sampler.get_chain()):
+
+                break
+
+        self._report_convergence()
+
+        samples = sampler.get_chain(
+            flat=True, discard=monitor.n_burn_in, thin=self._thin
+        )
+
+        log_prob = sampler.get_log_prob(
+            flat=True, discard=monitor.n_burn_in, thin=self._thin
+        )
+
+        return samples, log_prob
@@ -216,8 +216,8 @@ class MultiNestSampler(UnitCubeSampler):
 
             # now get the log probability
 
-            self._log_probability_values = self._log_like_values + np.array(
-                [self._log_prior(samples) for samples in self._raw_samples]
+            self._log_probability_values = self._log_like_values + self._log_priors(
+                self._raw_samples
             )
 
             self._build_samples_dictionary()
@@ -122,7 +122,7 @@ class NUTSSampler(MCMCSampler):
         self._test = lnprob
         
         # First we need the prior
-        log_prior = np.array([self._log_prior(x) for x in self._raw_samples])
+        log_prior = self._log_priors(self._raw_samples)
 
         # Now we get the log posterior and we remove the log prior
 
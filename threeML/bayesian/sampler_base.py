@@ -1,7 +1,7 @@
 import numpy as np
 import abc
 import collections
-import math
+import pandas as pd
 from future.utils import with_metaclass
 
 
@@ -26,11 +26,200 @@ except:
 
 
 from threeML.analysis_results import BayesianResults
+from threeML.bayesian.convergence import ConvergenceMonitor, MIN_CHAIN_LENGTH
 from threeML.utils.statistics.stats_tools import aic, bic, dic
 from threeML.exceptions.custom_exceptions import LikelihoodIsInfinite, custom_warnings
 from astromodels.functions.function import ModelAssertionViolation
 
 
+class _LogPriorEvaluator(object):
+    def __init__(self, free_parameters):
+        """
+        Evaluates the sum of the log. priors of the free parameters for a vector (or a batch of vectors)
+        of trial values. It is built once before sampling, freezing the bounds of the parameters and the
+        parameters of the priors.
+
+        The most common priors (uniform, log-uniform and Gaussian) are compiled into their closed-form
+        logarithm, so that their sum is computed with a few array operations. Any other prior is
+        evaluated through its evaluate method, bypassing the generic (and slow) call machinery of
+        astromodels functions.
+
+        :param free_parameters: the dictionary of free parameters
+        """
+
+        n_parameters = len(free_parameters)
+
+        # Region where the log. prior is finite (intersection of the boundaries of the
+        # parameter and of the support of the prior)
+        self._minima = np.full(n_parameters, -np.inf)
+        self._maxima = np.full(n_parameters, np.inf)
+
+        # Constant part of the log. prior
+        self._constant = 0.0
+
+        # Indexes of the parameters with a log-uniform prior (log. prior = log(K) - log(x))
+        log_uniform = []
+
+        # Indexes, centers and inverse variances of the parameters with a Gaussian prior
+        gaussian = []
+        gaussian_mu = []
+        gaussian_inverse_variance = []
+
+        # Everything else
+        self._generic = []
+
+        for i, parameter in enumerate(free_parameters.values()):
+
+            if parameter.min_value is not None:
+
+                self._minima[i] = parameter.min_value
+
+            if parameter.max_value is not None:
+
+                self._maxima[i] = parameter.max_value
+
+            prior = parameter.prior
+
+            prior_parameters = collections.OrderedDict(
+                (name, x.value) for name, x in prior.parameters.items()
+            )
+
+            prior_type = type(prior).__name__
+
+            if prior_type == "Uniform_prior":
+
+                self._restrict(
+                    i, prior_parameters["lower_bound"], prior_parameters["upper_bound"]
+                )
+
+                self._constant += np.log(prior_parameters["value"])
+
+            elif prior_type == "Log_uniform_prior":
+
+                # The boundaries of the log-uniform prior are excluded
+
+                self._restrict(
+                    i,
+                    np.nextafter(prior_parameters["lower_bound"], np.inf),
+                    np.nextafter(prior_parameters["upper_bound"], -np.inf),
+                )
+
+                self._constant += np.log(prior_parameters["K"])
+
+                log_uniform.append(i)
+
+            elif prior_type == "Gaussian":
+
+                sigma = prior_parameters["sigma"]
+
+                self._constant += np.log(
+                    prior_parameters["F"] / (sigma * np.sqrt(2 * np.pi))
+                )
+
+                gaussian.append(i)
+                gaussian_mu.append(prior_parameters["mu"])
+                gaussian_inverse_variance.append(1.0 / sigma ** 2)
+
+            else:
+
+                self._generic.append(
+                    (i, prior.evaluate, list(prior_parameters.values()))
+                )
+
+        self._log_uniform = np.array(log_uniform, dtype=int)
+        self._gaussian = np.array(gaussian, dtype=int)
+        self._gaussian_mu = np.array(gaussian_mu)
+        self._gaussian_inverse_variance = np.array(gaussian_inverse_variance)
+
+    def _restrict(self, i, lower_bound, upper_bound):
+
+        self._minima[i] = max(self._minima[i], lower_bound)
+        self._maxima[i] = min(self._maxima[i], upper_bound)
+
+    def __call__(self, trial_values):
+        """
+        :param trial_values: one value for each free parameter
+        :return: the sum of the log. priors, or -inf if the point is outside the allowed region
+        """
+
+        trial_values = np.asarray(trial_values, dtype=float)
+
+        # Points outside of the allowed region are rejected before evaluating anything
+
+        if np.any((trial_values < self._minima) | (trial_values > self._maxima)):
+
+            return -np.inf
+
+        log_prior = self._constant
+
+        if self._log_uniform.size > 0:
+
+            log_prior -= np.sum(np.log(trial_values[self._log_uniform]))
+
+        if self._gaussian.size > 0:
+
+            log_prior -= 0.5 * np.sum(
+                (trial_values[self._gaussian] - self._gaussian_mu) ** 2
+                * self._gaussian_inverse_variance
+            )
+
+        for i, evaluate, prior_parameters in self._generic:
+
+            prior_value = evaluate(trial_values[i : i + 1], *prior_parameters)[0]
+
+            if prior_value <= 0:
+
+                # Outside allowed region of parameter space
+
+                return -np.inf
+
+            log_prior += np.log(prior_value)
+
+        return log_prior
+
+    def evaluate_batch(self, trial_values):
+        """
+        :param trial_values: a (n_points, n_free_parameters) array
+        :return: the sum of the log. priors for each point (-inf for points outside of the allowed region)
+        """
+
+        trial_values = np.atleast_2d(np.asarray(trial_values, dtype=float))
+
+        allowed = np.all(
+            (trial_values >= self._minima) & (trial_values <= self._maxima), axis=1
+        )
+
+        log_prior = np.full(trial_values.shape[0], -np.inf)
+
+        good_values = trial_values[allowed]
+
+        this_log_prior = np.full(good_values.shape[0], self._constant)
+
+        if self._log_uniform.size > 0:
+
+            this_log_prior -= np.sum(np.log(good_values[:, self._log_uniform]), axis=1)
+
+        if self._gaussian.size > 0:
+
+            this_log_prior -= 0.5 * np.sum(
+                (good_values[:, self._gaussian] - self._gaussian_mu) ** 2
+                * self._gaussian_inverse_variance,
+                axis=1,
+            )
+
+        for i, evaluate, prior_parameters in self._generic:
+
+            prior_values = evaluate(good_values[:, i], *prior_parameters)
+
+            with np.errstate(divide="ignore"):
+
+                this_log_prior += np.where(prior_values > 0, np.log(prior_values), -np.inf)
+
+        log_prior[allowed] = this_log_prior
+
+        return log_prior
+
+
 class SamplerBase(with_metaclass(abc.ABCMeta, object)):
     def __init__(self, likelihood_model, data_list, **kwargs):
         """
@@ -231,12 +420,15 @@ class SamplerBase(with_metaclass(abc.ABCMeta, object)):
 
     def _update_free_parameters(self):
         """
-        Update the dictionary of the current free parameters
+        Update the dictionary of the current free parameters, and
+        build the evaluator of the log. prior for them
         :return:
         """
 
         self._free_parameters = self._likelihood_model.free_parameters
 
+        self._log_prior_evaluator = _LogPriorEvaluator(self._free_parameters)
+
     def get_posterior(self, trial_values):
         """Compute the posterior for the normal sampler"""
 
@@ -250,24 +442,18 @@ class SamplerBase(with_metaclass(abc.ABCMeta, object)):
             "do not match the number of trial values."
         )
 
-        log_prior = 0
-
-        # with use_
+        log_prior = self._log_prior_evaluator(trial_values)
 
-        for i, (parameter_name, parameter) in enumerate(self._free_parameters.items()):
+        if log_prior == -np.inf:
 
-            prior_value = parameter.prior(trial_values[i])
+            # Outside allowed region of parameter space, no need
+            # to evaluate the model
 
-            if prior_value == 0:
-                # Outside allowed region of parameter space
-
-                return -np.inf
-
-            else:
+            return -np.inf
 
-                parameter.value = trial_values[i]
+        for parameter, trial_value in zip(self._free_parameters.values(), trial_values):
 
-                log_prior += math.log10(prior_value)
+            parameter.value = trial_value
 
         log_like = self._log_like(trial_values)
 
@@ -278,26 +464,12 @@ class SamplerBase(with_metaclass(abc.ABCMeta, object)):
     def _log_prior(self, trial_values):
         """Compute the sum of log-priors, used in the parallel tempering sampling"""
 
-        # Compute the sum of the log-priors
-
-        log_prior = 0
-
-        for i, (parameter_name, parameter) in enumerate(self._free_parameters.items()):
-
-            prior_value = parameter.prior(trial_values[i])
+        return self._log_prior_evaluator(trial_values)
 
-            if prior_value == 0:
-                # Outside allowed region of parameter space
+    def _log_priors(self, samples):
+        """Compute the sum of log-priors for each of a set of samples (one per row)"""
 
-                return -np.inf
-
-            else:
-
-                parameter.value = trial_values[i]
-
-                log_prior += math.log10(prior_value)
-
-        return log_prior
+        return self._log_prior_evaluator.evaluate_batch(samples)
 
     def _log_like(self, trial_values):
         """Compute the log-likelihood"""
@@ -346,6 +518,120 @@ class MCMCSampler(SamplerBase):
 
         super(MCMCSampler, self).__init__(likelihood_model, data_list, **kwargs)
 
+        self._convergence_monitor = None
+
+    @property
+    def convergence_diagnostics(self):
+        """
+        Diagnostics of the last adaptive run: integrated autocorrelation time, effective sample size
+        (after the burn-in) and Gelman-Rubin statistic of each parameter
+
+        :return: a pandas DataFrame, or None if the sampler was not run in adaptive mode
+        """
+
+        if self._convergence_monitor is None:
+
+            return None
+
+        return pd.DataFrame(
+            collections.OrderedDict(
+                [
+                    ("tau", self._convergence_monitor.tau),
+                    ("ess", self._convergence_monitor.ess),
+                    ("r_hat", self._convergence_monitor.r_hat),
+                ]
+            ),
+            index=list(self._free_parameters.keys()),
+        )
+
+    def _setup_adaptive(self, adaptive, target_ess, max_r_hat, check_every):
+
+        self._adaptive = bool(adaptive)
+
+        self._target_ess = target_ess
+
+        self._max_r_hat = max_r_hat
+
+        self._check_every = int(check_every)
+
+        assert self._check_every > 0, "check_every must be positive"
+
+        if self._adaptive and self._n_burn_in is not None:
+
+            assert self._n_burn_in + MIN_CHAIN_LENGTH <= self._n_iterations, (
+                "In adaptive mode n_iterations includes the burn-in, "
+                "and must exceed it by at least %i" % MIN_CHAIN_LENGTH
+            )
+
+    def _get_convergence_monitor(self):
+        """
+        :return: a new ConvergenceMonitor if the sampler is in adaptive mode, None otherwise
+        """
+
+        if not self._adaptive:
+
+            self._convergence_monitor = None
+
+        else:
+
+            self._convergence_monitor = ConvergenceMonitor(
+                target_ess=self._target_ess,
+                max_r_hat=self._max_r_hat,
+                n_burn_in=self._n_burn_in,
+            )
+
+        return self._convergence_monitor
+
+    def _finalize_burn_in(self, checkpoint):
+        """
+        :param checkpoint: the MCMCCheckpoint holding the chain
+        :return: the burn-in to discard from the chain stored in the checkpoint
+        """
+
+        monitor = self._convergence_monitor
+
+        if monitor is None:
+
+            return self._n_burn_in
+
+        chain = checkpoint.read_chain()[0]
+
+        if monitor.n_steps < chain.shape[0]:
+
+            # e.g., when resuming a run which had already reached the maximum number of iterations
+
+            monitor.check(chain)
+
+        self._report_convergence()
+
+        return monitor.n_burn_in
+
+    def _report_convergence(self):
+
+        monitor = self._convergence_monitor
+
+        if monitor.ess is None:
+
+            custom_warnings.warn(
+                "The chain is too short (%i iterations) to assess its convergence. "
+                "Consider increasing n_iterations." % monitor.n_steps
+            )
+
+        elif monitor.converged:
+
+            print(
+                "\nConverged after %i iterations (burn-in: %i iterations)\n"
+                % (monitor.n_steps, monitor.n_burn_in)
+            )
+
+        else:
+
+            custom_warnings.warn(
+                "The chain did not converge within %i iterations (min. ESS: %.1f, max. R-hat: %.3f). "
+                "Consider increasing n_iterations."
+                % (monitor.n_steps, np.min(monitor.ess), np.max(monitor.r_hat))
+            )
+
     def _get_starting_points(self, n_walkers, variance=0.1):
 
         # Generate the starting points for the walkers by getting random
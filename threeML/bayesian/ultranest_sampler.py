@@ -5,6 +5,7 @@ import numpy as np
 from astromodels import ModelAssertionViolation, use_astromodels_memoization
 from threeML.bayesian.sampler_base import UnitCubeSampler
 from threeML.config.config import threeML_config
+from threeML.parallel.local_pool import LocalPool
 
 
 try:
@@ -53,6 +54,8 @@ class UltraNestSampler(UnitCubeSampler):
         dlogz=0.5,
         chain_name=None,
         wrapped_params=None,
+        n_processes=None,
+        resume=False,
         **kwargs
     ):
 
@@ -63,6 +66,17 @@ class UltraNestSampler(UnitCubeSampler):
 
         self._wrapped_params = wrapped_params
 
+        self._n_processes = n_processes
+
+        # UltraNest keeps its own checkpoint in the log directory,
+        # which is given by the chain name
+
+        assert (
+            not resume or chain_name is not None
+        ), "You need to provide a chain_name to resume a run"
+
+        self._resume = "resume" if resume else "subfolder"
+
         for k, v in kwargs.items():
 
             self._kwargs[k] = v
@@ -135,6 +149,39 @@ class UltraNestSampler(UnitCubeSampler):
                 "If you want to run ultranest in parallell you need to use an ad-hoc method"
             )
 
+        elif self._n_processes is not None:
+
+            with use_astromodels_memoization(False):
+
+                # the workers are forked here, so that they inherit
+                # the likelihood without pickling it
+
+                with LocalPool(self._n_processes, loglike=loglike) as pool:
+
+                    # UltraNest proposes points in batches when the
+                    # likelihood is vectorized, so we spread each batch
+                    # over the pool
+
+                    def vectorized_loglike(points):
+
+                        return np.array(pool.map(pool.loglike, points))
+
+                    def vectorized_prior(cubes):
+
+                        return np.array([ultranest_prior(cube) for cube in cubes])
+
+                    sampler = ultranest.ReactiveNestedSampler(
+                        param_names,
+                        vectorized_loglike,
+                        transform=vectorized_prior,
+                        log_dir=chain_name,
+                        resume=self._resume,
+                        vectorized=True,
+                        wrapped_params=self._wrapped_params,
+                    )
+
+                    sampler.run(show_status=loud, **self._kwargs)
+
         else:
 
             sampler = ultranest.ReactiveNestedSampler(
@@ -142,6 +189,7 @@ class UltraNestSampler(UnitCubeSampler):
                 loglike,
                 transform=ultranest_prior,
                 log_dir=chain_name,
+                resume=self._resume,
                 vectorized=False,
                 wrapped_params=self._wrapped_params,
             )
@@ -214,8 +262,8 @@ class UltraNestSampler(UnitCubeSampler):
 
             # now get the log probability
 
-            self._log_probability_values = self._log_like_values + np.array(
-                [self._log_prior(samples) for samples in self._raw_samples]
+            self._log_probability_values = self._log_like_values + self._log_priors(
+                self._raw_samples
             )
 
             self._build_samples_dictionary()
@@ -1,6 +1,7 @@
 import numpy as np
 
 
+from threeML.bayesian.checkpoint import MCMCCheckpoint
 from threeML.bayesian.sampler_base import MCMCSampler
 from threeML.config.config import threeML_config
 
@@ -50,13 +51,55 @@ class ZeusSampler(MCMCSampler):
 
         super(ZeusSampler, self).__init__(likelihood_model, data_list, **kwargs)
 
-    def setup(self, n_iterations, n_burn_in=None, n_walkers=20, seed=None):
+    def setup(
+        self,
+        n_iterations,
+        n_burn_in=None,
+        n_walkers=20,
+        seed=None,
+        thin=1,
+        checkpoint_dir=None,
+        checkpoint_every=100,
+        resume=False,
+        adaptive=False,
+        target_ess=1000,
+        max_r_hat=1.01,
+        check_every=100,
+    ):
+        """
+        Setup the zeus sampler
+
+        :param n_iterations: number of iterations (after the burn-in)
+        :param n_burn_in: number of burn-in iterations (default: n_iterations / 4)
+        :param n_walkers: number of walkers
+        :param seed: seed for the random number generator
+        :param thin: keep only one iteration every thin iterations
+        :param checkpoint_dir: if provided, the chain is streamed to this directory instead of being kept
+        in memory, and the state of the sampler is saved every checkpoint_every iterations. The results
+        memory-map the chain (not available with MPI)
+        :param checkpoint_every: number of iterations between checkpoints
+        :param resume: if True and checkpoint_dir contains a checkpoint, continue from there
+        :param adaptive: (not available with MPI) if True, n_iterations is the maximum number of iterations (including the burn-in)
+        and the sampling stops as soon as the chain has converged, i.e., when the integrated autocorrelation
+        time is reliably estimated, the effective sample size of each parameter reaches target_ess and the
+        Gelman-Rubin statistic is below max_r_hat. Unless n_burn_in is provided, the burn-in is determined
+        from the autocorrelation time
+        :param target_ess: the effective sample size to reach for each parameter (adaptive mode)
+        :param max_r_hat: the maximum Gelman-Rubin statistic (adaptive mode)
+        :param check_every: number of iterations between convergence checks (adaptive mode). When
+        checkpointing, the convergence is checked at the first checkpoint after every check_every iterations
+        :returns:
+        :rtype:
+
+        """
 
         self._n_iterations = int(n_iterations)
 
         if n_burn_in is None:
 
-            self._n_burn_in = int(np.floor(n_iterations / 4.0))
+            # in adaptive mode, the burn-in is determined during the sampling
+
+            self._n_burn_in = None if adaptive else int(np.floor(n_iterations / 4.0))
 
         else:
 
@@ -66,6 +109,20 @@ class ZeusSampler(MCMCSampler):
 
         self._seed = seed
 
+        self._thin = int(thin)
+
+        self._checkpoint_dir = checkpoint_dir
+
+        self._checkpoint_every = int(checkpoint_every)
+
+        self._resume = resume
+
+        assert not (
+            adaptive and using_mpi
+        ), "The adaptive mode is not available when running with MPI"
+
+        self._setup_adaptive(adaptive, target_ess, max_r_hat, check_every)
+
         self._is_setup = True
 
     def sample(self, quiet=False):
@@ -131,18 +188,48 @@ class ZeusSampler(MCMCSampler):
             #     sampler._random.seed(self._seed)
 
             # Sample the burn-in
-            if not using_mpi:
+            if using_mpi:
+
+                self._raw_samples = sampler.flatten(
+                    discard=self._n_burn_in, thin=self._thin
+                )
+                self._log_probability_values = sampler.get_log_prob(
+                    flat=True, discard=self._n_burn_in, thin=self._thin
+                )
+
+            elif self._checkpoint_dir is not None:
+
+                (
+                    self._raw_samples,
+                    self._log_probability_values,
+                ) = self._sample_with_checkpoints(sampler, p0, n_dim, loud)
+
+            elif self._adaptive:
+
+                (
+                    self._raw_samples,
+                    self._log_probability_values,
+                ) = self._sample_adaptively(sampler, p0, loud)
+
+            else:
+
+                self._convergence_monitor = None
 
                 _ = sampler.run(p0, self._n_iterations + self._n_burn_in, progress=loud)
 
+                self._raw_samples = sampler.flatten(
+                    discard=self._n_burn_in, thin=self._thin
+                )
+                self._log_probability_values = sampler.get_log_prob(
+                    flat=True, discard=self._n_burn_in, thin=self._thin
+                )
+
         self._sampler = sampler
-        self._raw_samples = sampler.flatten(discard=self._n_burn_in)
 
         # Compute the corresponding values of the likelihood
 
         # First we need the prior
-        log_prior = np.array([self._log_prior(x) for x in self._raw_samples])
-        self._log_probability_values = sampler.get_log_prob(flat=True, discard=self._n_burn_in)
+        log_prior = self._log_priors(self._raw_samples)
 
 
 
@@ -168,3 +255,157 @@ class ZeusSampler(MCMCSampler):
             self._results.display()
 
         return self.samples
+
+    def _sample_with_checkpoints(self, sampler, p0, n_dim, loud):
+        """
+        Run burn-in and sampling in blocks of checkpoint_every iterations, saving the
+        chain and the state of the sampler after each block
+
+        :returns: the flattened samples and log. probabilities after the burn-in
+        """
+
+        checkpoint = MCMCCheckpoint(self._checkpoint_dir)
+
+        monitor = self._get_convergence_monitor()
+
+        if monitor is not None:
+
+            n_total = self._n_iterations
+
+        else:
+
+            n_total = self._n_burn_in + self._n_iterations
+
+        if self._resume and checkpoint.has_state:
+
+            saved = checkpoint.load_state()
+
+            assert saved["coords"].shape == (self._n_walkers, n_dim), (
+                "The checkpoint in %s is not compatible with the current setup"
+                % checkpoint.directory
+            )
+
+            start = saved["coords"]
+            log_prob0 = saved["log_prob"]
+
+            # zeus uses the global numpy generator and tunes its scale factor
+            # during the run, so both need to be restored
+
+            np.random.set_state(saved["random_state"])
+
+            sampler.mu = saved["mu"]
+            sampler.tune = saved["tune"]
+
+            n_done = saved["n_steps"]
+
+            print("Resuming from iteration %i of %i" % (n_done, n_total))
+
+        else:
+
+            checkpoint.clear()
+
+            start = np.array(p0)
+            log_prob0 = None
+
+            n_done = 0
+
+        converged = False
+
+        n_last_check = n_done
+
+        if monitor is not None and n_done > 0:
+
+            # Restore the convergence history of the resumed run
+
+            chain = checkpoint.read_chain()[0]
+
+            if n_done > self._check_every:
+
+                monitor.check(chain[: n_done - self._check_every])
+
+            converged = monitor.check(chain)
+
+        while not converged and n_done < n_total:
+
+            n_steps = min(self._checkpoint_every, n_total - n_done)
+
+            # the previous samples are on disk already, no need to keep them in memory
+
+            sampler.reset()
+
+            sampler.run_mcmc(start, n_steps, progress=loud, log_prob0=log_prob0)
+
+            n_done += n_steps
+
+            chain = sampler.get_chain()
+            log_prob = sampler.get_log_prob()
+
+            start = chain[-1]
+            log_prob0 = log_prob[-1]
+
+            checkpoint.save(
+                chain,
+                log_prob,
+                coords=start,
+                log_prob=log_prob0,
+                random_state=np.random.get_state(),
+                mu=sampler.mu,
+                tune=sampler.tune,
+                n_steps=n_done,
+            )
+
+            if monitor is not None and (
+                n_done - n_last_check >= self._check_every or n_done == n_total
+            ):
+
+                converged = monitor.check(checkpoint.read_chain()[0])
+
+                n_last_check = n_done
+
+        return checkpoint.get_samples(self._finalize_burn_in(checkpoint), self._thin)
+
+    def _sample_adaptively(self, sampler, p0, loud):
+        """
+        Run the sampler in blocks of check_every iterations until the chain has converged
+        or the maximum number of iterations is reached
+
+        :returns: the flattened samples and log. probabilities after the burn-in
+        """
+
+        monitor = self._get_convergence_monitor()
+
+        start = np.array(p0)
+        log_prob0 = None
+
+        n_done = 0
+
+        while n_done < self._n_iterations:
+
+            n_steps = min(self._check_every, self._n_iterations - n_done)
+
+            # zeus appends the new steps to the chain stored in the sampler
+
+            sampler.run_mcmc(start, n_steps, progress=loud, log_prob0=log_prob0)
+
+            n_done += n_steps
+
+            chain = sampler.get_chain()
+
+            start = chain[-1]
+            log_prob0 = sampler.get_log_prob()[-1]
+
+            if monitor.check(chain):
+
+                break
+
+        self._report_convergence()
+
+        samples = sampler.get_chain(
+            flat=True, discard=monitor.n_burn_in, thin=self._thin
+        )
+
+        log_prob = sampler.get_log_prob(
+            flat=True, discard=monitor.n_burn_in, thin=self._thin
+        )
+
+        return samples, log_prob
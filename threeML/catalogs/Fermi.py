@@ -2,9 +2,11 @@ from __future__ import division
 from builtins import str
 from builtins import map
 from past.utils import old_div
+import functools
 import numpy
 import re
-from .VirtualObservatoryCatalog import VirtualObservatoryCatalog
+from scipy.spatial import cKDTree
+from .VirtualObservatoryCatalog import VirtualObservatoryCatalog, _radec_to_unit_vectors
 
 from astromodels import *
 from astromodels.utils.angular_distance import angular_distance
@@ -47,15 +49,17 @@ def _gbm_and_lle_valid_source_check(source):
 
 
 class FermiGBMBurstCatalog(VirtualObservatoryCatalog):
-    def __init__(self, update=False):
+    def __init__(self, update=False, cache_time_days=1.0):
         """
         The Fermi-LAT GBM GRB catalog. Search for GRBs  by trigger
         number, location, spectral parameters, T90, and date range.
 
         :param update: force update the XML VO table
+        :param cache_time_days: number of days after which the local copy of the table is refreshed
         """
 
         self._update = update
+        self._cache_time_days = cache_time_days
 
         super(FermiGBMBurstCatalog, self).__init__(
             "fermigbrst",
@@ -87,7 +91,7 @@ class FermiGBMBurstCatalog(VirtualObservatoryCatalog):
     def _get_vo_table_from_source(self):
 
         self._vo_dataframe = get_heasarc_table_as_pandas(
-            "fermigbrst", update=self._update, cache_time_days=1.0
+            "fermigbrst", update=self._update, cache_time_days=self._cache_time_days
         )
 
     def apply_format(self, table):
@@ -518,9 +522,38 @@ def _sanitize_3fgl_name(fgl_name):
     return swap
 
 
+_flux_density_unit = 1.0 / (u.cm ** 2 * u.s * u.MeV)
+
+
+@functools.lru_cache(maxsize=None)
+def _conversion_factor(from_unit, to_unit):
+
+    return from_unit.to(to_unit)
+
+
+def _set_value_in_units(parameter, value, unit):
+    """
+    Set the value of a parameter from a value expressed in the given unit. This is equivalent
+    to assigning a Quantity, but the conversion factor is computed only once for each pair of
+    units, which makes the construction of models with thousands of sources much faster.
+
+    :param parameter: the parameter
+    :param value: the value (a float) in the given unit
+    :param unit: the unit of the value
+    :return: none
+    """
+
+    parameter.value = value * _conversion_factor(unit, parameter.unit)
+
+
 def _get_point_source_from_3fgl(fgl_name, catalog_entry, fix=False):
     """
     Translate a spectrum from the 3FGL into an astromodels spectrum
+
+    :param fgl_name: the name of the source
+    :param catalog_entry: the row of the catalog (a pandas Series or a dictionary)
+    :param fix: whether the parameters of the spectrum should be fixed
+    :return: the point source
     """
 
     name = _sanitize_3fgl_name(fgl_name)
@@ -537,15 +570,17 @@ def _get_point_source_from_3fgl(fgl_name, catalog_entry, fix=False):
 
         this_spectrum.index = float(catalog_entry["pl_index"]) * -1
         this_spectrum.index.fix = fix
-        this_spectrum.K = float(catalog_entry["pl_flux_density"]) / (
-            u.cm ** 2 * u.s * u.MeV
+        _set_value_in_units(
+            this_spectrum.K, float(catalog_entry["pl_flux_density"]), _flux_density_unit
         )
         this_spectrum.K.fix = fix
         this_spectrum.K.bounds = (
             this_spectrum.K.value / 1000.0,
             this_spectrum.K.value * 1000,
         )
-        this_spectrum.piv = float(catalog_entry["pivot_energy"]) * u.MeV
+        _set_value_in_units(
+            this_spectrum.piv, float(catalog_entry["pivot_energy"]), u.MeV
+        )
 
     elif spectrum_type == "LogParabola":
 
@@ -557,9 +592,11 @@ def _get_point_source_from_3fgl(fgl_name, catalog_entry, fix=False):
         this_spectrum.alpha.fix = fix
         this_spectrum.beta = float(catalog_entry["lp_beta"])
         this_spectrum.beta.fix = fix
-        this_spectrum.piv = float(catalog_entry["pivot_energy"]) * u.MeV
-        this_spectrum.K = float(catalog_entry["lp_flux_density"]) / (
-            u.cm ** 2 * u.s * u.MeV
+        _set_value_in_units(
+            this_spectrum.piv, float(catalog_entry["pivot_energy"]), u.MeV
+        )
+        _set_value_in_units(
+            this_spectrum.K, float(catalog_entry["lp_flux_density"]), _flux_density_unit
         )
         this_spectrum.K.fix = fix
         this_spectrum.K.bounds = (
@@ -575,16 +612,20 @@ def _get_point_source_from_3fgl(fgl_name, catalog_entry, fix=False):
 
         this_spectrum.index = float(catalog_entry["plec_index"]) * -1
         this_spectrum.index.fix = fix
-        this_spectrum.piv = float(catalog_entry["pivot_energy"]) * u.MeV
-        this_spectrum.K = float(catalog_entry["plec_flux_density"]) / (
-            u.cm ** 2 * u.s * u.MeV
+        _set_value_in_units(
+            this_spectrum.piv, float(catalog_entry["pivot_energy"]), u.MeV
+        )
+        _set_value_in_units(
+            this_spectrum.K,
+            float(catalog_entry["plec_flux_density"]),
+            _flux_density_unit,
         )
         this_spectrum.K.fix = fix
         this_spectrum.K.bounds = (
             this_spectrum.K.value / 1000.0,
             this_spectrum.K.value * 1000,
         )
-        this_spectrum.xc = float(catalog_entry["cutoff"]) * u.MeV
+        _set_value_in_units(this_spectrum.xc, float(catalog_entry["cutoff"]), u.MeV)
         this_spectrum.xc.fix = fix
 
     elif spectrum_type in ["PLSuperExpCutoff", "PLSuperExpCutoff2"]:
@@ -602,16 +643,18 @@ def _get_point_source_from_3fgl(fgl_name, catalog_entry, fix=False):
         this_spectrum.index.fix = fix
         this_spectrum.gamma = b
         this_spectrum.gamma.fix = fix
-        this_spectrum.piv = E0 * u.MeV
-        this_spectrum.K = (
-            conv * float(catalog_entry["plec_flux_density"]) / (u.cm ** 2 * u.s * u.MeV)
+        _set_value_in_units(this_spectrum.piv, E0, u.MeV)
+        _set_value_in_units(
+            this_spectrum.K,
+            conv * float(catalog_entry["plec_flux_density"]),
+            _flux_density_unit,
         )
         this_spectrum.K.fix = fix
         this_spectrum.K.bounds = (
             this_spectrum.K.value / 1000.0,
             this_spectrum.K.value * 1000,
         )
-        this_spectrum.xc = a ** (old_div(-1.0, b)) * u.MeV
+        _set_value_in_units(this_spectrum.xc, a ** (old_div(-1.0, b)), u.MeV)
         this_spectrum.xc.fix = fix
 
     else:
@@ -629,6 +672,8 @@ class ModelFrom3FGL(Model):
         self._ra_center = float(ra_center)
         self._dec_center = float(dec_center)
 
+        self._sky_index = None
+
         super(ModelFrom3FGL, self).__init__(*sources)
 
     def free_point_sources_within_radius(self, radius, normalization_only=True):
@@ -651,35 +696,121 @@ class ModelFrom3FGL(Model):
         """
         self._free_or_fix(False, radius, normalization_only)
 
-    def _free_or_fix(self, free, radius, normalization_only):
+    def _add_source(self, source):
 
-        for src_name in self.point_sources:
+        super(ModelFrom3FGL, self)._add_source(source)
 
-            src = self.point_sources[src_name]
+        if source.name in self.point_sources:
+
+            # the sky index is dropped when the source moves
+
+            for parameter in source.position.parameters.values():
+
+                parameter.add_callback(self._invalidate_sky_index)
+
+        self._invalidate_sky_index()
+
+    def _remove_source(self, source_name):
+
+        if source_name in self.point_sources:
+
+            for parameter in self.point_sources[
+                source_name
+            ].position.parameters.values():
+
+                parameter.get_callbacks().remove(self._invalidate_sky_index)
+
+        super(ModelFrom3FGL, self)._remove_source(source_name)
+
+        self._invalidate_sky_index()
+
+    def _invalidate_sky_index(self, *args):
+
+        self._sky_index = None
+
+    def _get_sky_index(self):
+        """
+        Return a KD-tree on the unit vectors of the point sources of the model. The tree is
+        dropped when a source is added, removed or moved, and rebuilt when needed.
+
+        :return: (names, ra, dec, tree)
+        """
+
+        if self._sky_index is None or len(self._sky_index[0]) != len(
+            self.point_sources
+        ):
 
-            this_d = angular_distance(
-                self._ra_center,
-                self._dec_center,
-                src.position.ra.value,
-                src.position.dec.value,
+            names = tuple(self.point_sources.keys())
+
+            ra = numpy.array(
+                [src.position.ra.value for src in self.point_sources.values()]
+            )
+            dec = numpy.array(
+                [src.position.dec.value for src in self.point_sources.values()]
             )
 
-            if this_d <= radius:
+            tree = cKDTree(_radec_to_unit_vectors(ra, dec).reshape(-1, 3))
+
+            self._sky_index = (names, ra, dec, tree)
+
+        return self._sky_index
+
+    def point_sources_within_radius(self, radius):
+        """
+        Returns the names of the point sources within the given radius of the center of the search cone
+
+        :param radius: radius in degree
+        :return: list of names of point sources
+        """
 
-                if normalization_only:
+        names, ra, dec, tree = self._get_sky_index()
 
-                    src.spectrum.main.shape.K.free = free
+        if len(names) == 0:
 
-                else:
+            return []
 
-                    for par in src.spectrum.main.shape.parameters:
-                        src.spectrum.main.shape.parameters[par].free = free
+        center = _radec_to_unit_vectors(self._ra_center, self._dec_center)
+
+        # the KD-tree works with the chord distance, the candidates are then checked with the exact
+        # angular distance (with a small tolerance so that no source is lost to rounding)
+
+        chord = 2.0 * numpy.sin(numpy.deg2rad(min(radius, 180.0)) / 2.0)
+
+        idx = numpy.array(
+            sorted(tree.query_ball_point(center, chord * (1 + 1e-12))), dtype=int
+        )
+
+        this_d = angular_distance(self._ra_center, self._dec_center, ra[idx], dec[idx])
+
+        return [names[i] for i in idx[this_d <= radius]]
+
+    def _free_or_fix(self, free, radius, normalization_only):
+
+        for src_name in self.point_sources_within_radius(radius):
+
+            src = self.point_sources[src_name]
+
+            if normalization_only:
+
+                src.spectrum.main.shape.K.free = free
+
+            else:
+
+                for par in src.spectrum.main.shape.parameters:
+                    src.spectrum.main.shape.parameters[par].free = free
 
 
 class FermiLATSourceCatalog(VirtualObservatoryCatalog):
-    def __init__(self, update=False):
+    def __init__(self, update=False, cache_time_days=10.0):
+        """
+        The Fermi-LAT source catalog. Search for sources by name, location and association.
+
+        :param update: force update the XML VO table
+        :param cache_time_days: number of days after which the local copy of the table is refreshed
+        """
 
         self._update = update
+        self._cache_time_days = cache_time_days
 
         super(FermiLATSourceCatalog, self).__init__(
             "fermilpsc",
@@ -690,7 +821,7 @@ class FermiLATSourceCatalog(VirtualObservatoryCatalog):
     def _get_vo_table_from_source(self):
 
         self._vo_dataframe = get_heasarc_table_as_pandas(
-            "fermilpsc", update=self._update, cache_time_days=10.0
+            "fermilpsc", update=self._update, cache_time_days=self._cache_time_days
         )
 
     def _source_is_valid(self, source):
@@ -762,10 +893,15 @@ class FermiLATSourceCatalog(VirtualObservatoryCatalog):
             self._last_query_results is not None
         ), "You have to run a query before getting a model"
 
-        # Loop over the table and build a source for each entry
+        # Loop over the table and build a source for each entry. The rows are extracted all at once
+        # as dictionaries, which is much faster than transposing the table
         sources = []
-        source_names = []
-        for name, row in self._last_query_results.T.items():
+        source_names = set()
+
+        names = self._last_query_results.index
+        rows = self._last_query_results.to_dict("records")
+
+        for name, row in zip(names, rows):
             if name[-1] == "e":
                 # Extended source
                 custom_warnings.warn(
@@ -805,7 +941,7 @@ class FermiLATSourceCatalog(VirtualObservatoryCatalog):
                 pass
             # By default all sources are fixed. The user will free the one he/she will need
 
-            source_names.append(this_name)
+            source_names.add(this_name)
 
             this_source = _get_point_source_from_3fgl(this_name, row, fix=True)
 
@@ -815,15 +951,17 @@ class FermiLATSourceCatalog(VirtualObservatoryCatalog):
 
 
 class FermiLLEBurstCatalog(VirtualObservatoryCatalog):
-    def __init__(self, update=False):
+    def __init__(self, update=False, cache_time_days=5.0):
         """
         The Fermi-LAT LAT Low-Energy (LLE) trigger catalog. Search for GRBs and solar flares by trigger
         number, location, trigger type and date range.
 
         :param update: force update the XML VO table
+        :param cache_time_days: number of days after which the local copy of the table is refreshed
         """
 
         self._update = update
+        self._cache_time_days = cache_time_days
 
         super(FermiLLEBurstCatalog, self).__init__(
             "fermille",
@@ -842,7 +980,7 @@ class FermiLLEBurstCatalog(VirtualObservatoryCatalog):
     def _get_vo_table_from_source(self):
 
         self._vo_dataframe = get_heasarc_table_as_pandas(
-            "fermille", update=self._update, cache_time_days=5.0
+            "fermille", update=self._update, cache_time_days=self._cache_time_days
         )
 
     def _source_is_valid(self, source):
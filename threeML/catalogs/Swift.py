@@ -25,15 +25,17 @@ _trigger_name_match = re.compile("^GRB \d{6}[A-Z]$")
 
 
 class SwiftGRBCatalog(VirtualObservatoryCatalog):
-    def __init__(self, update=False):
+    def __init__(self, update=False, cache_time_days=1.0):
         """
         The Swift GRB catalog. Search for GRBs  by trigger
         number, location,  T90, and date range.
 
         :param update: force update the XML VO table
+        :param cache_time_days: number of days after which the local copy of the table is refreshed
         """
 
         self._update = update
+        self._cache_time_days = cache_time_days
 
         super(SwiftGRBCatalog, self).__init__(
             "swiftgrb",
@@ -68,7 +70,7 @@ class SwiftGRBCatalog(VirtualObservatoryCatalog):
     def _get_vo_table_from_source(self):
 
         self._vo_dataframe = get_heasarc_table_as_pandas(
-            "swiftgrb", update=self._update, cache_time_days=1.0
+            "swiftgrb", update=self._update, cache_time_days=self._cache_time_days
         )
 
     def _source_is_valid(self, source):
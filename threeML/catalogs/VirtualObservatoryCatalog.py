@@ -1,18 +1,33 @@
 from builtins import object
 from astromodels import *
 import astropy
+import numpy as np
 
 # from astropy.vo.client.vos_catalog import VOSCatalog
 from astroquery.vo_conesearch.vos_catalog import VOSCatalog
-from astroquery.vo_conesearch import conesearch
-from astroquery.vo_conesearch.exceptions import VOSError
-
 
 from astropy.coordinates.name_resolve import get_icrs_coordinates
 
 import astropy.table as astro_table
 
-from threeML.io.network import internet_connection_is_active
+from scipy.spatial import cKDTree
+
+
+def _radec_to_unit_vectors(ra, dec):
+    """
+    Convert equatorial coordinates to unit vectors on the sphere
+
+    :param ra: R.A. in decimal degrees (scalar or array)
+    :param dec: Dec. in decimal degrees (scalar or array)
+    :return: array of unit vectors with shape (..., 3)
+    """
+
+    ra = np.deg2rad(ra)
+    dec = np.deg2rad(dec)
+
+    cos_dec = np.cos(dec)
+
+    return np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], axis=-1)
 
 
 class ConeSearchFailed(RuntimeError):
@@ -28,6 +43,10 @@ class VirtualObservatoryCatalog(object):
 
         self._last_query_results = None
 
+        # the sky index for the cone searches is built the first time it is needed
+
+        self._sky_index = None
+
     def search_around_source(self, source_name, radius):
         """
         Search for sources around the named source. The coordinates of the provided source are resolved using the
@@ -45,88 +64,89 @@ class VirtualObservatoryCatalog(object):
 
         return ra, dec, self.cone_search(ra, dec, radius)
 
-    def cone_search(self, ra, dec, radius):
+    def _get_sky_index(self):
         """
-        Searches for sources in a cone of given radius and center
+        Build (once) a KD-tree on the unit vectors of the sources in the catalog table
 
-        :param ra: decimal degrees, R.A. of the center of the cone
-        :param dec: decimal degrees, Dec. of the center of the cone
-        :param radius: radius in degrees
-        :return: a table with the list of sources
+        :return: (tree, row indices of the sources in the tree)
         """
 
-        skycoord = SkyCoord(ra=ra * u.degree, dec=dec * u.degree, frame="icrs")
+        if self._sky_index is None:
 
-        # First check that we have an active internet connection
-        if not internet_connection_is_active():  # pragma: no cover
+            ra = np.asarray(self._vo_dataframe["ra"], dtype=float)
+            dec = np.asarray(self._vo_dataframe["dec"], dtype=float)
 
-            raise ConeSearchFailed(
-                "It looks like you don't have an active internet connection. Cannot continue."
-            )
+            # some entries might not have a position
 
-        with warnings.catch_warnings():
+            rows = np.flatnonzero(np.isfinite(ra) & np.isfinite(dec))
 
-            # Ignore all warnings, which are many from the conesearch module
+            tree = cKDTree(_radec_to_unit_vectors(ra[rows], dec[rows]))
 
-            warnings.simplefilter("ignore")
+            self._sky_index = (tree, rows)
 
-            try:
+        return self._sky_index
 
-                votable = conesearch.conesearch(
-                    skycoord,
-                    radius,
-                    catalog_db=self.catalog,
-                    verb=3,
-                    verbose=True,
-                    cache=False,
-                )
+    def cone_search(self, ra, dec, radius):
+        """
+        Searches for sources in a cone of given radius and center. The search is performed on the
+        locally cached copy of the catalog (use update=True when building the catalog to refresh
+        it), therefore it does not need an internet connection.
 
-            except VOSError as exc:  # Pragma: no cover
+        :param ra: decimal degrees, R.A. of the center of the cone
+        :param dec: decimal degrees, Dec. of the center of the cone
+        :param radius: radius in degrees
+        :return: a table with the list of sources
+        """
+
+        assert radius >= 0, "The radius must be non-negative"
+
+        tree, rows = self._get_sky_index()
+
+        center = _radec_to_unit_vectors(ra, dec)
 
-                # Download failed
+        # the KD-tree works with the chord distance between the unit vectors
 
-                raise ConeSearchFailed("Cone search failed. Reason: %s" % exc.message)
+        chord = 2.0 * np.sin(np.deg2rad(min(radius, 180.0)) / 2.0)
 
-            else:
+        # a small tolerance so that sources exactly on the border are not lost to rounding
 
-                # Download successful
-                table = votable
-                # Workaround to comply with newer versions of astroquery
-                if isinstance(votable, astropy.io.votable.tree.Table):
-                    table = votable.to_table()
+        idx = np.array(tree.query_ball_point(center, chord * (1 + 1e-12)), dtype=int)
 
-                table.convert_bytestring_to_unicode()
+        # exact angular distance of the candidates (Vincenty formula, stable at all scales)
 
-                pandas_df = (
-                    table.to_pandas().set_index("name").sort_values("Search_Offset")
-                )
+        vectors = tree.data[idx]
 
-                str_df = pandas_df.select_dtypes([np.object])
+        offset = np.rad2deg(
+            np.arctan2(
+                np.linalg.norm(np.cross(vectors, center), axis=-1), vectors.dot(center)
+            )
+        )
+
+        selected = offset <= radius
 
-                str_df = str_df.stack().str.decode("utf-8").unstack()
+        idx = idx[selected]
 
-                for col in str_df:
-                    pandas_df[col] = str_df[col]
+        query_results = self._vo_dataframe.iloc[rows[idx]].copy()
 
-                new_index = [x.decode("utf-8") for x in pandas_df.index]
+        # same units (arcmin) as the HEASARC cone search service
 
-                pandas_df.index = new_index
+        query_results["Search_Offset"] = offset[selected] * 60.0
 
-                self._last_query_results = pandas_df
+        query_results = query_results.sort_values("Search_Offset")
 
-                out = self.apply_format(table)
+        table = astro_table.Table.from_pandas(query_results)
+        name_column = astro_table.Column(name="name", data=query_results.index)
+        table.add_column(name_column, index=0)
 
-                # This is needed to avoid strange errors
-                del votable
-                del table
+        out = self.apply_format(table)
 
-                # Save coordinates of center of cone search
-                self._ra = ra
-                self._dec = dec
+        self._last_query_results = query_results
 
-                # Make a DataFrame with the name of the source as index
+        # Save coordinates of center of cone search
+        self._ra = ra
+        self._dec = dec
 
-                return out
+        return out
 
     @property
     def ra_center(self):
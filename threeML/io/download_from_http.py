@@ -2,12 +2,19 @@ from builtins import object
 import requests
 import re
 import os
+import gzip
+import json
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from threeML.io.progress_bar import progress_bar, ProgressBarBase
 from threeML.io.file_utils import (
     sanitize_filename,
     path_exists_and_is_directory,
     file_existing_and_readable,
+    if_directory_not_existing_then_make,
 )
 
 
@@ -20,6 +27,510 @@ class HTTPError(IOError):
     pass
 
 
+class DownloadFailed(IOError):
+
+    pass
+
+
+def _hash_file(file_name, algorithm="sha256", chunk_size=2 ** 20):
+
+    this_hash = hashlib.new(algorithm)
+
+    with open(file_name, "rb") as f:
+
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+
+            this_hash.update(chunk)
+
+    return this_hash.hexdigest()
+
+
+def _gzip_file(input_file, output_file):
+
+    # write to a temporary file first, so that an interrupted compression does not
+    # leave behind a file which looks complete
+
+    tmp_file = "%s.tmp" % output_file
+
+    with open(input_file, "rb") as f_in:
+
+        with gzip.open(tmp_file, "wb") as f_out:
+
+            shutil.copyfileobj(f_in, f_out)
+
+    os.replace(tmp_file, output_file)
+
+
+class DownloadManager(object):
+    def __init__(
+        self,
+        n_connections=4,
+        cache_directory=None,
+        chunk_size=1024 * 128,
+        max_retries=3,
+        timeout=60.0,
+    ):
+        """
+        Download files over HTTP using a bounded pool of concurrent connections.
+
+        Each file is first downloaded to a .part file, which is completed with an HTTP range request
+        if the download is interrupted (either within this session, with up to max_retries attempts,
+        or in a later one). The version of the remote file (ETag or Last-Modified) is stored next to
+        the .part file and sent with the range requests (If-Range), so that a partial file is never
+        completed with the data of a different version. The size of the downloaded file is checked
+        against the size reported by the server and, if provided, against a checksum.
+
+        If a cache directory is given, the downloaded files are also stored there under their SHA-256
+        digest, together with an index of the URLs they were obtained from. A file requested again
+        (for example, for a different destination directory) is then copied from the cache, as long
+        as the server reports the same size and version (ETag or Last-Modified) for it.
+
+        :param n_connections: maximum number of files to download at the same time
+        :param cache_directory: (default: None) directory for the content-addressed cache
+        :param chunk_size: size of the chunks used to stream the files to disk (bytes)
+        :param max_retries: number of times an interrupted download is resumed before giving up
+        :param timeout: timeout for the connections (seconds)
+        """
+
+        self._n_connections = int(n_connections)
+
+        assert self._n_connections > 0, "The number of connections must be positive"
+
+        self._chunk_size = int(chunk_size)
+        self._max_retries = int(max_retries)
+        self._timeout = timeout
+
+        # each thread gets its own session (and therefore its own keep-alive connection)
+
+        self._local = threading.local()
+
+        self._lock = threading.Lock()
+
+        if cache_directory is not None:
+
+            self._cache_directory = sanitize_filename(cache_directory, abspath=True)
+
+            if not path_exists_and_is_directory(self._cache_directory):
+
+                os.makedirs(self._cache_directory)
+
+            self._cache_index = self._read_cache_index()
+
+        else:
+
+            self._cache_directory = None
+
+            self._cache_index = {}
+
+    @property
+    def _cache_index_file(self):
+
+        return os.path.join(self._cache_directory, "index.json")
+
+    def _read_cache_index(self):
+
+        if file_existing_and_readable(self._cache_index_file):
+
+            with open(self._cache_index_file) as f:
+
+                return json.load(f)
+
+        else:
+
+            return {}
+
+    def _write_cache_index(self):
+
+        # merge with the index on disk, which might have been updated by another process
+
+        index = self._read_cache_index()
+
+        index.update(self._cache_index)
+
+        tmp_file = "%s.%i.tmp" % (self._cache_index_file, os.getpid())
+
+        with open(tmp_file, "w") as f:
+
+            json.dump(index, f)
+
+        os.replace(tmp_file, self._cache_index_file)
+
+        self._cache_index = index
+
+    def _get_cached_object(self, digest):
+
+        return os.path.join(self._cache_directory, digest[:2], digest)
+
+    def _store_in_cache(self, url, file_name, size, version):
+
+        digest = _hash_file(file_name)
+
+        cached_object = self._get_cached_object(digest)
+
+        if not file_existing_and_readable(cached_object):
+
+            if_directory_not_existing_then_make(os.path.dirname(cached_object))
+
+            tmp_file = "%s.%i.%i.tmp" % (
+                cached_object,
+                os.getpid(),
+                threading.get_ident(),
+            )
+
+            shutil.copyfile(file_name, tmp_file)
+
+            os.replace(tmp_file, cached_object)
+
+        with self._lock:
+
+            self._cache_index[url] = {
+                "sha256": digest,
+                "size": size,
+                "version": version,
+            }
+
+    def _lookup_cache(self, url, size, version):
+
+        if self._cache_directory is None or version is None:
+
+            return None
+
+        with self._lock:
+
+            entry = self._cache_index.get(url)
+
+        if entry is None or entry["size"] != size or entry["version"] != version:
+
+            return None
+
+        cached_object = self._get_cached_object(entry["sha256"])
+
+        if not file_existing_and_readable(cached_object):
+
+            return None
+
+        return cached_object
+
+    def _get_session(self):
+
+        if not hasattr(self._local, "session"):
+
+            self._local.session = requests.Session()
+
+        return self._local.session
+
+    @staticmethod
+    def _get_version_file(part_file):
+
+        return "%s.version" % part_file
+
+    @staticmethod
+    def _read_part_version(version_file):
+
+        if not file_existing_and_readable(version_file):
+
+            return None
+
+        with open(version_file) as f:
+
+            return f.read()
+
+    @staticmethod
+    def _write_part_version(version_file, version):
+
+        with open(version_file, "w") as f:
+
+            f.write("" if version is None else version)
+
+    def _download_part(self, url, part_file, remote_size, version):
+        """
+        Download (or complete) the .part file, resuming with range requests after interruptions
+
+        :param version: the version of the remote file (ETag or Last-Modified), or None
+        :return: none
+        """
+
+        session = self._get_session()
+
+        last_error = None
+
+        version_file = self._get_version_file(part_file)
+
+        if os.path.exists(part_file) and self._read_part_version(version_file) != (
+            "" if version is None else version
+        ):
+
+            # this is a leftover of a different (or unknown) version of the file
+
+            os.remove(part_file)
+
+        if not os.path.exists(part_file):
+
+            self._write_part_version(version_file, version)
+
+        for _ in range(self._max_retries + 1):
+
+            offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+
+            if remote_size is not None:
+
+                if offset == remote_size:
+
+                    return
+
+                if offset > remote_size:
+
+                    # this is a leftover of a different version of the file
+
+                    os.remove(part_file)
+
+                    offset = 0
+
+            headers = {}
+
+            if offset > 0:
+
+                headers["Range"] = "bytes=%i-" % offset
+
+                # if the file changed in the meantime, the server sends it all
+
+                if version is not None:
+
+                    headers["If-Range"] = version
+
+            try:
+
+                with session.get(
+                    url, stream=True, headers=headers, timeout=self._timeout
+                ) as this_request:
+
+                    if this_request.status_code == 206:
+
+                        mode = "ab"
+
+                    elif this_request.ok:
+
+                        # the server does not support ranges, or the file changed: start from scratch
+
+                        mode = "wb"
+
+                        self._write_part_version(
+                            version_file,
+                            this_request.headers.get(
+                                "ETag", this_request.headers.get("Last-Modified")
+                            ),
+                        )
+
+                    else:
+
+                        raise HTTPError(
+                            "HTTP request for %s failed with reason: %s"
+                            % (url, this_request.reason)
+                        )
+
+                    with open(part_file, mode) as f:
+
+                        for chunk in this_request.iter_content(
+                            chunk_size=self._chunk_size
+                        ):
+
+                            if chunk:  # filter out keep-alive new chunks
+
+                                f.write(chunk)
+
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ) as exc:
+
+                # try again from where we stopped
+
+                last_error = exc
+
+                continue
+
+            if remote_size is None:
+
+                return
+
+        if remote_size is not None and os.path.getsize(part_file) == remote_size:
+
+            return
+
+        raise DownloadFailed(
+            "Could not download %s after %i attempts (last error: %s)"
+            % (url, self._max_retries + 1, last_error)
+        )
+
+    def download(self, url, local_path, compress=False, checksum=None):
+        """
+        Download one file (if needed)
+
+        :param url: the URL of the file
+        :param local_path: the path of the file in the local file system
+        :param compress: (default: False) compress the file with gzip (a .gz is appended to local_path)
+        :param checksum: (default: None) if provided, a string like "md5:<hex digest>" or "sha256:<hex digest>"
+        which the downloaded file must match
+        :return: the path of the file in the local file system
+        """
+
+        final_path = "%s.gz" % local_path if compress else local_path
+
+        # Ask the server for the size and the version of the file
+
+        head = self._get_session().head(
+            url, allow_redirects=True, timeout=self._timeout
+        )
+
+        if not head.ok:
+
+            raise HTTPError(
+                "HTTP request for %s failed with reason: %s" % (url, head.reason)
+            )
+
+        remote_size = head.headers.get("Content-Length")
+
+        remote_size = int(remote_size) if remote_size is not None else None
+
+        version = head.headers.get("ETag", head.headers.get("Last-Modified"))
+
+        # Now check if we really need to download this file
+
+        if file_existing_and_readable(final_path):
+
+            # a compressed file will have a smaller size, so we cannot check it
+
+            if compress or remote_size is None:
+
+                return final_path
+
+            if os.path.getsize(final_path) == remote_size and (
+                checksum is None or self._checksum_is_valid(final_path, checksum)
+            ):
+
+                return final_path
+
+        part_file = "%s.part" % local_path
+
+        cached_object = self._lookup_cache(url, remote_size, version)
+
+        if cached_object is not None:
+
+            shutil.copyfile(cached_object, part_file)
+
+        else:
+
+            self._download_part(url, part_file, remote_size, version)
+
+        version_file = self._get_version_file(part_file)
+
+        if os.path.exists(version_file):
+
+            os.remove(version_file)
+
+        if checksum is not None and not self._checksum_is_valid(part_file, checksum):
+
+            os.remove(part_file)
+
+            raise DownloadFailed("The checksum of %s does not match" % url)
+
+        if self._cache_directory is not None and cached_object is None:
+
+            self._store_in_cache(url, part_file, remote_size, version)
+
+        if compress:
+
+            _gzip_file(part_file, final_path)
+
+            os.remove(part_file)
+
+        else:
+
+            os.replace(part_file, final_path)
+
+        return final_path
+
+    @staticmethod
+    def _checksum_is_valid(file_name, checksum):
+
+        algorithm, digest = checksum.split(":", 1)
+
+        return _hash_file(file_name, algorithm.lower()) == digest.lower()
+
+    def download_many(
+        self, urls, local_paths, compress=False, checksums=None, progress=True
+    ):
+        """
+        Download several files concurrently
+
+        :param urls: list of URLs
+        :param local_paths: list of paths in the local file system (same length as urls)
+        :param compress: (default: False) a boolean or a list of booleans (one per file), see download()
+        :param checksums: (default: None) None or a list of checksums (or None), one per file, see download()
+        :param progress: (True or False) whether to display progress or not
+        :return: list of the downloaded files as absolute paths in the local file system
+        """
+
+        n_files = len(urls)
+
+        assert len(local_paths) == n_files, "You need one local path per URL"
+
+        if isinstance(compress, bool):
+
+            compress = [compress] * n_files
+
+        if checksums is None:
+
+            checksums = [None] * n_files
+
+        results = [None] * n_files
+
+        try:
+
+            with ThreadPoolExecutor(max_workers=self._n_connections) as executor:
+
+                futures = {
+                    executor.submit(
+                        self.download,
+                        urls[i],
+                        local_paths[i],
+                        compress[i],
+                        checksums[i],
+                    ): i
+                    for i in range(n_files)
+                }
+
+                if progress:
+
+                    with progress_bar(
+                        n_files, title="Downloading %i files" % n_files
+                    ) as bar:  # type: ProgressBarBase
+
+                        for future in as_completed(futures):
+
+                            results[futures[future]] = future.result()
+
+                            bar.increase()
+
+                else:
+
+                    for future in as_completed(futures):
+
+                        results[futures[future]] = future.result()
+
+        finally:
+
+            # even if a download failed, keep the cache entries of the files that completed
+            # (the executor waits for all the downloads before exiting)
+
+            if self._cache_directory is not None:
+
+                self._write_cache_index()
+
+        return results
+
+
 class ApacheDirectory(object):
     """
     Allows to interact with a directory listing like the one returned by an Apache server
@@ -128,108 +639,108 @@ class ApacheDirectory(object):
         progress=True,
         compress=False,
     ):
+        """
+        Download one file from the current directory. If the file is already present in the
+        destination path, it is not downloaded again.
 
-        assert remote_filename in self.files, (
-            "File %s is not contained in this directory (%s)"
-            % (remote_filename, self._request_result.url)
-        )
-
-        destination_path = sanitize_filename(destination_path, abspath=True)
-
-        assert path_exists_and_is_directory(destination_path), (
-            "Provided destination does not exist or "
-            "is not a directory" % destination_path
-        )
-
-        # If no filename is specified, use the same name that the file has on the remote server
+        :param remote_filename: the name of the file in the remote directory
+        :param destination_path: the path for the destination directory in the local file system
+        :param new_filename: (default: None) a new name for the local file
+        :param progress: (True or False) whether to display progress or not
+        :param compress: (default: False) compress the file with gzip
+        :return: the downloaded file as absolute path in the local file system
+        """
 
         if new_filename is None:
-            new_filename = remote_filename.split("/")[-1]
-
-        # Get the fully qualified path for the remote and the local file
-
-        remote_path = self._request_result.url + remote_filename
-        local_path = os.path.join(destination_path, new_filename)
-
-        # Ask the server for the file, but do not download it just yet
-        # (stream=True will get the HTTP header but nothing else)
-        # Use stream=True for two reasons:
-        # * so that the file is not downloaded all in memory before being written to the disk
-        # * so that we can report progress is requested
-
-        this_request = requests.get(remote_path, stream=True)
-
-        # Figure out the size of the file
-
-        file_size = int(this_request.headers["Content-Length"])
-
-        # Now check if we really need to download this file
-
-        if compress:
-            # Add a .gz at the end of the file path
-
-            local_path += ".gz"
-
-        if file_existing_and_readable(local_path):
-
-            local_size = os.path.getsize(local_path)
-
-            if local_size == file_size or compress:
-                # if the compressed file already exists
-                # it will have a smaller size
-
-                # No need to download it again
-                return local_path
-
-        # Chunk size shouldn't bee too small otherwise we are causing a bottleneck in the download speed
-        chunk_size = 1024 * 10
-
-        # If the user wants to compress the file, use gzip, otherwise the normal opener
-        if compress:
 
-            import gzip
-
-            opener = gzip.open
+            new_filenames = None
 
         else:
 
-            opener = open
-
-        if progress:
+            new_filenames = [new_filename]
 
-            # Set a title for the progress bar
-            bar_title = "Downloading %s" % new_filename
+        return self.download_files(
+            [remote_filename],
+            destination_path,
+            new_filenames=new_filenames,
+            progress=progress,
+            compress=compress,
+            n_connections=1,
+        )[0]
 
-            with progress_bar(
-                file_size, scale=1024 * 1024, units="Mb", title=bar_title
-            ) as bar:  # type: ProgressBarBase
+    def download_files(
+        self,
+        remote_filenames,
+        destination_path,
+        new_filenames=None,
+        progress=True,
+        compress=False,
+        checksums=None,
+        n_connections=4,
+        cache_directory=None,
+    ):
+        """
+        Download several files from the current directory concurrently. Files already present in
+        the destination path are not downloaded again, and partially downloaded files are resumed.
+        See DownloadManager for details.
 
-                with opener(local_path, "wb") as f:
+        :param remote_filenames: the names of the files in the remote directory
+        :param destination_path: the path for the destination directory in the local file system
+        :param new_filenames: (default: None) a list of new names for the local files
+        :param progress: (True or False) whether to display progress or not
+        :param compress: (default: False) a boolean or a list of booleans (one per file): compress the files
+        with gzip
+        :param checksums: (default: None) None or a list with one checksum (like "md5:<hex digest>") or None per file
+        :param n_connections: maximum number of files to download at the same time
+        :param cache_directory: (default: None) directory of the content-addressed cache of the downloads
+        :return: list of the downloaded files as absolute paths in the local file system
+        """
 
-                    for chunk in this_request.iter_content(chunk_size=chunk_size):
+        for remote_filename in remote_filenames:
 
-                        if chunk:  # filter out keep-alive new chunks
+            assert remote_filename in self.files, (
+                "File %s is not contained in this directory (%s)"
+                % (remote_filename, self._request_result.url)
+            )
 
-                            f.write(chunk)
-                            bar.increase(len(chunk))
+        destination_path = sanitize_filename(destination_path, abspath=True)
 
-            this_request.close()
+        assert path_exists_and_is_directory(destination_path), (
+            "Provided destination %s does not exist or "
+            "is not a directory" % destination_path
+        )
 
-        else:
+        # If no filename is specified, use the same name that the file has on the remote server
 
-            with opener(local_path, "wb") as f:
+        if new_filenames is None:
 
-                for chunk in this_request.iter_content(chunk_size=chunk_size):
+            new_filenames = [x.split("/")[-1] for x in remote_filenames]
 
-                    if chunk:  # filter out keep-alive new chunks
+        # Get the fully qualified path for the remote and the local files
 
-                        f.write(chunk)
+        remote_paths = [self._request_result.url + x for x in remote_filenames]
+        local_paths = [os.path.join(destination_path, x) for x in new_filenames]
 
-            this_request.close()
+        manager = DownloadManager(
+            n_connections=n_connections, cache_directory=cache_directory
+        )
 
-        return local_path
+        return manager.download_many(
+            remote_paths,
+            local_paths,
+            compress=compress,
+            checksums=checksums,
+            progress=progress,
+        )
 
-    def download_all_files(self, destination_path, progress=True, pattern=None):
+    def download_all_files(
+        self,
+        destination_path,
+        progress=True,
+        pattern=None,
+        n_connections=4,
+        cache_directory=None,
+    ):
         """
         Download all files in the current directory
 
@@ -237,10 +748,12 @@ class ApacheDirectory(object):
         :param progress: (True or False) whether to display progress or not
         :param pattern: (default: None) If not None, only files matching this pattern (a regular expression) will be
         downloaded
+        :param n_connections: maximum number of files to download at the same time
+        :param cache_directory: (default: None) directory of the content-addressed cache of the downloads
         :return: list of the downloaded files as absolute paths in the local file system
         """
 
-        local_files = []
+        files = []
 
         for file in self.files:
 
@@ -250,8 +763,12 @@ class ApacheDirectory(object):
 
                     continue
 
-            this_local_file = self.download(file, destination_path, progress=progress)
+            files.append(file)
 
-            local_files.append(this_local_file)
-
-        return local_files
+        return self.download_files(
+            files,
+            destination_path,
+            progress=progress,
+            n_connections=n_connections,
+            cache_directory=cache_directory,
+        )
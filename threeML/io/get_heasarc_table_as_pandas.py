@@ -16,6 +16,75 @@ from threeML.io.file_utils import (
 import warnings
 import yaml
 import codecs
+import pandas as pd
+
+try:
+
+    import pyarrow
+
+except ImportError:
+
+    has_pyarrow = False
+
+else:
+
+    has_pyarrow = True
+
+
+def _get_snapshot_file_name(cache_directory, heasarc_table_name):
+
+    # Feather is much faster to read than the pickle, but needs pyarrow
+
+    extension = "feather" if has_pyarrow else "pkl"
+
+    return sanitize_filename(
+        os.path.join(cache_directory, "%s_table.%s" % (heasarc_table_name, extension))
+    )
+
+
+def _write_snapshot(pandas_df, snapshot_file):
+
+    if has_pyarrow:
+
+        # feather only supports the default index
+
+        pandas_df.reset_index().to_feather(snapshot_file)
+
+    else:
+
+        pandas_df.to_pickle(snapshot_file)
+
+
+def _read_snapshot(snapshot_file):
+
+    if has_pyarrow:
+
+        return pd.read_feather(snapshot_file).set_index("name")
+
+    else:
+
+        return pd.read_pickle(snapshot_file)
+
+
+def _read_votable_as_pandas(file_name):
+
+    # use astropy routines to read the votable
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        vo_table = votable.parse(file_name)
+
+    table = vo_table.get_first_table().to_table(use_names_over_ids=True)
+
+    # make sure we do not use this as byte code
+    table.convert_bytestring_to_unicode()
+
+    # create a pandas table indexed by name
+
+    pandas_df = table.to_pandas().set_index("name")
+
+    del vo_table
+
+    return pandas_df
 
 
 def get_heasarc_table_as_pandas(heasarc_table_name, update=False, cache_time_days=1):
@@ -26,13 +95,17 @@ def get_heasarc_table_as_pandas(heasarc_table_name, update=False, cache_time_day
     https://heasarc.gsfc.nasa.gov/docs/archive/vo/
 
     In order to speed up the processing of the tables, 3ML can cache the XML table in a cache
-    that is updated every cache_time_days. The cache can be forced to update, i.e, reload from
-    the web, by setting update to True.
+    that is updated when it is older than cache_time_days. The cache can be forced to update, i.e,
+    reload from the web, by setting update to True.
+
+    The parsed table is also stored in a snapshot (feather if pyarrow is available, pickle otherwise)
+    next to the XML file, so that the (slow) parsing of the XML is done only once per download. If the
+    cache is outdated but the web cannot be reached, the last snapshot is used.
 
 
     :param heasarc_table_name: the name of a HEASARC browse table
     :param update: force web read of the table and update cache
-    :param cache_time_days: number of days to hold the current cache
+    :param cache_time_days: maximum age (in days) of the cache before it is reloaded from the web
     :return: pandas DataFrame with results and astropy table
     """
 
@@ -70,7 +143,7 @@ def get_heasarc_table_as_pandas(heasarc_table_name, update=False, cache_time_day
 
         with open(cache_file_sanatized) as cache:
 
-            # the cache file is two lines. The first is a datetime string that
+            # the cache file contains a datetime string that
             # specifies the last time the XML file was obtained
 
             yaml_cache = yaml.load(cache, Loader=yaml.SafeLoader)
@@ -79,9 +152,10 @@ def get_heasarc_table_as_pandas(heasarc_table_name, update=False, cache_time_day
                 datetime.datetime(*list(map(int, yaml_cache["last save"].split("-"))))
             )
 
-            # the second line how many seconds to keep the file around
+            # how many seconds to keep the file around. This is decided by the caller,
+            # not by the value used when the file was downloaded
 
-            cache_valid_for = float(yaml_cache["cache time"])
+            cache_valid_for = 86400.0 * cache_time_days
 
             # now we will compare it to the current time in UTC
             current_time = astro_time.Time(datetime.datetime.utcnow(), scale="utc")
@@ -112,18 +186,29 @@ def get_heasarc_table_as_pandas(heasarc_table_name, update=False, cache_time_day
             % heasarc_table_name
         )
 
+        # download to a temporary file, so that a failed download does not
+        # overwrite the current cache
+
+        temp_file_name = "%s.part" % file_name_sanatized
+
         try:
 
-            urllib.request.urlretrieve(heasarc_url, filename=file_name_sanatized)
+            urllib.request.urlretrieve(heasarc_url, filename=temp_file_name)
 
         except (IOError):
 
+            if os.path.exists(temp_file_name):
+
+                os.remove(temp_file_name)
+
             warnings.warn(
                 "The cache is outdated but the internet cannot be reached. Please check your connection"
             )
 
         else:
 
+            os.replace(temp_file_name, file_name_sanatized)
+
             # # Make sure the lines are interpreted as Unicode (otherwise some characters will fail)
             with open(file_name_sanatized) as table_file:
 
@@ -156,20 +241,19 @@ def get_heasarc_table_as_pandas(heasarc_table_name, update=False, cache_time_day
 
                 yaml.dump(yaml_dict, stream=cache, default_flow_style=False)
 
-    # use astropy routines to read the votable
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        vo_table = votable.parse(file_name_sanatized)
+    snapshot_file = _get_snapshot_file_name(cache_directory, heasarc_table_name)
 
-    table = vo_table.get_first_table().to_table(use_names_over_ids=True)
+    # the snapshot is valid only if it was written after the last download of the XML file
 
-    # make sure we do not use this as byte code
-    table.convert_bytestring_to_unicode()
+    if file_existing_and_readable(snapshot_file) and (
+        not file_existing_and_readable(file_name_sanatized)
+        or os.path.getmtime(snapshot_file) >= os.path.getmtime(file_name_sanatized)
+    ):
 
-    # create a pandas table indexed by name
+        return _read_snapshot(snapshot_file)
 
-    pandas_df = table.to_pandas().set_index("name")
+    pandas_df = _read_votable_as_pandas(file_name_sanatized)
 
-    del vo_table
+    _write_snapshot(pandas_df, snapshot_file)
 
     return pandas_df
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+
+# Functions registered here are inherited by the worker processes when they
+# are forked, so that they never need to be pickled. Only the (tiny) proxy
+# objects below travel through the pool queues.
+_registered_functions = {}
+
+
+class _RegisteredFunction(object):
+    def __init__(self, key):
+        """
+        A picklable proxy to a function registered in the parent process before
+        the worker processes were forked. Calling the proxy in a worker calls the
+        worker's own copy of the function (and therefore of the likelihood model
+        and of the plugins the function refers to)
+
+        :param key: the key of the function in the registry
+        """
+
+        self._key = key
+
+    def __call__(self, *args, **kwargs):
+
+        return _registered_functions[self._key](*args, **kwargs)
+
+
+class LocalPool(object):
+    def __init__(self, n_processes=None, **functions):
+        """
+        A pool of local processes which can be used to parallelize the samplers on a single machine,
+        without the need for MPI or an ipyparallel cluster.
+
+        The functions to be evaluated in the pool (typically the log. likelihood and prior closures
+        built by the samplers) must be provided here, so that they are registered *before* the
+        workers are forked. They can then be accessed as attributes of the pool and handed to the
+        sampler. Only a reference to them is transmitted to the workers, therefore closures,
+        bound methods and plugins which cannot be pickled are supported.
+
+        NOTE: this requires the 'fork' start method, i.e., it is not available on Windows.
+
+        :param n_processes: number of processes to use (default: number of CPUs)
+        :param functions: the functions to register, as keyword arguments
+        """
+
+        if n_processes is None:
+
+            n_processes = os.cpu_count()
+
+        self._n_processes = int(n_processes)
+
+        assert self._n_processes > 0, "The number of processes must be positive"
+
+        assert "fork" in multiprocessing.get_all_start_methods(), (
+            "Local pools require the 'fork' start method, which is not available "
+            "on this platform"
+        )
+
+        self._keys = []
+
+        for name, function in functions.items():
+
+            key = "%i_%s_%s" % (os.getpid(), id(self), name)
+
+            _registered_functions[key] = function
+
+            self._keys.append(key)
+
+            setattr(self, name, _RegisteredFunction(key))
+
+        self._pool = multiprocessing.get_context("fork").Pool(self._n_processes)
+
+    @property
+    def size(self):
+        """
+        :return: the number of processes in the pool
+        """
+
+        return self._n_processes
+
+    def map(self, function, tasks):
+
+        return self._pool.map(function, tasks)
+
+    def close(self):
+        """
+        Terminate the worker processes and remove the registered functions
+        """
+
+        self._pool.close()
+
+        self._pool.join()
+
+        for key in self._keys:
+
+            _registered_functions.pop(key, None)
+
+        self._keys = []
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+
+        self.close()
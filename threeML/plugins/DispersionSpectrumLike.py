@@ -89,6 +89,8 @@ class DispersionSpectrumLike(SpectrumLike):
 
         self._rsp.set_function(integral)
 
+        self._reset_model_evaluation()
+
     def _evaluate_model(self):
         """
         evaluates the full model over all channels
@@ -97,6 +99,15 @@ class DispersionSpectrumLike(SpectrumLike):
 
         return self._rsp.convolve()
 
+    def _evaluate_fit_view_model(self, fit_view):
+        """
+        evaluates the model only over the channels used in the fit, folding it
+        through the rows of the response (summed over the bins, if rebinned) of these channels
+        :return:
+        """
+
+        return self._rsp.convolve(fit_view.channels, fit_view.bin_starts)
+
     def get_simulated_dataset(self, new_name=None, **kwargs):
         """
         Returns another DispersionSpectrumLike instance where data have been obtained by randomizing the current expectation from the
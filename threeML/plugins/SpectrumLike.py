@@ -27,6 +27,8 @@ from threeML.plugin_prototype import PluginPrototype
 from threeML.plugins.XYLike import XYLike
 from threeML.utils.binner import Rebinner
 from threeML.utils.spectrum.binned_spectrum import BinnedSpectrum, ChannelSet
+from threeML.utils.spectrum.fit_view import FitView
+from threeML.utils.spectrum.spectrum_residuals import SpectrumResiduals
 
 from threeML.utils.string_utils import dash_separated_string_to_tuple
 from threeML.utils.spectrum.pha_spectrum import PHASpectrum
@@ -44,6 +46,28 @@ __instrument_name = "General binned spectral data"
 _known_noise_models = ["poisson", "gaussian", "ideal", "modeled"]
 
 
+def _overrides_only_evaluate_model(plugin_class):
+    """
+    Whether the class (re)defines _evaluate_model below the class defining the _evaluate_fit_view_model
+    it uses, so that the latter does not know about the former
+
+    :param plugin_class: a subclass of SpectrumLike
+    :return: bool
+    """
+
+    for this_class in plugin_class.__mro__:
+
+        if "_evaluate_fit_view_model" in vars(this_class):
+
+            return False
+
+        if "_evaluate_model" in vars(this_class):
+
+            return True
+
+    return False
+
+
 class SpectrumLike(PluginPrototype):
     def __init__(
         self,
@@ -114,6 +138,10 @@ class SpectrumLike(PluginPrototype):
         # Init everything else to None
         self._like_model = None
         self._rebinner = None
+        self._fit_view = None
+        self._last_model_evaluation = None
+        self._model_parameters = []
+        self._use_full_model = _overrides_only_evaluate_model(type(self))
         self._source_name = None
 
         # probe the noise models and then setup the appropriate count errors
@@ -1135,6 +1163,10 @@ class SpectrumLike(PluginPrototype):
 
     def _apply_mask_to_original_vectors(self):
 
+        # the channels used in the fit changed
+
+        self._fit_view = None
+
         # Apply the mask
 
         self._current_observed_counts = self._observed_counts[self._mask]
@@ -1396,6 +1428,8 @@ class SpectrumLike(PluginPrototype):
 
         self._rebinner = rebinner
 
+        self._fit_view = None
+
         # Apply the rebinning to everything.
         # NOTE: the output of the .rebin method are the vectors with the mask *already applied*
 
@@ -1598,22 +1632,65 @@ class SpectrumLike(PluginPrototype):
 
         self._integral_flux = integral
 
+        self._reset_model_evaluation()
+
     def _evaluate_model(self):
         """
         Since there is no dispersion, we simply evaluate the model by integrating over the energy bins.
-        This can be overloaded to convolve the model with a response, for example
+        This can be overloaded to convolve the model with a response, for example (see also
+        _evaluate_fit_view_model)
 
 
         :return:
         """
 
-        return np.array(
-            [
-                self._integral_flux(emin, emax)
-                for emin, emax in self._observed_spectrum.bin_stack
-            ]
+        return self._integral_flux(
+            self._observed_spectrum.starts, self._observed_spectrum.stops
         )
 
+    def _get_fit_view(self):
+        """
+        Return the channels used in the fit (see FitView), which are compiled again only
+        when the mask or the rebinner change
+
+        :return: the FitView instance
+        """
+
+        if self._fit_view is None:
+
+            self._fit_view = FitView(
+                self._mask, self._observed_spectrum, self._rebinner
+            )
+
+        return self._fit_view
+
+    def _evaluate_fit_view_model(self, fit_view):
+        """
+        Evaluate the model only for the channels used in the fit, already rebinned if there is a rebinner.
+        This is what is used during the fit. Plugins which override _evaluate_model can override this
+        as well to avoid evaluating the model on all the channels: if they do not, their _evaluate_model
+        is used and reduced to the channels of the fit (see _get_fit_view_model)
+
+        :param fit_view: the FitView instance
+        :return: the model for the active channels (or bins)
+        """
+
+        return fit_view.rebin(self._integral_flux(fit_view.emin, fit_view.emax))
+
+    def _get_fit_view_model(self, fit_view):
+        """
+        The model for the channels used in the fit (see _evaluate_fit_view_model)
+
+        :param fit_view: the FitView instance
+        :return: the model for the active channels (or bins)
+        """
+
+        if self._use_full_model:
+
+            return fit_view.reduce(self._evaluate_model())
+
+        return self._evaluate_fit_view_model(fit_view)
+
     def get_model(self):
         """
         The model integrated over the energy bins. Note that it only returns the  model for the
@@ -1622,20 +1699,67 @@ class SpectrumLike(PluginPrototype):
         :return: array of folded model
         """
 
-        if self._rebinner is not None:
+        fit_view = self._get_fit_view()
 
-            (model,) = self._rebinner.rebin(
-                self._evaluate_model() * self._observed_spectrum.exposure
-            )
+        model_rate = self._get_fit_view_model(fit_view)
 
-        else:
+        # keep it, so that the displays do not need to evaluate the model again (see _get_active_model_rate)
 
-            model = (
-                self._evaluate_model()[self._mask] * self._observed_spectrum.exposure
-            )
+        self._last_model_evaluation = (
+            fit_view,
+            self._get_model_parameter_values(),
+            model_rate,
+        )
+
+        model = model_rate * self._observed_spectrum.exposure
 
         return self._nuisance_parameter.value * model
 
+    def _reset_model_evaluation(self):
+        """
+        Forget the last evaluation of the model. To be called when a new model is set
+
+        :return: none
+        """
+
+        self._model_parameters = list(self._like_model.parameters.values())
+
+        self._last_model_evaluation = None
+
+    def _get_model_parameter_values(self):
+
+        return tuple([parameter.value for parameter in self._model_parameters])
+
+    def _get_active_model_rate(self):
+        """
+        The model rate in the active channels (not rebinned). The model evaluated during the last
+        computation of the likelihood is used if the parameters did not change since then and there is
+        no rebinner, otherwise the model is evaluated on the active channels.
+
+        :return: the model rate for each active channel
+        """
+
+        fit_view = self._get_fit_view()
+
+        if (
+            self._rebinner is None
+            and self._last_model_evaluation is not None
+            and self._last_model_evaluation[0] is fit_view
+            and self._last_model_evaluation[1] == self._get_model_parameter_values()
+        ):
+
+            model_rate = self._last_model_evaluation[2]
+
+        else:
+
+            if self._rebinner is not None:
+
+                fit_view = FitView(self._mask, self._observed_spectrum)
+
+            model_rate = self._get_fit_view_model(fit_view)
+
+        return model_rate * self._nuisance_parameter.value
+
     def _evaluate_background_model(self):
         """
         Since there is no dispersion, we simply evaluate the model by integrating over the energy bins.
@@ -1645,11 +1769,8 @@ class SpectrumLike(PluginPrototype):
         :return:
         """
 
-        return np.array(
-            [
-                self._background_integral_flux(emin, emax)
-                for emin, emax in self._observed_spectrum.bin_stack
-            ]
+        return self._background_integral_flux(
+            self._observed_spectrum.starts, self._observed_spectrum.stops
         )
 
     def get_background_model(self, without_mask=False):
@@ -1661,18 +1782,15 @@ class SpectrumLike(PluginPrototype):
          """
 
         if not without_mask:
-            if self._rebinner is not None:
-
-                (model,) = self._rebinner.rebin(
-                    self._evaluate_background_model() * self._background_exposure
-                )
 
-            else:
+            fit_view = self._get_fit_view()
 
-                model = (
-                    self._evaluate_background_model()[self._mask]
-                    * self._background_exposure
+            model = (
+                fit_view.rebin(
+                    self._background_integral_flux(fit_view.emin, fit_view.emax)
                 )
+                * self._background_exposure
+            )
 
         else:
 
@@ -2097,36 +2215,37 @@ class SpectrumLike(PluginPrototype):
         :return: the significance of the data over background per channel
         """
 
-        with np.errstate(divide="ignore", invalid="ignore"):
+        return self._get_significance_per_channel(
+            self._current_observed_counts,
+            self._current_background_counts,
+            self._current_back_count_errors,
+        )
 
-            sig_obj = Significance(
-                Non=self._current_observed_counts,
-                Noff=self._current_background_counts,
-                alpha=self._total_scale_factor,
-            )
+    def _get_significance_per_channel(
+        self, observed_counts, background_counts, background_errors
+    ):
 
-            if (
-                self._observed_spectrum.is_poisson
-                and self._background_spectrum.is_poisson
-            ):
+        if not self._observed_spectrum.is_poisson:
 
-                # use simple li & ma
-                significance = sig_obj.li_and_ma()
+            raise NotImplementedError("We haven't put in other significances yet")
 
-            elif (
-                self._observed_spectrum.is_poisson
-                and not self._background_spectrum.is_poisson
-            ):
+        if self._background_spectrum.is_poisson:
 
-                significance = sig_obj.li_and_ma_equivalent_for_gaussian_background(
-                    self._current_back_count_errors
-                )
+            background_noise_model = "poisson"
 
-            else:
+        else:
 
-                raise NotImplementedError("We haven't put in other significances yet")
+            background_noise_model = "gaussian"
 
-            return significance
+        return SpectrumResiduals(
+            observed_counts,
+            None,
+            "poisson",
+            background_noise_model,
+            background_counts=background_counts,
+            background_errors=background_errors,
+            scale_factor=self._total_scale_factor,
+        ).get_significance()
 
     def write_pha(self):
 
@@ -2509,9 +2628,16 @@ class SpectrumLike(PluginPrototype):
                 if self._verbose:
                     print("channels below the significance threshold shown in red\n")
 
+                # the significance of all the channels, as they are all displayed
+
                 with np.errstate(invalid="ignore"):
                     significance_mask = (
-                        self.significance_per_channel < significance_level
+                        self._get_significance_per_channel(
+                            self._observed_counts,
+                            self._background_counts,
+                            self._back_count_errors,
+                        )
+                        < significance_level
                     )
 
                 disjoint_patch_plot(
@@ -2607,6 +2733,9 @@ class SpectrumLike(PluginPrototype):
         values. We keep this seperated from the plotting code because
         it is cleaner and allows us to extract these quantites independently
 
+        The model is only evaluated on the active channels (reusing the evaluation done in the last
+        computation of the likelihood if possible), so expected_model_rate is nan for the other channels
+
         :param min_rate:
         :param ratio_residuals:
         :return:
@@ -2619,7 +2748,9 @@ class SpectrumLike(PluginPrototype):
 
         chan_width = energy_max - energy_min
 
-        expected_model_rate = self.expected_model_rate
+        expected_model_rate = np.full(energy_min.shape, np.nan)
+
+        expected_model_rate[self._mask] = self._get_active_model_rate()
 
         # figure out the type of data
 
@@ -2639,9 +2770,13 @@ class SpectrumLike(PluginPrototype):
             # Use the rebinner already in the data
             this_rebinner = self._rebinner
 
-        # get the rebinned counts
-        new_rate, new_model_rate = this_rebinner.rebin(src_rate, expected_model_rate)
-        (new_err,) = this_rebinner.rebin_errors(src_rate_err)
+        # all the vectors are reduced to the bins with the same view used by the likelihood
+
+        display_view = FitView(self._mask, self._observed_spectrum, this_rebinner)
+
+        new_rate = display_view.reduce(src_rate)
+        new_model_rate = display_view.reduce(expected_model_rate)
+        new_err = np.sqrt(display_view.reduce(np.square(src_rate_err)))
 
         # adjust channels
         new_energy_min, new_energy_max = this_rebinner.get_new_start_and_stop(
@@ -2649,152 +2784,56 @@ class SpectrumLike(PluginPrototype):
         )
         new_chan_width = new_energy_max - new_energy_min
 
-        # mean_energy = np.mean([new_energy_min, new_energy_max], axis=0)
+        # For each bin find the weighted average of the channel center.
+        # negative src rates cause the energy mean to
+        # go outside of the bounds. So we fix negative rates to
+        # zero when computing the mean
 
-        # For each bin find the weighted average of the channel center
-        mean_energy = []
-        delta_energy = [[], []]
         mean_energy_unrebinned = (energy_max + energy_min) / 2.0
 
-        for e_min, e_max in zip(new_energy_min, new_energy_max):
-
-            # Find all channels in this rebinned bin
-            idx = (mean_energy_unrebinned >= e_min) & (mean_energy_unrebinned <= e_max)
+        weights = np.clip(src_rate, 0.0, None)
 
-            # Find the rates for these channels
-            r = src_rate[idx]
+        sum_of_weights = display_view.reduce(weights)
 
-            if r.max() == 0:
+        with np.errstate(divide="ignore", invalid="ignore"):
 
+            mean_energy = np.where(
+                sum_of_weights > 0,
+                display_view.reduce(weights * mean_energy_unrebinned) / sum_of_weights,
                 # All empty, cannot weight
-                this_mean_energy = (e_min + e_max) / 2.0
-
-            else:
-
-                # negative src rates cause the energy mean to
-                # go outside of the bounds. So we fix negative rates to
-                # zero when computing the mean
-
-                idx_negative = r < 0.0
-
-                r[idx_negative] = 0.0
-
-                # Do the weighted average of the mean energies
-                weights = old_div(r, np.sum(r))
-
-                this_mean_energy = np.average(
-                    mean_energy_unrebinned[idx], weights=weights
-                )
+                (new_energy_min + new_energy_max) / 2.0,
+            )
 
-            # Compute "errors" for X (which aren't really errors, just to mark the size of the bin)
+        # Compute "errors" for X (which aren't really errors, just to mark the size of the bin)
 
-            delta_energy[0].append(this_mean_energy - e_min)
-            delta_energy[1].append(e_max - this_mean_energy)
-            mean_energy.append(this_mean_energy)
+        delta_energy = [mean_energy - new_energy_min, new_energy_max - mean_energy]
 
         # Residuals
 
-        # we need to get the rebinned counts
-        (rebinned_observed_counts,) = this_rebinner.rebin(self.observed_counts)
-
-        (rebinned_observed_count_errors,) = this_rebinner.rebin_errors(
-            self.observed_count_errors
-        )
-
-        # the rebinned counts expected from the model
-        rebinned_model_counts = new_model_rate * self._observed_spectrum.exposure
-
-        # and also the rebinned background
-
-        if (
-            self._background_noise_model is not None ):
-
-
-            if False:#self._background_noise_model == "modeled":
-
-                            
-
-                (rebinned_background_counts,) = this_rebinner.rebin(self.get_background_model())
-                (rebinned_background_errors,) = this_rebinner.rebin_errors(np.sqrt(self.get_background_model()) )
+        if self._background_noise_model is not None:
 
-
-            else:
-            
-
-                (rebinned_background_counts,) = this_rebinner.rebin(self.background_counts)
-                (rebinned_background_errors,) = this_rebinner.rebin_errors(
-                    self.background_count_errors
-                )
+            background_counts = self.background_counts
+            background_errors = self.background_count_errors
 
         else:
 
-            rebinned_background_counts = np.zeros_like(rebinned_observed_counts)
-
-
-            
-            
-        significance_calc = Significance(
-            rebinned_observed_counts,
-            rebinned_background_counts
-            + old_div(rebinned_model_counts, self._total_scale_factor),
-            min([self._total_scale_factor, 1.]),
-        )
-
-        # Divide the various cases
-
-        if ratio_residuals:
-            residuals = old_div(
-                (rebinned_observed_counts - rebinned_model_counts),
-                rebinned_model_counts,
-            )
-            residual_errors = old_div(
-                rebinned_observed_count_errors, rebinned_model_counts
+            background_counts = None
+            background_errors = None
+
+        residuals, residual_errors = (
+            SpectrumResiduals(
+                self.observed_counts,
+                expected_model_rate * self._observed_spectrum.exposure,
+                self._observation_noise_model,
+                self._background_noise_model,
+                background_counts=background_counts,
+                background_errors=background_errors,
+                observed_count_errors=self.observed_count_errors,
+                scale_factor=self._total_scale_factor,
             )
-
-        else:
-            residual_errors = None
-            if self._observation_noise_model == "poisson":
-
-                if self._background_noise_model == "poisson":
-
-                    # We use the Li-Ma formula to get the significance (sigma)
-
-                    residuals = significance_calc.li_and_ma()
-
-                elif self._background_noise_model == "ideal":
-
-                    residuals = significance_calc.known_background()
-
-                elif self._background_noise_model == "gaussian":
-
-                    residuals = significance_calc.li_and_ma_equivalent_for_gaussian_background(
-                        rebinned_background_errors
-                    )
-
-                elif self._background_noise_model is None:
-
-                    residuals = significance_calc.known_background()
-
-                elif self._background_noise_model == "modeled":
-
-                    residuals = significance_calc.known_background()
-                    
-                else:
-
-                    raise RuntimeError("This is a bug")
-
-            else:
-
-                if self._background_noise_model is None:
-
-                    residuals = old_div(
-                        (rebinned_observed_counts - rebinned_model_counts),
-                        rebinned_observed_count_errors,
-                    )
-
-                else:
-
-                    raise NotImplementedError("Not yet implemented")
+            .rebin(display_view)
+            .get_residuals(ratio_residuals)
+        )
 
         # construct a dict with all the new quantities
         # so that we can extract them for plotting
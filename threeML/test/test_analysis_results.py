@@ -17,6 +17,21 @@ from threeML.analysis_results import (
 )
 from astromodels import Line, Gaussian, Powerlaw
 
+try:
+
+    import h5py
+
+except ImportError:
+
+    has_h5py = False
+
+else:
+
+    has_h5py = True
+
+skip_if_h5py_is_not_available = pytest.mark.skipif(
+    not has_h5py, reason="No h5py available"
+)
 
 _cache = {}
 
@@ -163,6 +178,141 @@ def test_analysis_set_input_output(xy_fitted_joint_likelihood):
         _results_are_same(res1, res2)
 
 
+@skip_if_h5py_is_not_available
+def test_analysis_results_input_output_hdf5(xy_fitted_joint_likelihood):
+
+    jl, _, _ = xy_fitted_joint_likelihood  # type: JointLikelihood, None, None
+
+    jl.restore_best_fit()
+
+    ar = jl.results  # type: MLEResults
+
+    temp_file = "__test_mle.h5"
+
+    ar.write_to(temp_file, overwrite=True)
+
+    with pytest.raises(IOError):
+
+        ar.write_to(temp_file, overwrite=False)
+
+    ar_reloaded = load_analysis_results(temp_file)
+
+    # Nothing but the summary has been read yet
+
+    assert ar_reloaded._model is None
+
+    assert ar_reloaded._samples is None
+
+    # The samples of one parameter can be read without the model
+
+    variates = ar_reloaded.get_variates("fake.spectrum.main.composite.a_1")
+
+    assert np.allclose(
+        variates.samples, ar.get_variates("fake.spectrum.main.composite.a_1").samples,
+    )
+
+    assert ar_reloaded._model is None
+
+    assert np.allclose(ar_reloaded.samples, ar.samples)
+
+    _results_are_same(ar, ar_reloaded)
+
+    os.remove(temp_file)
+
+
+def test_analysis_set_to_frame(xy_fitted_joint_likelihood):
+
+    jl, _, _ = xy_fitted_joint_likelihood  # type: JointLikelihood, None, None
+
+    jl.restore_best_fit()
+
+    analysis_set = AnalysisResultsSet([jl.results, jl.results])
+
+    analysis_set.set_x("index", [1, 2])
+
+    frame = analysis_set.to_frame()
+
+    assert len(frame) == 2 * len(jl.results.get_data_frame())
+
+    for i, ar in enumerate(analysis_set):
+
+        this_frame = frame[frame["result"] == i]
+
+        data_frame = ar.get_data_frame()
+
+        assert np.all(this_frame["parameter"].values == data_frame.index.values)
+
+        for column in ["value", "negative_error", "positive_error", "error"]:
+
+            assert np.allclose(this_frame[column].values, data_frame[column].values)
+
+        assert np.all(this_frame["unit"].values == data_frame["unit"].values)
+
+        assert np.allclose(
+            this_frame["statistic"], np.sum(ar.optimal_statistic_values.values)
+        )
+
+        assert np.all(this_frame["VALUE"] == i + 1)
+
+
+@skip_if_h5py_is_not_available
+def test_analysis_set_input_output_hdf5(xy_fitted_joint_likelihood):
+
+    jl, _, _ = xy_fitted_joint_likelihood  # type: JointLikelihood, None, None
+
+    jl.restore_best_fit()
+
+    ar = jl.results  # type: MLEResults
+
+    ar2 = jl.results
+
+    analysis_set = AnalysisResultsSet([ar, ar2])
+
+    analysis_set.set_bins("testing", [-1, 1], [3, 5], unit="s")
+
+    temp_file = "_analysis_set_test.h5"
+
+    analysis_set.write_to(temp_file, overwrite=True)
+
+    analysis_set_reloaded = load_analysis_results(temp_file)
+
+    assert len(analysis_set_reloaded) == len(analysis_set)
+
+    assert analysis_set_reloaded._sequence_name == "testing"
+
+    lower_bounds = analysis_set_reloaded._sequence_tuple[0][1]
+
+    assert np.all(lower_bounds == [-1, 1] * u.s)
+
+    # The summary of the set does not need the models
+
+    frame = analysis_set_reloaded.to_frame()
+
+    assert analysis_set_reloaded[0]._model is None
+
+    assert np.all(
+        frame["LOWER_BOUND"].values == np.where(frame["result"].values == 0, -1, 1)
+    )
+
+    for res1, res2 in zip(analysis_set, analysis_set_reloaded):
+
+        _results_are_same(res1, res2)
+
+    # Writing again a set loaded from HDF5 does not need the models
+
+    analysis_set_reloaded = load_analysis_results(temp_file)
+
+    analysis_set_reloaded.write_to(temp_file, overwrite=True)
+
+    assert analysis_set_reloaded[0]._model is None
+
+    for res1, res2 in zip(analysis_set, load_analysis_results(temp_file)):
+
+        _results_are_same(res1, res2)
+
+    os.remove(temp_file)
+
+
 def test_error_propagation(xy_fitted_joint_likelihood):
 
     jl, _, _ = xy_fitted_joint_likelihood  # type: JointLikelihood, None, None
@@ -245,6 +395,26 @@ def test_bayesian_input_output(xy_completed_bayesian_analysis):
     _results_are_same(rb1, rb2, bayes=True)
 
 
+@skip_if_h5py_is_not_available
+def test_bayesian_input_output_hdf5(xy_completed_bayesian_analysis):
+
+    bs, _ = xy_completed_bayesian_analysis
+
+    rb1 = bs.results
+
+    temp_file = "_test_bayes.h5"
+
+    rb1.write_to(temp_file, overwrite=True)
+
+    rb2 = load_analysis_results(temp_file)
+
+    # the samples are read from the file when needed
+
+    _results_are_same(rb1, rb2, bayes=True)
+
+    os.remove(temp_file)
+
+
 def test_corner_plotting(xy_completed_bayesian_analysis):
 
     bs, _ = xy_completed_bayesian_analysis
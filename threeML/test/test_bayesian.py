@@ -1,4 +1,14 @@
 from threeML import BayesianAnalysis, Uniform_prior, Log_uniform_prior
+from threeML.bayesian.checkpoint import MCMCCheckpoint
+from threeML.bayesian.sampler_base import _LogPriorEvaluator
+from threeML.bayesian.convergence import (
+    ConvergenceMonitor,
+    gelman_rubin,
+    integrated_autocorrelation_time,
+)
+from astromodels import Cauchy, Gaussian, Parameter
+import collections
+import math
 import numpy as np
 import pytest
 
@@ -103,12 +113,443 @@ def test_bayes_constructor(fitted_joint_likelihood_bn090217206_nai):
     assert bayes.log_probability_values is None
 
 
+def _reference_log_prior(free_parameters, trial_values):
+
+    # Sum of the natural log. of the priors evaluated by astromodels, with the boundaries
+    # of the parameters enforced
+
+    log_prior = 0.0
+
+    for parameter, trial_value in zip(free_parameters.values(), trial_values):
+
+        if (parameter.min_value is not None and trial_value < parameter.min_value) or (
+            parameter.max_value is not None and trial_value > parameter.max_value
+        ):
+
+            return -np.inf
+
+        prior_value = parameter.prior(trial_value)
+
+        if prior_value <= 0:
+
+            return -np.inf
+
+        log_prior += math.log(prior_value)
+
+    return log_prior
+
+
+def test_log_prior_evaluator():
+
+    free_parameters = collections.OrderedDict()
+
+    free_parameters["a"] = Parameter("a", 0.5, free=True)
+    free_parameters["a"].prior = Uniform_prior(
+        lower_bound=-2.0, upper_bound=3.0, value=0.2
+    )
+
+    free_parameters["b"] = Parameter("b", 5.0, free=True)
+    free_parameters["b"].prior = Log_uniform_prior(lower_bound=1.0, upper_bound=100.0)
+
+    # The boundaries of the parameter are tighter than the support of the prior
+
+    free_parameters["c"] = Parameter("c", 1.0, min_value=-1.0, max_value=4.0, free=True)
+    free_parameters["c"].prior = Gaussian(mu=1.0, sigma=0.5)
+
+    # Evaluated through the generic path
+
+    free_parameters["d"] = Parameter("d", 0.0, free=True)
+    free_parameters["d"].prior = Cauchy(x0=0.5, gamma=2.0)
+
+    evaluator = _LogPriorEvaluator(free_parameters)
+
+    rng = np.random.RandomState(42)
+
+    points = np.column_stack(
+        [
+            rng.uniform(-3.0, 4.0, 200),
+            rng.uniform(0.5, 120.0, 200),
+            rng.uniform(-2.0, 5.0, 200),
+            rng.uniform(-10.0, 10.0, 200),
+        ]
+    )
+
+    # The edges: the boundaries are allowed for the uniform prior (and for the parameter),
+    # but not for the log-uniform prior
+
+    inside = [0.5, 5.0, 1.0, 0.0]
+
+    edges = []
+
+    for i, edge in [(0, -2.0), (0, 3.0), (1, 1.0), (1, 100.0), (2, -1.0), (2, 4.0)]:
+
+        this_point = list(inside)
+        this_point[i] = edge
+        edges.append(this_point)
+
+        for outside in [np.nextafter(edge, -np.inf), np.nextafter(edge, np.inf)]:
+
+            this_point = list(inside)
+            this_point[i] = outside
+            edges.append(this_point)
+
+    points = np.vstack([points, edges])
+
+    expected = np.array(
+        [_reference_log_prior(free_parameters, point) for point in points]
+    )
+
+    # Make sure that both the allowed and the forbidden regions are covered
+
+    assert np.sum(np.isfinite(expected)) > 20
+    assert np.sum(expected == -np.inf) > 20
+
+    for edge, expected_value in zip(edges[::3], expected[200::3]):
+
+        # -2, 3 (uniform), -1, 4 (parameter) are allowed, 1, 100 (log-uniform) are not
+
+        assert np.isfinite(expected_value) == (edge[1] not in [1.0, 100.0])
+
+    batch = evaluator.evaluate_batch(points)
+
+    finite = np.isfinite(expected)
+
+    assert np.all(np.isfinite(batch) == finite)
+    assert np.allclose(batch[finite], expected[finite], rtol=1e-12)
+
+    for point, expected_value in zip(points, expected):
+
+        value = evaluator(point)
+
+        if np.isfinite(expected_value):
+
+            assert np.isclose(value, expected_value, rtol=1e-12)
+
+        else:
+
+            assert value == -np.inf
+
+    # A single point can be given to evaluate_batch
+
+    assert np.isclose(evaluator.evaluate_batch(inside)[0], evaluator(inside))
+
+
+def test_get_posterior_uses_natural_log_priors(bayes_fitter):
+
+    bayes = bayes_fitter
+
+    bayes.set_sampler("emcee")
+
+    sampler = bayes.sampler
+
+    sampler._update_free_parameters()
+
+    free_parameters = sampler._free_parameters
+
+    trial_values = np.array([parameter.value for parameter in free_parameters.values()])
+
+    log_like = sum(dataset.get_log_like() for dataset in bayes.data_list.values())
+
+    prior_values = [
+        parameter.prior(x)
+        for parameter, x in zip(free_parameters.values(), trial_values)
+    ]
+
+    posterior = sampler.get_posterior(trial_values)
+
+    assert np.isclose(posterior, log_like + np.sum(np.log(prior_values)), rtol=1e-10)
+
+    # The log-uniform prior on K makes the natural log. differ from the log10
+
+    assert not np.isclose(
+        posterior, log_like + np.sum(np.log10(prior_values)), rtol=1e-10
+    )
+
+    # Outside of the support of the priors the posterior is -inf
+
+    for i, parameter in enumerate(free_parameters.values()):
+
+        outside_values = trial_values.copy()
+        outside_values[i] = parameter.prior.upper_bound.value + 1.0
+
+        assert sampler.get_posterior(outside_values) == -np.inf
+        assert sampler._log_priors(outside_values[np.newaxis, :])[0] == -np.inf
+
+
 def test_emcee(bayes_fitter):
 
     pass
     # This has been already tested in the fixtures (see conftest.py)
 
 
+def test_emcee_checkpoint_and_resume(bayes_fitter, tmpdir, capsys):
+
+    bayes = bayes_fitter
+
+    checkpoint_dir = str(tmpdir.join("emcee_checkpoint"))
+
+    bayes.set_sampler("emcee")
+
+    bayes.sampler.setup(
+        n_walkers=20,
+        n_burn_in=10,
+        n_iterations=40,
+        seed=1234,
+        checkpoint_dir=checkpoint_dir,
+        checkpoint_every=15,
+    )
+
+    samples = bayes.sample(quiet=True)
+
+    raw_samples = bayes.raw_samples.copy()
+
+    assert raw_samples.shape == (40 * 20, 2)
+
+    # the full chain (burn-in included) is readable from the checkpoint
+
+    chain, log_prob = MCMCCheckpoint(checkpoint_dir).read_chain()
+
+    assert chain.shape == (50, 20, 2)
+    assert log_prob.shape == (50, 20)
+
+    assert np.allclose(chain[10:].reshape(-1, 2), raw_samples)
+
+    # the acceptance fraction covers all the blocks, not only the last one
+    # (a walker moved if its position changed, the first step is unknown)
+
+    acceptance = float(
+        capsys.readouterr().out.split("Mean acceptance fraction:")[1].split()[0]
+    )
+
+    moved = np.mean(np.any(np.diff(chain, axis=0) != 0, axis=2))
+
+    assert abs(acceptance - moved) <= 1.0 / 50
+
+    # resuming a completed run does not sample again
+
+    bayes.sampler.setup(
+        n_walkers=20,
+        n_burn_in=10,
+        n_iterations=40,
+        checkpoint_dir=checkpoint_dir,
+        resume=True,
+    )
+
+    bayes.sample(quiet=True)
+
+    assert np.allclose(bayes.raw_samples, raw_samples)
+
+    # extending the run continues from the last state
+
+    bayes.sampler.setup(
+        n_walkers=20,
+        n_burn_in=10,
+        n_iterations=60,
+        checkpoint_dir=checkpoint_dir,
+        resume=True,
+    )
+
+    bayes.sample(quiet=True)
+
+    assert bayes.raw_samples.shape == (60 * 20, 2)
+
+    assert np.allclose(bayes.raw_samples[: 40 * 20], raw_samples)
+
+    # the samples are memory-mapped from the store, and thinning is applied on the fly
+
+    assert isinstance(bayes.raw_samples, np.memmap)
+
+    bayes.sampler.setup(
+        n_walkers=20,
+        n_burn_in=10,
+        n_iterations=60,
+        thin=3,
+        checkpoint_dir=checkpoint_dir,
+        resume=True,
+    )
+
+    bayes.sample(quiet=True)
+
+    assert bayes.raw_samples.shape == (20 * 20, 2)
+
+    assert bayes.results.samples.shape == (2, 20 * 20)
+
+    bayes.results.write_to(str(tmpdir.join("memmapped_results.fits")))
+
+
+def test_convergence_diagnostics():
+
+    rng = np.random.RandomState(1234)
+
+    # AR(1) process, for which tau = (1 + rho) / (1 - rho)
+
+    rho = 0.8
+
+    chain = np.zeros((4000, 16, 1))
+
+    for i in range(1, chain.shape[0]):
+
+        chain[i] = rho * chain[i - 1] + rng.normal(size=(16, 1))
+
+    tau = integrated_autocorrelation_time(chain)
+
+    assert np.allclose(tau, (1 + rho) / (1 - rho), rtol=0.1)
+
+    assert gelman_rubin(chain)[0] < 1.01
+
+    # walkers stuck in different places
+
+    shifted = chain + np.arange(16)[np.newaxis, :, np.newaxis]
+
+    assert gelman_rubin(shifted)[0] > 1.1
+
+    monitor = ConvergenceMonitor(target_ess=1000, tau_tolerance=0.1)
+
+    # first check cannot be declared converged (stability of tau unknown)
+
+    assert not monitor.check(chain[:2000])
+
+    assert monitor.check(chain)
+
+    assert 0 < monitor.n_burn_in < 2 * (1 + rho) / (1 - rho) * 1.2 + 1
+
+    assert np.all(monitor.ess > 1000)
+
+    # long chains are thinned before the check, the diagnostics are still in units of steps
+
+    thinned_monitor = ConvergenceMonitor(
+        target_ess=1000, tau_tolerance=0.1, max_check_length=1000
+    )
+
+    # (the thinning changes between 2000 and 3000 steps, so tau is not compared)
+
+    thinned_monitor.check(chain[:2000])
+
+    assert not thinned_monitor.check(chain[:3000])
+
+    assert thinned_monitor.check(chain)
+
+    assert np.allclose(thinned_monitor.tau, monitor.tau, rtol=0.25)
+
+    assert np.allclose(thinned_monitor.ess, monitor.ess, rtol=0.25)
+
+    # a fixed burn-in is never shortened, the checks are skipped until enough steps follow it
+
+    monitor = ConvergenceMonitor(target_ess=10, n_burn_in=250)
+
+    assert not monitor.check(chain[:252])
+
+    assert monitor.ess is None
+
+    assert not monitor.check(chain[:300])
+
+    assert monitor.n_burn_in == 250
+
+    assert np.allclose(monitor.ess * monitor.tau, 16 * 50)
+
+    # the first checks of a short chain are skipped as well
+
+    monitor = ConvergenceMonitor()
+
+    for n_steps in range(1, 8):
+
+        assert not monitor.check(chain[:n_steps])
+
+    assert monitor.ess is not None
+
+
+def test_emcee_adaptive(bayes_fitter, tmpdir, monkeypatch):
+
+    bayes = bayes_fitter
+
+    bayes.set_sampler("emcee")
+
+    bayes.sampler.setup(
+        n_walkers=20,
+        n_iterations=3000,
+        seed=1234,
+        adaptive=True,
+        target_ess=200,
+        max_r_hat=1.05,
+        check_every=100,
+    )
+
+    bayes.sample(quiet=True)
+
+    diagnostics = bayes.sampler.convergence_diagnostics
+
+    assert list(diagnostics.index) == list(
+        bayes.results.optimized_model.free_parameters.keys()
+    )
+
+    assert np.all(diagnostics["ess"] >= 200)
+    assert np.all(diagnostics["r_hat"] < 1.05)
+
+    # stopped before the maximum number of iterations, and the burn-in was discarded
+
+    n_steps = bayes.sampler._sampler.iteration
+
+    assert n_steps < 3000
+
+    assert bayes.raw_samples.shape[0] < n_steps * 20
+
+    # frequent checks start once the chain is long enough
+
+    bayes.sampler.setup(
+        n_walkers=20, n_iterations=30, seed=1234, adaptive=True, check_every=3,
+    )
+
+    bayes.sample(quiet=True)
+
+    assert bayes.sampler.convergence_diagnostics is not None
+
+    # the burn-in cannot be longer than the run
+
+    with pytest.raises(AssertionError):
+
+        bayes.sampler.setup(
+            n_walkers=20, n_burn_in=250, n_iterations=252, adaptive=True,
+        )
+
+    # with checkpoints, the convergence is checked every check_every iterations only
+
+    n_checks = []
+
+    original_check = ConvergenceMonitor.check
+
+    def counting_check(self, chain):
+
+        n_checks.append(chain.shape[0])
+
+        return original_check(self, chain)
+
+    monkeypatch.setattr(ConvergenceMonitor, "check", counting_check)
+
+    bayes.sampler.setup(
+        n_walkers=20,
+        n_iterations=200,
+        seed=1234,
+        adaptive=True,
+        check_every=50,
+        checkpoint_dir=str(tmpdir.join("adaptive_checkpoint")),
+        checkpoint_every=20,
+    )
+
+    bayes.sample(quiet=True)
+
+    assert n_checks == [60, 120, 180, 200]
+
+    monkeypatch.undo()
+
+    # a non-adaptive run resets the diagnostics
+
+    bayes.sampler.setup(n_walkers=20, n_burn_in=10, n_iterations=20)
+
+    bayes.sample(quiet=True)
+
+    assert bayes.sampler.convergence_diagnostics is None
+
+
 @skip_if_pymultinest_is_not_available
 def test_multinest(bayes_fitter, completed_bn090217206_bayesian_analysis):
 
@@ -157,6 +598,22 @@ def test_dynesty_nested(bayes_fitter, completed_bn090217206_bayesian_analysis):
     check_results(res)
 
 
+@skip_if_dynesty_is_not_available
+def test_dynesty_nested_local_pool(
+    bayes_fitter, completed_bn090217206_bayesian_analysis
+):
+
+    bayes, _ = completed_bn090217206_bayesian_analysis
+
+    bayes.set_sampler("dynesty_nested")
+
+    bayes.sampler.setup(n_live_points=100, n_effective=10, n_processes=2)
+
+    bayes.sample()
+
+    res = bayes.results.get_data_frame()
+
+    check_results(res)
 
 
 @skip_if_dynesty_is_not_available
@@ -175,8 +632,6 @@ def test_dynesty_dynamic(bayes_fitter, completed_bn090217206_bayesian_analysis):
     check_results(res)
 
 
-    
-
 @skip_if_zeus_is_not_available
 def test_zeus(bayes_fitter, completed_bn090217206_bayesian_analysis):
 
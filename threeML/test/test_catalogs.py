@@ -2,12 +2,248 @@ import pytest
 
 from threeML import *
 from threeML.io.network import internet_connection_is_active
+from threeML.catalogs.VirtualObservatoryCatalog import VirtualObservatoryCatalog
+from threeML.catalogs.Fermi import ModelFrom3FGL
+from astromodels.utils.angular_distance import angular_distance
+from threeML.io.get_heasarc_table_as_pandas import _write_snapshot, _read_snapshot
+import threeML.io.get_heasarc_table_as_pandas as heasarc_tables
+import numpy as np
+import astropy.io.votable as votable
+from astropy.table import Table
+import pandas as pd
+import astropy.units as u
+from astropy.coordinates import SkyCoord
 
 skip_if_internet_is_not_available = pytest.mark.skipif(
     not internet_connection_is_active(), reason="No active internet connection"
 )
 
 
+class _SyntheticCatalog(VirtualObservatoryCatalog):
+    def __init__(self, n_sources):
+
+        self._n_sources = n_sources
+
+        super(_SyntheticCatalog, self).__init__(
+            "synthetic", "http://localhost/", "Synthetic catalog"
+        )
+
+    def _get_vo_table_from_source(self):
+
+        rng = np.random.RandomState(1234)
+
+        ra = rng.uniform(0, 360, self._n_sources)
+        dec = np.rad2deg(np.arcsin(rng.uniform(-1, 1, self._n_sources)))
+
+        # one source without position
+
+        ra[0] = np.nan
+
+        names = ["SRC%05i" % i for i in range(self._n_sources)]
+
+        self._vo_dataframe = pd.DataFrame(
+            {"ra": ra, "dec": dec, "flux": rng.uniform(size=self._n_sources)},
+            index=pd.Index(names, name="name"),
+        )
+
+    def apply_format(self, table):
+
+        return table["name", "ra", "dec", "Search_Offset"]
+
+
+def test_local_cone_search():
+
+    catalog = _SyntheticCatalog(5000)
+
+    df = catalog._vo_dataframe
+
+    all_sources = SkyCoord(ra=df["ra"].values * u.deg, dec=df["dec"].values * u.deg)
+
+    for ra, dec, radius in [(0.0, 0.0, 10.0), (83.6, 22.0, 3.0), (10.0, 89.0, 5.0)]:
+
+        table = catalog.cone_search(ra, dec, radius)
+
+        assert catalog.ra_center == ra
+        assert catalog.dec_center == dec
+
+        separation = all_sources.separation(SkyCoord(ra=ra * u.deg, dec=dec * u.deg))
+
+        expected = set(df.index[separation.deg <= radius])
+
+        assert set(table["name"]) == expected
+        assert set(catalog.result.index) == expected
+
+        # sorted by distance, in arcmin
+
+        assert np.all(np.diff(table["Search_Offset"]) >= 0)
+
+        assert np.allclose(
+            np.sort(table["Search_Offset"]),
+            np.sort(separation.arcmin[separation.deg <= radius]),
+        )
+
+    # a radius larger than 180 deg returns everything with a position
+
+    table = catalog.cone_search(0.0, 0.0, 300.0)
+
+    assert len(table) == len(df) - 1
+
+
+def test_catalog_snapshot(tmpdir):
+
+    catalog = _SyntheticCatalog(100)
+
+    snapshot_file = str(tmpdir.join("snapshot"))
+
+    _write_snapshot(catalog._vo_dataframe, snapshot_file)
+
+    pd.testing.assert_frame_equal(_read_snapshot(snapshot_file), catalog._vo_dataframe)
+
+
+def test_heasarc_table_cache(tmpdir, monkeypatch):
+
+    # the cache lives in the home directory
+
+    monkeypatch.setenv("HOME", str(tmpdir))
+
+    votable_file = str(tmpdir.join("table.xml"))
+
+    votable.from_table(
+        Table({"name": ["GRB1", "GRB2"], "ra": [10.0, 20.0], "dec": [-5.0, 5.0]})
+    ).to_xml(votable_file)
+
+    downloads = []
+
+    def fake_urlretrieve(url, filename):
+
+        downloads.append(url)
+
+        with open(votable_file) as f:
+
+            content = f.read()
+
+        with open(filename, "w") as f:
+
+            f.write(content)
+
+    monkeypatch.setattr(heasarc_tables.urllib.request, "urlretrieve", fake_urlretrieve)
+
+    table = heasarc_tables.get_heasarc_table_as_pandas("testtable", cache_time_days=1)
+
+    assert list(table.index) == ["GRB1", "GRB2"]
+    assert len(downloads) == 1
+
+    # the cache is still valid
+
+    heasarc_tables.get_heasarc_table_as_pandas("testtable", cache_time_days=1)
+
+    assert len(downloads) == 1
+
+    # the validity of the cache is decided by the argument, not by the value used
+    # when the table was downloaded
+
+    heasarc_tables.get_heasarc_table_as_pandas("testtable", cache_time_days=0)
+
+    assert len(downloads) == 2
+
+    # the web cannot be reached (after writing part of the file): the last snapshot
+    # is used, without parsing the XML file again
+
+    def failing_urlretrieve(url, filename):
+
+        with open(filename, "w") as f:
+
+            f.write("<?xml")
+
+        raise IOError("No connection")
+
+    def failing_read(file_name):
+
+        raise AssertionError("The snapshot should have been used")
+
+    monkeypatch.setattr(
+        heasarc_tables.urllib.request, "urlretrieve", failing_urlretrieve
+    )
+    monkeypatch.setattr(heasarc_tables, "_read_votable_as_pandas", failing_read)
+
+    with pytest.warns(UserWarning, match="internet cannot be reached"):
+
+        offline_table = heasarc_tables.get_heasarc_table_as_pandas(
+            "testtable", update=True
+        )
+
+    pd.testing.assert_frame_equal(offline_table, table)
+
+
+def test_model_from_3fgl_within_radius():
+
+    rng = np.random.RandomState(42)
+
+    ra = rng.uniform(75, 95, 200)
+    dec = rng.uniform(12, 32, 200)
+
+    sources = [
+        PointSource("src%i" % i, ra=ra[i], dec=dec[i], spectral_shape=Powerlaw())
+        for i in range(200)
+    ]
+
+    for src in sources:
+
+        src.spectrum.main.shape.K.fix = True
+        src.spectrum.main.shape.index.fix = True
+
+    model = ModelFrom3FGL(83.6, 22.0, *sources)
+
+    distances = angular_distance(83.6, 22.0, ra, dec)
+
+    expected = ["src%i" % i for i in np.flatnonzero(distances <= 5.0)]
+
+    assert model.point_sources_within_radius(5.0) == expected
+
+    model.free_point_sources_within_radius(5.0)
+
+    assert len(model.free_parameters) == len(expected)
+
+    model.free_point_sources_within_radius(5.0, normalization_only=False)
+
+    # K, piv and index
+
+    assert len(model.free_parameters) == 3 * len(expected)
+
+    model.fix_point_sources_within_radius(3.0, normalization_only=False)
+
+    assert len(model.free_parameters) == 3 * np.sum(
+        (distances <= 5.0) & (distances > 3.0)
+    )
+
+    # the index is built once, and reused by the following queries
+
+    sky_index = model._get_sky_index()
+
+    model.point_sources_within_radius(1.0)
+
+    assert model._get_sky_index() is sky_index
+
+    # moving a source updates the index
+
+    model.point_sources["src0"].position.ra = 83.6
+    model.point_sources["src0"].position.dec = 22.0
+
+    assert "src0" in model.point_sources_within_radius(0.1)
+
+    # as adding and removing sources
+
+    model.add_source(
+        PointSource("new_src", ra=83.65, dec=22.0, spectral_shape=Powerlaw())
+    )
+
+    assert model.point_sources_within_radius(0.1) == ["src0", "new_src"]
+
+    model.remove_source("src0")
+
+    assert model.point_sources_within_radius(0.1) == ["new_src"]
+
+
 @skip_if_internet_is_not_available
 # @pytest.mark.xfail
 def test_gbm_catalog():
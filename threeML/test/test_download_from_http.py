@@ -0,0 +1,447 @@
+import gzip
+import hashlib
+import os
+import re
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from threeML.io.download_from_http import (
+    ApacheDirectory,
+    DownloadManager,
+    DownloadFailed,
+    HTTPError,
+)
+
+
+class _ApacheLikeHandler(SimpleHTTPRequestHandler):
+    """
+    A stand-in for the HEASARC server: Apache-like directory listings, range requests
+    (honoring If-Range), and (on demand) responses interrupted half way or files whose
+    content changed
+    """
+
+    requests_log = []
+    if_range_log = []
+    truncate_next = set()
+    changed_files = {}
+
+    def log_message(self, format, *args):
+
+        pass
+
+    def list_directory(self, path):
+
+        lines = []
+
+        for name in sorted(os.listdir(path)):
+
+            lines.append(
+                '<img src="/icons/unknown.gif" alt="[   ]"> <a href="%s">%s</a>'
+                "                16-Nov-2012 15:14   96K" % (name, name)
+            )
+
+        body = (
+            "<html><body><pre>\n%s\n</pre></body></html>\n" % "\n".join(lines)
+        ).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        self.wfile.write(body)
+
+        return None
+
+    def _serve_file(self, send_body):
+
+        path = self.translate_path(self.path)
+
+        if os.path.isdir(path):
+
+            if send_body:
+
+                self.list_directory(path)
+
+            else:
+
+                self.send_response(200)
+                self.end_headers()
+
+            return
+
+        if not os.path.exists(path):
+
+            self.send_error(404, "Not Found")
+
+            return
+
+        name = os.path.basename(path)
+
+        if name in self.changed_files:
+
+            data = self.changed_files[name]
+
+        else:
+
+            with open(path, "rb") as f:
+
+                data = f.read()
+
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+
+        self.requests_log.append((self.command, name, self.headers.get("Range")))
+
+        range_header = self.headers.get("Range")
+
+        if_range = self.headers.get("If-Range")
+
+        if if_range is not None:
+
+            self.if_range_log.append(if_range)
+
+            if if_range != etag:
+
+                # the client has a different version: send the whole file
+
+                range_header = None
+
+        if range_header is not None:
+
+            start = int(re.match(r"bytes=(\d+)-", range_header).group(1))
+
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", "bytes %i-%i/%i" % (start, len(data) - 1, len(data))
+            )
+
+            data = data[start:]
+
+        else:
+
+            self.send_response(200)
+
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+
+        if send_body:
+
+            if name in self.truncate_next and self.command == "GET":
+
+                # send only half of the file and drop the connection
+
+                self.truncate_next.discard(name)
+
+                self.wfile.write(data[: len(data) // 2])
+
+                self.close_connection = True
+
+            else:
+
+                self.wfile.write(data)
+
+    def do_GET(self):
+
+        self._serve_file(True)
+
+    def do_HEAD(self):
+
+        self._serve_file(False)
+
+
+@pytest.fixture(scope="module")
+def http_server(tmpdir_factory):
+
+    remote_dir = tmpdir_factory.mktemp("remote")
+
+    rng = np.random.RandomState(0)
+
+    contents = {}
+
+    for i in range(6):
+
+        name = "glg_tte_n%i_bn080916009_v00.fit" % i
+
+        contents[name] = rng.bytes(200000 + 1000 * i)
+
+        with open(str(remote_dir.join(name)), "wb") as f:
+
+            f.write(contents[name])
+
+    def handler(*args, **kwargs):
+
+        return _ApacheLikeHandler(*args, directory=str(remote_dir), **kwargs)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield "http://127.0.0.1:%i/" % server.server_address[1], contents
+
+    server.shutdown()
+    server.server_close()
+
+
+def _read(file_name):
+
+    with open(file_name, "rb") as f:
+
+        return f.read()
+
+
+def test_download_many(http_server, tmpdir):
+
+    url, contents = http_server
+
+    names = sorted(contents.keys())
+
+    manager = DownloadManager(n_connections=3)
+
+    compress = [False, True] + [False] * (len(names) - 2)
+
+    local_files = manager.download_many(
+        [url + x for x in names],
+        [str(tmpdir.join(x)) for x in names],
+        compress=compress,
+        progress=False,
+    )
+
+    assert local_files[1] == str(tmpdir.join(names[1])) + ".gz"
+
+    with gzip.open(local_files[1]) as f:
+
+        assert f.read() == contents[names[1]]
+
+    for i in [0] + list(range(2, len(names))):
+
+        assert _read(local_files[i]) == contents[names[i]]
+
+    # files already present are not downloaded again
+
+    _ApacheLikeHandler.requests_log[:] = []
+
+    manager.download_many(
+        [url + x for x in names],
+        [str(tmpdir.join(x)) for x in names],
+        compress=compress,
+        progress=False,
+    )
+
+    assert all(x[0] == "HEAD" for x in _ApacheLikeHandler.requests_log)
+
+
+def test_download_resume(http_server, tmpdir):
+
+    url, contents = http_server
+
+    name = sorted(contents.keys())[0]
+
+    local_file = str(tmpdir.join(name))
+
+    # a partial file left over by a previous session
+
+    _ApacheLikeHandler.truncate_next.add(name)
+
+    with pytest.raises(DownloadFailed):
+
+        DownloadManager(chunk_size=1000, max_retries=0).download(url + name, local_file)
+
+    offset = os.path.getsize(local_file + ".part")
+
+    assert 0 < offset <= len(contents[name]) // 2
+
+    _ApacheLikeHandler.requests_log[:] = []
+    _ApacheLikeHandler.if_range_log[:] = []
+
+    manager = DownloadManager()
+
+    assert manager.download(url + name, local_file) == local_file
+
+    assert _read(local_file) == contents[name]
+    assert not os.path.exists(local_file + ".part")
+    assert not os.path.exists(local_file + ".part.version")
+
+    assert ("GET", name, "bytes=%i-" % offset) in _ApacheLikeHandler.requests_log
+
+    # the version of the partial file is sent along with the range
+
+    assert _ApacheLikeHandler.if_range_log == [
+        '"%s"' % hashlib.md5(contents[name]).hexdigest()
+    ]
+
+    # an interrupted transfer is resumed
+
+    os.remove(local_file)
+
+    _ApacheLikeHandler.truncate_next.add(name)
+    _ApacheLikeHandler.requests_log[:] = []
+
+    # (small chunks, so that part of the data reaches the disk before the interruption)
+
+    DownloadManager(chunk_size=1000).download(url + name, local_file)
+
+    assert _read(local_file) == contents[name]
+
+    ranges = [x[2] for x in _ApacheLikeHandler.requests_log if x[0] == "GET"]
+
+    assert len(ranges) == 2 and ranges[0] is None
+
+    offset = int(re.match(r"bytes=(\d+)-", ranges[1]).group(1))
+
+    assert 0 < offset <= len(contents[name]) // 2
+
+
+def test_download_resume_changed_file(http_server, tmpdir):
+
+    url, contents = http_server
+
+    name = sorted(contents.keys())[1]
+
+    local_file = str(tmpdir.join(name))
+
+    _ApacheLikeHandler.truncate_next.add(name)
+
+    with pytest.raises(DownloadFailed):
+
+        DownloadManager(chunk_size=1000, max_retries=0).download(url + name, local_file)
+
+    assert os.path.exists(local_file + ".part")
+
+    # the remote file changes (with the same size) before the download is resumed
+
+    new_content = contents[name][::-1]
+
+    _ApacheLikeHandler.changed_files[name] = new_content
+
+    _ApacheLikeHandler.requests_log[:] = []
+
+    try:
+
+        DownloadManager().download(url + name, local_file)
+
+    finally:
+
+        _ApacheLikeHandler.changed_files.pop(name)
+
+    assert _read(local_file) == new_content
+
+    # the partial file was not completed with the new data
+
+    assert ("GET", name, None) in _ApacheLikeHandler.requests_log
+
+
+def test_download_checksum(http_server, tmpdir):
+
+    url, contents = http_server
+
+    name = sorted(contents.keys())[0]
+
+    local_file = str(tmpdir.join(name))
+
+    manager = DownloadManager()
+
+    good = "md5:%s" % hashlib.md5(contents[name]).hexdigest()
+
+    with pytest.raises(DownloadFailed):
+
+        manager.download(url + name, local_file, checksum="md5:%s" % ("0" * 32))
+
+    assert not os.path.exists(local_file)
+    assert not os.path.exists(local_file + ".part")
+
+    assert manager.download(url + name, local_file, checksum=good) == local_file
+
+
+def test_download_cache(http_server, tmpdir):
+
+    url, contents = http_server
+
+    names = sorted(contents.keys())[:3]
+
+    cache = str(tmpdir.join("cache"))
+
+    for i, destination in enumerate(["a", "b"]):
+
+        os.makedirs(str(tmpdir.join(destination)))
+
+        _ApacheLikeHandler.requests_log[:] = []
+
+        # a new manager every time, so that the index is read back from disk
+
+        local_files = DownloadManager(cache_directory=cache).download_many(
+            [url + x for x in names],
+            [str(tmpdir.join(destination, x)) for x in names],
+            progress=False,
+        )
+
+        for name, local_file in zip(names, local_files):
+
+            assert _read(local_file) == contents[name]
+
+        n_get = len([x for x in _ApacheLikeHandler.requests_log if x[0] == "GET"])
+
+        # the second time, the files come from the cache
+
+        assert n_get == (len(names) if i == 0 else 0)
+
+    digest = hashlib.sha256(contents[names[0]]).hexdigest()
+
+    assert os.path.exists(os.path.join(cache, digest[:2], digest))
+
+    # a failed download does not prevent the others from being added to the cache
+
+    other_cache = str(tmpdir.join("other_cache"))
+
+    os.makedirs(str(tmpdir.join("c")))
+    os.makedirs(str(tmpdir.join("d")))
+
+    with pytest.raises(HTTPError):
+
+        DownloadManager(cache_directory=other_cache).download_many(
+            [url + x for x in names] + [url + "not_existing.fit"],
+            [str(tmpdir.join("c", x)) for x in names + ["not_existing.fit"]],
+            progress=False,
+        )
+
+    _ApacheLikeHandler.requests_log[:] = []
+
+    DownloadManager(cache_directory=other_cache).download_many(
+        [url + x for x in names],
+        [str(tmpdir.join("d", x)) for x in names],
+        progress=False,
+    )
+
+    assert not any(x[0] == "GET" for x in _ApacheLikeHandler.requests_log)
+
+
+def test_apache_directory(http_server, tmpdir):
+
+    url, contents = http_server
+
+    directory = ApacheDirectory(url)
+
+    assert sorted(directory.files) == sorted(contents.keys())
+
+    local_files = directory.download_all_files(
+        str(tmpdir), progress=False, pattern=r"glg_tte_n[0-2]_.+"
+    )
+
+    assert len(local_files) == 3
+
+    for local_file in local_files:
+
+        assert _read(local_file) == contents[os.path.basename(local_file)]
+
+    name = sorted(contents.keys())[4]
+
+    local_file = directory.download(name, str(tmpdir), progress=False, compress=True)
+
+    with gzip.open(local_file) as f:
+
+        assert f.read() == contents[name]
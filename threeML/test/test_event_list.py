@@ -7,7 +7,11 @@ import pytest
 from .conftest import get_test_datasets_directory
 from threeML.io.file_utils import within_directory
 from threeML.utils.time_interval import TimeIntervalSet
-from threeML.utils.time_series.event_list import EventListWithDeadTime, EventList
+from threeML.utils.time_series.event_list import (
+    EventListWithDeadTime,
+    EventListWithLiveTime,
+    EventList,
+)
 
 __this_dir__ = os.path.join(os.path.abspath(os.path.dirname(__file__)))
 datasets_dir = get_test_datasets_directory()
@@ -128,3 +132,94 @@ def test_binned_fit():
         assert evt_list._poly_counts.sum() > 0
 
         evt_list.__repr__()
+
+
+def test_binned_fit_bin_width():
+
+    np.random.seed(1234)
+
+    # constant rate of 100 counts/s
+
+    arrival_times = np.sort(np.random.uniform(0, 100, 10000))
+
+    evt_list = EventListWithDeadTime(
+        arrival_times=arrival_times,
+        measurement=np.zeros_like(arrival_times),
+        n_channels=1,
+        start_time=0,
+        stop_time=100,
+        dead_time=np.zeros_like(arrival_times),
+    )
+
+    evt_list.poly_order = 0
+
+    for bin_width in [1.0, 5.0]:
+
+        evt_list.set_polynomial_fit_interval(
+            "0-100", unbinned=False, bin_width=bin_width
+        )
+
+        rate = evt_list.get_poly_info()["coefficients"].values[0, 0]
+
+        assert is_within_tolerance(100.0, rate, relative_tolerance=0.05)
+
+    with pytest.raises(AssertionError):
+
+        evt_list.set_polynomial_fit_interval("0-100", unbinned=False, bin_width=-1)
+
+
+def test_exposure_over_intervals():
+
+    arrival_times = np.linspace(0.05, 9.95, 100)
+
+    dead_time = np.full_like(arrival_times, 1e-3)
+
+    evt_list = EventListWithDeadTime(
+        arrival_times=arrival_times,
+        measurement=np.zeros_like(arrival_times),
+        n_channels=1,
+        start_time=0,
+        stop_time=10,
+        dead_time=dead_time,
+    )
+
+    starts = np.array([0.0, 2.0, 0.05, 20.0])
+    stops = np.array([10.0, 2.04, 0.15, 30.0])
+
+    exposures = evt_list.exposure_over_intervals(starts, stops)
+
+    # the events on the boundaries are included
+
+    assert np.allclose(exposures, [10.0 - 0.1, 0.04, 0.1 - 2e-3, 10.0])
+
+    assert evt_list.exposure_over_interval(0.0, 10.0) == pytest.approx(9.9)
+
+    # live time fractions of 1 s bins, with a gap between 5 and 6 s
+
+    live_time_starts = np.array([0.0, 1.0, 2.0, 3.0, 4.0, 6.0, 7.0, 8.0, 9.0])
+
+    live_time_stops = live_time_starts + 1
+
+    live_time = np.array([0.5, 0.5, 0.5, 0.5, 0.5, 0.8, 0.8, 0.8, 0.8])
+
+    evt_list = EventListWithLiveTime(
+        arrival_times=arrival_times,
+        measurement=np.zeros_like(arrival_times),
+        n_channels=1,
+        live_time=live_time,
+        live_time_starts=live_time_starts,
+        live_time_stops=live_time_stops,
+        start_time=0,
+        stop_time=10,
+    )
+
+    starts = np.array([0.0, 0.25, 1.0, 4.5, 5.2, -5.0])
+    stops = np.array([10.0, 0.5, 3.0, 6.5, 5.8, 0.5])
+
+    exposures = evt_list.exposure_over_intervals(starts, stops)
+
+    assert np.allclose(exposures, [5.7, 0.125, 1.0, 0.25 + 0.4, 0.0, 0.25])
+
+    for start, stop, exposure in zip(starts, stops, exposures):
+
+        assert evt_list.exposure_over_interval(start, stop) == pytest.approx(exposure)
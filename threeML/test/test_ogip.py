@@ -7,7 +7,9 @@ from threeML import *
 from threeML.io.file_utils import within_directory
 from threeML.plugins.OGIPLike import OGIPLike
 from threeML.plugins.SwiftXRTLike import SwiftXRTLike
+from threeML.utils.binner import NotEnoughData, Rebinner
 from threeML.utils.OGIP.response import OGIPResponse
+from threeML.utils.OGIP.pha import PHAWrite
 from threeML.utils.spectrum.pha_spectrum import PHASpectrum
 from threeML.utils.statistics.likelihood_functions import *
 
@@ -325,6 +327,132 @@ def test_ogip_rebinner():
         ogip.view_count_spectrum()
 
 
+def _rebin_element_by_element(vector, min_value, mask):
+
+    # Reference implementation: walk the vector, closing each bin as soon as
+    # its running total reaches min_value or the mask excludes an element
+
+    starts, stops = [], []
+    grouping = np.zeros_like(vector)
+
+    n = 0
+    n_grouped = 0
+    bin_open = False
+
+    for index, value in enumerate(vector):
+
+        if not mask[index]:
+
+            if bin_open:
+
+                stops.append(index)
+
+                if n_grouped > 1:
+
+                    grouping[index - n_grouped + 1 : index] = -1
+                    grouping[index] = 1
+
+                bin_open = False
+                n_grouped = 0
+
+            continue
+
+        if not bin_open:
+
+            starts.append(index)
+            bin_open = True
+            n = 0
+
+        n += value
+        n_grouped += 1
+
+        if n >= min_value:
+
+            stops.append(index + 1)
+
+            if n_grouped > 1:
+
+                grouping[index - n_grouped + 1 : index] = -1
+                grouping[index] = 1
+
+            bin_open = False
+            n_grouped = 0
+
+    if bin_open:
+
+        stops.append(len(vector))
+
+    return starts, stops, grouping
+
+
+def test_rebinner_matches_element_by_element_rebinning():
+
+    rng = np.random.RandomState(1234)
+
+    for trial in range(300):
+
+        n_elements = rng.randint(100, 400)
+
+        min_value = rng.uniform(5, 50)
+
+        if trial % 3 == 0:
+
+            vector = rng.poisson(rng.uniform(0.5, 20), size=n_elements)
+
+        elif trial % 3 == 1:
+
+            # the totals of the bins often land on min_value, up to rounding
+
+            vector = rng.randint(0, 30, size=n_elements) * 0.1
+
+            min_value = rng.randint(10, 100) * 0.1
+
+        else:
+
+            vector = rng.exponential(rng.uniform(0.5, 20), size=n_elements)
+
+            if trial % 6 == 2:
+
+                # negative values (e.g., background-subtracted rates)
+
+                vector -= rng.uniform(0, 5)
+
+        mask = rng.uniform(size=n_elements) > 0.1
+
+        if trial % 5 == 0:
+
+            # long bins
+
+            min_value *= 20
+
+        try:
+
+            rebinner = Rebinner(vector, min_value, mask)
+
+        except NotEnoughData:
+
+            continue
+
+        starts, stops, grouping = _rebin_element_by_element(vector, min_value, mask)
+
+        assert rebinner.n_bins == len(starts)
+
+        assert np.all(rebinner._starts == starts)
+        assert np.all(rebinner._stops == stops)
+        assert np.all(rebinner.grouping == grouping)
+
+        errors = rng.uniform(size=n_elements)
+
+        (rebinned,) = rebinner.rebin(vector)
+        (rebinned_errors,) = rebinner.rebin_errors(errors)
+
+        assert np.allclose(rebinned, [vector[a:b].sum() for a, b in zip(starts, stops)])
+        assert np.allclose(
+            rebinned_errors,
+            [np.sqrt(np.sum(errors[a:b] ** 2)) for a, b in zip(starts, stops)],
+        )
+
+
 def test_various_effective_area():
     with within_directory(__example_dir):
         ogip = OGIPLike("test_ogip", observation="test.pha{1}")
@@ -370,6 +498,16 @@ def test_simulating_data_sets():
         assert "bak" in pha_info
         assert "rsp" in pha_info
 
+        # the simulated spectra share the response and the channels of the original ones
+
+        assert isinstance(new_ogip.observed_spectrum, PHASpectrum)
+        assert new_ogip.response is ogip.response
+        assert new_ogip.observed_spectrum.edges is ogip.observed_spectrum.edges
+        assert new_ogip.background_spectrum.quality is ogip.background_spectrum.quality
+        assert new_ogip.background_spectrum.background_file is None
+        assert new_ogip.observed_spectrum.exposure == ogip.observed_spectrum.exposure
+        assert new_ogip.background_spectrum.exposure == ogip.observed_spectrum.exposure
+
         del ogip
         del new_ogip
 
@@ -515,6 +653,44 @@ def test_pha_write():
         assert pha_info["pha"].n_channels == len(pha_info["pha"].rates)
 
 
+def test_pha_write_shared_response():
+    with within_directory(__example_dir):
+
+        ogip = OGIPLike("test_ogip", observation="test.pha{1}")
+
+        # a different instance, with its own (but identical) response
+
+        other = OGIPLike("other_ogip", observation="test.pha{1}")
+
+        assert other.response is not ogip.response
+
+        # all the spectra go in the same file, and the identical responses are written once
+
+        PHAWrite(ogip, other, ogip).write(
+            "test_write_shared", overwrite=True, force_rsp_write=True
+        )
+
+        with fits.open("test_write_shared.rsp") as f:
+
+            # primary, EBOUNDS and one matrix
+            assert len(f) == 3
+
+        with fits.open("test_write_shared.pha") as f:
+
+            assert len(f["SPECTRUM"].data) == 3
+            assert (
+                list(f["SPECTRUM"].data["RESPFILE"]) == ["test_write_shared.rsp{1}"] * 3
+            )
+
+        written_ogip = OGIPLike("write_ogip", observation="test_write_shared.pha{2}")
+
+        assert np.allclose(written_ogip.response.matrix, ogip.response.matrix)
+
+        for ext in [".pha", ".rsp"]:
+
+            os.remove("test_write_shared%s" % ext)
+
+
 def test_pha_write_no_bkg():
     with within_directory(__example_dir):
 
@@ -1,5 +1,6 @@
 import numpy as np
 import os
+import shutil
 import pytest
 import warnings
 
@@ -8,8 +9,13 @@ from threeML.utils.OGIP.response import (
     InstrumentResponseSet,
     InstrumentResponse,
     OGIPResponse,
+    NoMatrixForInterval,
+    IntervalOfInterestNotCovered,
+    _decompress_ogip_matrix,
 )
+import astropy.io.fits as pyfits
 from threeML.utils.time_interval import TimeInterval
+from threeML.utils.spectrum.binned_spectrum import ChannelSet
 
 
 def get_matrix_elements():
@@ -138,6 +144,75 @@ def test_instrument_response_set_function_and_convolve():
 
     assert np.all(folded_counts == [1.0, 2.0, 3.0])
 
+    # only some of the channels, and summed over bins
+
+    assert np.all(rsp.convolve(channels=np.array([0, 2])) == [1.0, 3.0])
+
+    assert np.all(
+        rsp.convolve(channels=np.array([0, 1, 2]), bin_starts=np.array([0, 1]))
+        == [1.0, 5.0]
+    )
+
+    # the reduced matrices are cached until the matrix is replaced
+
+    reduced_matrix = rsp.get_reduced_matrix(np.array([0, 2]))
+
+    assert rsp.get_reduced_matrix(np.array([0, 2])) is reduced_matrix
+
+    rsp.replace_matrix(matrix * 2.0)
+
+    assert np.all(rsp.convolve(channels=np.array([0, 2])) == [2.0, 6.0])
+
+
+def test_instrument_response_clone():
+
+    matrix, mc_energies, ebounds = get_matrix_elements()
+
+    rsp = InstrumentResponse(matrix, ebounds, mc_energies)
+
+    clone = rsp.clone()
+
+    # the matrix and the channels are shared (and the matrix cannot be modified through the clone)
+
+    assert np.shares_memory(clone.matrix, rsp.matrix)
+    assert not clone.matrix.flags.writeable
+
+    with pytest.raises(ValueError):
+
+        clone.matrix[0, 0] = 2.0
+
+    # the original response is left untouched
+
+    assert rsp.matrix.flags.writeable
+
+    assert clone.clone().matrix.base is rsp.matrix
+
+    assert ChannelSet.from_instrument_response(
+        clone
+    ) is ChannelSet.from_instrument_response(rsp)
+
+    # but not the model
+
+    rsp.set_function(lambda e1, e2: e2 - e1)
+    clone.set_function(lambda e1, e2: 2 * (e2 - e1))
+
+    assert np.all(rsp.convolve() == [1.0, 2.0, 3.0])
+    assert np.all(clone.convolve() == [2.0, 4.0, 6.0])
+
+    # replacing the matrix does not affect the clones
+
+    clone.replace_matrix(matrix / 2.0)
+
+    assert np.all(rsp.matrix == matrix)
+
+    # the matrix of the original response can still be modified in place, and the change is seen
+    # by the clones
+
+    rsp.matrix[0, 0] = 0.5
+
+    assert rsp.matrix[0, 0] == 0.5
+    assert rsp.clone().matrix[0, 0] == 0.5
+
 
 def test__instrument_response_energy_to_channel():
 
@@ -170,6 +245,94 @@ def test_OGIP_response_first_channel():
     assert rsp.first_channel == 1
 
 
+def test_decompress_ogip_matrix():
+
+    rng = np.random.RandomState(0)
+
+    n_rows, n_channels, max_groups = 50, 40, 4
+
+    expected = np.zeros((n_rows, n_channels))
+
+    n_grp = rng.randint(0, max_groups + 1, n_rows)
+
+    f_chan = np.zeros((n_rows, max_groups), dtype=int)
+    n_chan = np.zeros((n_rows, max_groups), dtype=int)
+    values = []
+
+    for i in range(n_rows):
+
+        # non-overlapping groups of random size
+
+        edges = np.sort(rng.choice(n_channels + 1, 2 * n_grp[i], replace=False))
+
+        f_chan[i, : n_grp[i]] = edges[::2]
+        n_chan[i, : n_grp[i]] = edges[1::2] - edges[::2]
+
+        this_values = rng.uniform(size=n_chan[i].sum())
+
+        values.append(this_values)
+
+        expected[
+            i,
+            np.concatenate([np.arange(f, f + n) for f, n in zip(f_chan[i], n_chan[i])]),
+        ] = this_values
+
+    # fixed-width columns (padded)
+
+    width = max(len(x) for x in values) + 3
+
+    matrix = np.zeros((n_rows, width))
+
+    for i, this_values in enumerate(values):
+
+        matrix[i, : len(this_values)] = this_values
+
+    for this_matrix, this_f_chan, this_n_chan in [
+        (matrix, f_chan, n_chan),
+        # variable-length arrays
+        (
+            np.array(values + [None], dtype=object)[:-1],
+            np.array([x[:n] for x, n in zip(f_chan, n_grp)] + [None], dtype=object)[
+                :-1
+            ],
+            np.array([x[:n] for x, n in zip(n_chan, n_grp)] + [None], dtype=object)[
+                :-1
+            ],
+        ),
+    ]:
+
+        rows, columns, elements = _decompress_ogip_matrix(
+            n_grp, this_f_chan, this_n_chan, this_matrix
+        )
+
+        rsp = np.zeros((n_rows, n_channels))
+
+        rsp[rows, columns] = elements
+
+        assert np.array_equal(rsp, expected)
+
+
+def test_OGIP_response_sparse_matrix():
+
+    rsp_file = get_path_of_data_file("ogip_test_xmm_pn.rmf")
+
+    with warnings.catch_warnings():
+
+        warnings.simplefilter("ignore")
+
+        rsp = OGIPResponse(rsp_file)
+
+    with pyfits.open(rsp_file) as f:
+
+        sparse_matrix = rsp._read_matrix(
+            f["MATRIX"].data, f["MATRIX"].header, sparse=True
+        )
+
+    assert sparse_matrix.shape == rsp.matrix.shape
+
+    assert np.array_equal(sparse_matrix.toarray(), rsp.matrix)
+
+
 def test_OGIP_response_arf_rsp_accessors():
 
     # Then load rsp and arf in XSpec
@@ -303,6 +466,100 @@ def test_response_set_constructor():
         _ = InstrumentResponseSet([rsp_c, rsp_d], exposure_getter, counts_getter)
 
 
+def test_response_set_from_rsp2_file(tmpdir):
+
+    [_, _], exposure_getter, counts_getter = get_matrix_set_elements_with_coverage()
+
+    rsp2_file = get_path_of_data_file("ogip_test_gbm_b0.rsp2")
+
+    rsp_set = InstrumentResponseSet.from_rsp2_file(
+        rsp2_file, exposure_getter, counts_getter, half_shifted=False
+    )
+
+    # the matrices are the same we get reading the extensions one by one
+
+    single_responses = [OGIPResponse("%s{%i}" % (rsp2_file, i)) for i in range(1, 4)]
+
+    for rsp in rsp_set:
+
+        (this_rsp,) = [
+            x for x in single_responses if x.coverage_interval == rsp.coverage_interval
+        ]
+
+        assert np.array_equal(rsp.matrix, this_rsp.matrix)
+        assert np.array_equal(rsp.ebounds, this_rsp.ebounds)
+        assert np.array_equal(rsp.monte_carlo_energies, this_rsp.monte_carlo_energies)
+
+    # the energies are shared
+
+    assert rsp_set[0].ebounds is rsp_set[1].ebounds
+    assert rsp_set[0].monte_carlo_energies is rsp_set[1].monte_carlo_energies
+
+    # the second time, the matrices come from the cache
+
+    cache_directory = str(tmpdir.join("cache"))
+
+    for i in range(2):
+
+        cached_set = InstrumentResponseSet.from_rsp2_file(
+            rsp2_file, exposure_getter, counts_getter, cache_directory=cache_directory
+        )
+
+        assert len(os.listdir(cache_directory)) == 2
+
+        reference_set = InstrumentResponseSet.from_rsp2_file(
+            rsp2_file, exposure_getter, counts_getter
+        )
+
+        assert len(cached_set) == len(reference_set)
+
+        for rsp, reference in zip(cached_set, reference_set):
+
+            assert np.array_equal(rsp.matrix, reference.matrix)
+            assert np.array_equal(rsp.ebounds, reference.ebounds)
+            assert np.array_equal(
+                rsp.monte_carlo_energies, reference.monte_carlo_energies
+            )
+            assert rsp.coverage_interval == reference.coverage_interval
+            assert rsp.first_channel == reference.first_channel
+            assert rsp.rsp_filename == reference.rsp_filename
+
+        if i == 1:
+
+            # the cached matrices are memory-mapped, not copied, and form the stack of the set
+
+            stack = cached_set._get_matrix_stack()
+
+            assert isinstance(stack, np.memmap)
+
+            for j, rsp in enumerate(cached_set):
+
+                assert not rsp.matrix.flags.writeable
+                assert np.shares_memory(rsp.matrix, stack[j])
+
+    # the cache is keyed by the path, size and modification time of the file (which is not read)
+
+    copied_file = str(tmpdir.join("copy.rsp2"))
+
+    shutil.copy(rsp2_file, copied_file)
+
+    for i in range(2):
+
+        InstrumentResponseSet.from_rsp2_file(
+            copied_file, exposure_getter, counts_getter, cache_directory=cache_directory
+        )
+
+        assert len(os.listdir(cache_directory)) == 4
+
+    os.utime(copied_file, ns=(0, 0))
+
+    InstrumentResponseSet.from_rsp2_file(
+        copied_file, exposure_getter, counts_getter, cache_directory=cache_directory
+    )
+
+    assert len(os.listdir(cache_directory)) == 6
+
+
 def test_response_set_weighting():
 
     (
@@ -428,3 +685,97 @@ def test_response_set_weighting_with_disjoint_intervals():
     factor = 1.0 / (w1 + w2 + w3) * (w1 + w2 / 2.0 + w3 / 2.0)
 
     assert np.allclose(weighted_matrix.matrix, factor * rsp_a.matrix)
+
+
+def test_response_set_weighting_many():
+
+    ref_time = 123.456
+
+    (
+        [rsp_a, rsp_b],
+        exposure_getter,
+        counts_getter,
+    ) = get_matrix_set_elements_with_coverage(reference_time=ref_time)
+
+    rsp_set = InstrumentResponseSet(
+        [rsp_a, rsp_b], exposure_getter, counts_getter, reference_time=ref_time
+    )
+
+    selections = [
+        "0.0 - 30.0",
+        "5.0 - 25.0",
+        "12.0-28.0",
+        ["5.0 - 12.0", "25.0-28.0"],
+    ]
+
+    for many, single in [
+        (rsp_set.weight_by_counts_many, rsp_set.weight_by_counts),
+        (rsp_set.weight_by_exposure_many, rsp_set.weight_by_exposure),
+    ]:
+
+        weighted_matrices = many(selections)
+
+        assert len(weighted_matrices) == len(selections)
+
+        for selection, weighted_matrix in zip(selections, weighted_matrices):
+
+            if isinstance(selection, str):
+
+                selection = [selection]
+
+            expected = single(*selection)
+
+            assert np.allclose(weighted_matrix.matrix, expected.matrix)
+            assert np.array_equal(weighted_matrix.ebounds, expected.ebounds)
+
+    # The errors are the same as for a single interval
+
+    with pytest.raises(NoMatrixForInterval):
+
+        rsp_set.weight_by_counts_many(["0.0 - 10.0", "50.0-60.0"])
+
+    with pytest.raises(IntervalOfInterestNotCovered):
+
+        rsp_set.weight_by_counts_many(["-5.0 - 10.0"])
+
+
+def test_response_set_shared_matrices():
+
+    (
+        [rsp_a, rsp_b],
+        exposure_getter,
+        counts_getter,
+    ) = get_matrix_set_elements_with_coverage()
+
+    n_calls = [0]
+
+    def counting_counts_getter(t1, t2):
+
+        n_calls[0] += 1
+
+        return counts_getter(t1, t2)
+
+    rsp_set = InstrumentResponseSet(
+        [rsp_a, rsp_b], exposure_getter, counting_counts_getter
+    )
+
+    # intervals within the coverage of a single matrix get clones of the same response,
+    # without counting the events
+
+    first = rsp_set.weight_by_counts("1.0-2.0")
+    second = rsp_set.weight_by_counts("3.0-4.0")
+    many = rsp_set.weight_by_counts_many(["5.0-6.0", "12.0-15.0", "5.0-15.0"])
+
+    assert n_calls[0] == 2
+
+    assert first is not second
+    assert np.shares_memory(first.matrix, second.matrix)
+    assert np.shares_memory(many[0].matrix, first.matrix)
+
+    assert np.allclose(first.matrix, rsp_a.matrix)
+    assert np.allclose(many[1].matrix, rsp_b.matrix)
+
+    # an interval across two matrices gets its own matrix
+
+    assert not np.shares_memory(many[2].matrix, first.matrix)
+    assert not np.shares_memory(many[2].matrix, many[1].matrix)
@@ -227,12 +227,38 @@ def test_spectrum_clone():
         ebounds=ebounds,
         is_poisson=False,
     )
-    obs_spectrum.clone(
+    new_spectrum = obs_spectrum.clone(
         new_counts=np.zeros_like(obs_spectrum.counts),
         new_count_errors=np.zeros_like(obs_spectrum.counts),
     )
     obs_spectrum.clone()
 
+    # the clone has its own counts, but shares the boundaries and the quality
+
+    assert np.all(new_spectrum.counts == 0)
+    assert np.all(new_spectrum.count_errors == 0)
+    assert np.all(obs_spectrum.counts == 1)
+    assert np.all(obs_spectrum.count_errors == 1)
+
+    assert new_spectrum.edges is obs_spectrum.edges
+    assert new_spectrum.quality is obs_spectrum.quality
+
+    new_spectrum = obs_spectrum.clone(
+        new_counts=np.arange(len(ebounds)) * 2.0,
+        new_count_errors=np.ones(len(ebounds)),
+        new_exposure=2.0,
+        new_scale_factor=0.5,
+    )
+
+    assert np.allclose(new_spectrum.counts, np.arange(len(ebounds)) * 2.0)
+    assert np.allclose(new_spectrum.rates, np.arange(len(ebounds)))
+    assert np.allclose(new_spectrum.rate_errors, 0.5)
+    assert new_spectrum.exposure == 2.0
+    assert new_spectrum.scale_factor == 0.5
+
+    assert obs_spectrum.exposure == 1
+    assert obs_spectrum.scale_factor == 1.0
+
 
 def test_dispersion_spectrum_constructor(loaded_response):
 
@@ -334,8 +360,22 @@ def test_dispersion_spectrum_clone(loaded_response):
         counts=np.ones(128), exposure=1, response=rsp, is_poisson=True
     )
 
-    obs_spectrum.clone(
+    new_spectrum = obs_spectrum.clone(
         new_counts=np.zeros_like(obs_spectrum.counts), new_count_errors=None
     )
 
     obs_spectrum.clone()
+
+    assert isinstance(new_spectrum, BinnedSpectrumWithDispersion)
+
+    assert np.all(new_spectrum.counts == 0)
+    assert np.all(obs_spectrum.counts == 1)
+
+    assert new_spectrum.response is rsp
+    assert new_spectrum.edges is obs_spectrum.edges
+    assert new_spectrum.quality is obs_spectrum.quality
+
+    new_spectrum = obs_spectrum.clone(new_sys_errors=np.ones(128) * 0.1)
+
+    assert np.all(new_spectrum.sys_errors == 0.1)
+    assert np.all(obs_spectrum.sys_errors == 0)
@@ -6,6 +6,8 @@ from threeML import JointLikelihood, DataList
 from threeML.io.package_data import get_path_of_data_file
 from threeML.plugins.DispersionSpectrumLike import DispersionSpectrumLike
 from threeML.plugins.SpectrumLike import SpectrumLike
+from threeML.utils.binner import Rebinner
+from threeML.utils.statistics.stats_tools import Significance
 from threeML.utils.OGIP.response import OGIPResponse
 from threeML.exceptions.custom_exceptions import NegativeBackground
 import warnings
@@ -364,3 +366,232 @@ def test_all_statistics():
     spectrum_generator.set_model(model)
 
     spectrum_generator.get_log_like()
+
+
+def test_fit_view():
+
+    response = OGIPResponse(get_path_of_data_file("datasets/ogip_powerlaw.rsp"))
+
+    source_function = Powerlaw(K=1.0, index=-1.5, piv=100.0)
+
+    background_function = Powerlaw(K=1, index=-1.5, piv=100.0)
+
+    plugins = [
+        SpectrumLike.from_function(
+            "fake",
+            source_function=source_function,
+            background_function=background_function,
+            energy_min=np.logspace(1, 3, 51)[:-1],
+            energy_max=np.logspace(1, 3, 51)[1:],
+        ),
+        DispersionSpectrumLike.from_function(
+            "test",
+            source_function=source_function,
+            response=response,
+            background_function=background_function,
+        ),
+    ]
+
+    for plugin in plugins:
+
+        plugin.set_model(
+            Model(PointSource("mysource", 0, 0, spectral_shape=Powerlaw()))
+        )
+
+        exposure = plugin.observed_spectrum.exposure
+
+        # the model in the fit must be the full model, masked and rebinned
+
+        plugin.set_active_measurements("c3-c20", "c25-c40")
+
+        fit_view = plugin._get_fit_view()
+
+        assert np.all(fit_view.mask == plugin.mask)
+        assert fit_view.n_bins == plugin.mask.sum()
+
+        assert np.allclose(
+            plugin.get_model(), plugin._evaluate_model()[plugin.mask] * exposure
+        )
+
+        # the view is compiled only once
+
+        assert plugin._get_fit_view() is fit_view
+
+        plugin.rebin_on_background(50)
+
+        assert plugin._get_fit_view() is not fit_view
+
+        (expected,) = plugin._rebinner.rebin(plugin._evaluate_model() * exposure)
+
+        assert plugin.get_model().shape == plugin.current_observed_counts.shape
+        assert np.allclose(plugin.get_model(), expected)
+
+        plugin.remove_rebinning()
+
+        plugin.set_active_measurements("all")
+
+        assert np.allclose(plugin.get_model(), plugin._evaluate_model() * exposure)
+
+
+class _ScaledSpectrumLike(SpectrumLike):
+    def _evaluate_model(self):
+
+        return 2.0 * super(_ScaledSpectrumLike, self)._evaluate_model()
+
+
+class _ScaledDispersionSpectrumLike(DispersionSpectrumLike):
+    def _evaluate_model(self):
+
+        return 2.0 * super(_ScaledDispersionSpectrumLike, self)._evaluate_model()
+
+
+def test_fit_view_with_overridden_evaluate_model():
+
+    response = OGIPResponse(get_path_of_data_file("datasets/ogip_powerlaw.rsp"))
+
+    source_function = Powerlaw(K=1.0, index=-1.5, piv=100.0)
+
+    background_function = Powerlaw(K=1, index=-1.5, piv=100.0)
+
+    def get_plugins(spectrum_like_class, dispersion_spectrum_like_class):
+
+        np.random.seed(1234)
+
+        return [
+            spectrum_like_class.from_function(
+                "fake",
+                source_function=source_function,
+                background_function=background_function,
+                energy_min=np.logspace(1, 3, 51)[:-1],
+                energy_max=np.logspace(1, 3, 51)[1:],
+            ),
+            dispersion_spectrum_like_class.from_function(
+                "test",
+                source_function=source_function,
+                response=response,
+                background_function=background_function,
+            ),
+        ]
+
+    # plugins overriding only _evaluate_model use it in the fit
+
+    for plugin, scaled_plugin in zip(
+        get_plugins(SpectrumLike, DispersionSpectrumLike),
+        get_plugins(_ScaledSpectrumLike, _ScaledDispersionSpectrumLike),
+    ):
+
+        for this_plugin in [plugin, scaled_plugin]:
+
+            this_plugin.set_model(
+                Model(PointSource("mysource", 0, 0, spectral_shape=Powerlaw()))
+            )
+
+            this_plugin.set_active_measurements("c3-c20", "c25-c40")
+
+        assert np.allclose(scaled_plugin.get_model(), 2.0 * plugin.get_model())
+        assert np.allclose(
+            scaled_plugin._get_active_model_rate(),
+            2.0 * plugin._get_active_model_rate(),
+        )
+
+        # the likelihood uses the overridden model
+
+        log_like = scaled_plugin.get_log_like()
+
+        scaled_plugin._use_full_model = False
+
+        assert not np.isclose(scaled_plugin.get_log_like(), log_like)
+
+        scaled_plugin._use_full_model = True
+
+        scaled_plugin.rebin_on_background(50)
+
+        exposure = scaled_plugin.observed_spectrum.exposure
+
+        (expected,) = scaled_plugin._rebinner.rebin(
+            scaled_plugin._evaluate_model() * exposure
+        )
+
+        assert np.allclose(scaled_plugin.get_model(), expected)
+
+
+def test_spectrum_residuals():
+
+    source_function = Powerlaw(K=1.0, index=-1.5, piv=100.0)
+
+    background_function = Powerlaw(K=1, index=-1.5, piv=100.0)
+
+    plugin = SpectrumLike.from_function(
+        "fake",
+        source_function=source_function,
+        background_function=background_function,
+        energy_min=np.logspace(1, 3, 51)[:-1],
+        energy_max=np.logspace(1, 3, 51)[1:],
+    )
+
+    plugin.set_model(Model(PointSource("mysource", 0, 0, spectral_shape=Powerlaw())))
+
+    plugin.set_active_measurements("c3-c20", "c25-c40")
+
+    model_counts = plugin.get_model()
+
+    # the model of the last evaluation of the likelihood is reused by the displays
+
+    last_model_rate = plugin._last_model_evaluation[2]
+
+    plugin._evaluate_fit_view_model = None
+
+    assert np.allclose(
+        plugin._get_active_model_rate() * plugin.observed_spectrum.exposure,
+        model_counts,
+    )
+
+    del plugin._evaluate_fit_view_model
+
+    # but not if the parameters changed
+
+    plugin._like_model.mysource.spectrum.main.Powerlaw.K = 2.0
+
+    assert np.allclose(plugin._get_active_model_rate(), 2 * last_model_rate)
+
+    # the residuals are the same computed channel by channel with the significance
+
+    quantities = plugin._construct_counts_arrays(1e-99, False)
+
+    significance_calc = Significance(
+        plugin.current_observed_counts,
+        plugin.current_background_counts + 2 * model_counts / plugin.scale_factor,
+        min([plugin.scale_factor, 1.0]),
+    )
+
+    assert np.allclose(quantities["residuals"], significance_calc.li_and_ma())
+
+    assert np.allclose(quantities["new_model_rate"], 2 * last_model_rate,)
+
+    assert np.all(np.isnan(quantities["expected_model_rate"][~plugin.mask]))
+
+    assert np.allclose(
+        plugin.significance_per_channel,
+        Significance(
+            plugin.current_observed_counts,
+            plugin.current_background_counts,
+            plugin.scale_factor,
+        ).li_and_ma(),
+    )
+
+    # and rebinned
+
+    quantities = plugin._construct_counts_arrays(5.0, True)
+
+    this_rebinner = Rebinner(plugin.source_rate, 5.0, plugin.mask)
+
+    observed_counts, model_counts = this_rebinner.rebin(
+        plugin.observed_counts, plugin._evaluate_model() * plugin.exposure
+    )
+
+    assert np.allclose(
+        quantities["residuals"], (observed_counts - model_counts) / model_counts
+    )
+
+    assert np.all(quantities["delta_energy"][0] >= 0)
+    assert np.all(quantities["delta_energy"][1] >= 0)
@@ -1,5 +1,6 @@
 from __future__ import print_function
 from builtins import zip
+import numpy as np
 import pytest
 
 from threeML.utils.time_interval import TimeInterval, TimeIntervalSet
@@ -474,3 +475,64 @@ def test_time_edges():
         ts1 = TimeIntervalSet([t1, t2, t3])
 
         _ = ts1.time_edges
+
+
+def test_time_interval_set_intersect():
+
+    ts1 = TimeIntervalSet.from_starts_and_stops([0.0, 10.0, 20.0], [5.0, 15.0, 30.0])
+    ts2 = TimeIntervalSet.from_starts_and_stops([2.0, 12.0, 15.0], [12.0, 13.0, 25.0])
+
+    intersection = ts1.intersect(ts2)
+
+    assert isinstance(intersection, TimeIntervalSet)
+
+    assert list(intersection.starts) == [2.0, 10.0, 12.0, 20.0]
+    assert list(intersection.stops) == [5.0, 12.0, 13.0, 25.0]
+
+    # touching intervals do not intersect
+
+    ts3 = TimeIntervalSet.from_starts_and_stops([5.0], [10.0])
+
+    assert len(ts1.intersect(ts3)) == 0
+
+
+def test_large_time_interval_set():
+
+    n_intervals = 100000
+
+    edges = np.linspace(0, 1000.0, n_intervals + 1)
+
+    ts = TimeIntervalSet.from_list_of_edges(edges)
+
+    assert len(ts) == n_intervals
+    assert ts.is_sorted
+    assert ts.is_contiguous()
+    assert np.allclose(ts.time_edges, edges)
+    assert np.allclose(ts.mid_points, 0.5 * (edges[1:] + edges[:-1]))
+
+    assert isinstance(ts[10], TimeInterval)
+    assert ts[10] == TimeInterval(edges[10], edges[11])
+
+    assert ts.containing_bin(500.005) == n_intervals // 2
+
+    mask = ts.containing_interval(0, 1.0, as_mask=True)
+
+    assert mask.sum() == 100
+
+    # shuffled and overlapping intervals merge back into a single one
+
+    order = np.random.permutation(n_intervals)
+
+    shuffled = TimeIntervalSet.from_starts_and_stops(
+        ts.starts[order], ts.stops[order] + 0.001
+    )
+
+    assert not shuffled.is_sorted
+
+    assert np.all(shuffled.sort().start_times == ts.start_times)
+
+    merged = shuffled.merge_intersecting_intervals()
+
+    assert len(merged) == 1
+    assert merged[0].start_time == 0.0
+    assert merged[0].stop_time == 1000.001
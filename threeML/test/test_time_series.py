@@ -4,7 +4,13 @@ import numpy as np
 import pytest
 from threeML.io.file_utils import within_directory
 from threeML.utils.time_interval import TimeIntervalSet
+from threeML.utils.binner import TemporalBinner
+from threeML.utils.statistics.stats_tools import Significance
+from threeML.utils.time_series.polynomial import Polynomial
 from threeML.utils.time_series.event_list import EventListWithDeadTime, EventList
+from threeML.utils.time_series.binned_spectrum_series import BinnedSpectrumSeries
+from threeML.exceptions.custom_exceptions import NegativeBackground
+from threeML.utils.spectrum.pha_spectrum import PHASpectrumSet
 from threeML.utils.data_builders.time_series_builder import TimeSeriesBuilder
 from threeML.io.file_utils import within_directory
 from threeML.plugins.DispersionSpectrumLike import DispersionSpectrumLike
@@ -54,6 +60,42 @@ def test_event_list_constructor():
     assert evt_list._mission == "UNKNOWN"
 
 
+def test_count_per_channel_over_intervals():
+
+    np.random.seed(1234)
+
+    arrival_times = np.random.uniform(0, 10, 1000)
+    measurement = np.random.randint(1, 5, 1000)
+
+    evt_list = EventListWithDeadTime(
+        arrival_times=arrival_times,
+        measurement=measurement,
+        n_channels=4,
+        start_time=0,
+        stop_time=10,
+        dead_time=np.zeros_like(arrival_times),
+        first_channel=1,
+    )
+
+    # overlapping, touching and empty intervals
+
+    starts = np.array([0.0, 1.0, 2.5, 0.0, 7.0, 20.0])
+    stops = np.array([1.0, 2.5, 6.0, 10.0, 7.5, 30.0])
+
+    counts = evt_list.count_per_channel_over_intervals(starts, stops)
+
+    assert counts.shape == (6, 4)
+
+    for i in range(len(starts)):
+
+        assert np.all(
+            counts[i] == evt_list.count_per_channel_over_interval(starts[i], stops[i])
+        )
+
+    assert counts[3].sum() == 1000
+    assert counts[5].sum() == 0
+
+
 def test_unbinned_fit():
     with within_directory(datasets_directory):
         start, stop = 0, 50
@@ -118,6 +160,92 @@ def test_binned_fit():
         evt_list.__repr__()
 
 
+def test_significance_binning():
+
+    np.random.seed(1234)
+
+    # two detectors with a constant background and a burst between 10 and 20 s
+
+    arrival_times = []
+    polynomials = []
+
+    for rate in [50.0, 80.0]:
+
+        background = np.random.uniform(0, 50, np.random.poisson(rate * 50))
+        burst = np.random.uniform(10, 20, np.random.poisson(rate * 5))
+
+        arrival_times.append(np.sort(np.concatenate((background, burst))))
+
+        polynomials.append(
+            Polynomial.from_previous_fit([rate, 0.0], np.diag([rate / 50.0, 0.0]))
+        )
+
+    bins = TemporalBinner.bin_by_significance(
+        arrival_times[0],
+        polynomials[0].integral,
+        background_error_getter=polynomials[0].integral_error,
+        sigma_level=5,
+        min_counts=10,
+    )
+
+    assert bins.is_contiguous() and bins.is_sorted
+
+    # every bin reaches the requested significance
+
+    for interval in bins:
+
+        counts = np.sum(
+            (arrival_times[0] >= interval.start_time)
+            & (arrival_times[0] <= interval.stop_time)
+        )
+
+        background = polynomials[0].integral(interval.start_time, interval.stop_time)
+        background_error = polynomials[0].integral_error(
+            interval.start_time, interval.stop_time
+        )
+
+        sig = Significance(counts, background)
+
+        sigma = sig.li_and_ma_equivalent_for_gaussian_background(background_error)[0]
+
+        assert sigma >= 5
+        assert counts >= 10
+
+    # binning jointly two detectors is the same as binning the summed events with
+    # the summed background
+
+    joint_bins = TemporalBinner.bin_by_significance(
+        arrival_times,
+        [p.integral for p in polynomials],
+        background_error_getter=[p.integral_error for p in polynomials],
+        sigma_level=5,
+        min_counts=10,
+    )
+
+    total_polynomial = polynomials[0] + polynomials[1]
+
+    summed_bins = TemporalBinner.bin_by_significance(
+        np.sort(np.concatenate(arrival_times)),
+        total_polynomial.integral,
+        background_error_getter=total_polynomial.integral_error,
+        sigma_level=5,
+        min_counts=10,
+    )
+
+    assert joint_bins == summed_bins
+
+    assert len(joint_bins) > len(bins)
+
+    # nothing can reach such a significance
+
+    assert (
+        TemporalBinner.bin_by_significance(
+            arrival_times[0], polynomials[0].integral, sigma_level=1000
+        )
+        is None
+    )
+
+
 def test_read_gbm_cspec():
     with within_directory(datasets_directory):
         data_dir = os.path.join("gbm", "bn080916009")
@@ -154,6 +282,88 @@ def test_read_gbm_cspec():
         nai3.write_pha_from_binner("test_from_nai3", start=0, stop=2, overwrite=True)
 
 
+def test_pha2_spectrum_set_columns():
+    with within_directory(datasets_directory):
+        data_dir = os.path.join("gbm", "bn080916009")
+
+        pha_file = os.path.join(data_dir, "glg_cspec_n3_bn080916009_v01.pha")
+        rsp_file = os.path.join(data_dir, "glg_cspec_n3_bn080916009_v00.rsp2")
+
+        spectrum_set = PHASpectrumSet(pha_file, rsp_file=rsp_file)
+        mapped_set = PHASpectrumSet(pha_file, rsp_file=rsp_file, memory_map=True)
+
+        with fits.open(pha_file) as f:
+
+            counts = np.array(f["SPECTRUM"].data["COUNTS"], dtype=float)
+            exposure = np.array(f["SPECTRUM"].data["EXPOSURE"], dtype=float)
+
+        # the counts are kept as a single array and the spectra are built only when needed
+
+        assert spectrum_set.counts_per_bin.shape == counts.shape
+        assert np.array_equal(spectrum_set.counts_per_bin, counts)
+        assert np.array_equal(mapped_set.counts_per_bin, counts)
+        assert np.array_equal(spectrum_set.exposure_per_bin, exposure)
+        assert spectrum_set.n_channels == counts.shape[1]
+
+        assert len(spectrum_set._binned_spectrum_list._spectra) == 0
+
+        assert np.array_equal(spectrum_set[10].counts, counts[10])
+        assert spectrum_set[10].exposure == exposure[10]
+
+        assert len(spectrum_set._binned_spectrum_list._spectra) == 1
+
+        # selections
+
+        series = BinnedSpectrumSeries(spectrum_set, first_channel=0, verbose=False)
+
+        mask = spectrum_set.time_intervals.containing_interval(0.0, 10.0, as_mask=True)
+
+        assert series.counts_over_interval(0.0, 10.0) == counts[mask].sum()
+        assert np.array_equal(
+            series.count_per_channel_over_interval(0.0, 10.0), counts[mask].sum(axis=0)
+        )
+
+        series.set_active_time_intervals("0-1", "5-10")
+
+        time_intervals = series.time_intervals
+
+        selected = np.zeros(len(counts), dtype=bool)
+
+        for interval in time_intervals:
+
+            selected |= spectrum_set.time_intervals.containing_interval(
+                interval.start_time, interval.stop_time, as_mask=True
+            )
+
+        assert np.array_equal(series._counts, counts[selected].sum(axis=0))
+        assert np.isclose(series._exposure, exposure[selected].sum())
+
+        # the bins of each interval, in the order of the intervals
+
+        idx = series._select_bins_of_intervals(
+            TimeIntervalSet.from_strings("5-10", "0-1")
+        )
+
+        assert np.array_equal(
+            idx,
+            np.concatenate(
+                [
+                    np.flatnonzero(
+                        spectrum_set.time_intervals.containing_interval(
+                            start, stop, as_mask=True
+                        )
+                    )
+                    for start, stop in [(5.0, 10.0), (0.0, 1.0)]
+                ]
+            ),
+        )
+
+        empty_idx = series._select_bins_of_intervals(TimeIntervalSet())
+
+        assert empty_idx.dtype.kind == "i"
+        assert empty_idx.size == 0
+
+
 def test_read_gbm_tte():
     with within_directory(datasets_directory):
         data_dir = os.path.join("gbm", "bn080916009")
@@ -214,6 +424,86 @@ def test_read_gbm_tte():
 
         assert len(nai3.bins) == 10
 
+        # the spectra of all the bins are computed at once
+
+        plugins = nai3.to_spectrumlike(from_bins=True)
+
+        lazy_plugins = nai3.to_spectrumlike(from_bins=True, lazy=True)
+
+        assert len(plugins) == len(lazy_plugins) == 10
+
+        for i, interval in enumerate(nai3.bins):
+
+            observed_counts = nai3._time_series.count_per_channel_over_interval(
+                interval.start_time, interval.stop_time
+            )
+
+            assert np.allclose(plugins[i].observed_spectrum.counts, observed_counts)
+            assert np.allclose(
+                lazy_plugins[i].observed_spectrum.counts, observed_counts
+            )
+
+            assert plugins[i].name == "NAI3_interval%d" % i
+
+            assert np.allclose(
+                plugins[i].background_spectrum.counts,
+                lazy_plugins[i].background_spectrum.counts,
+            )
+
+        # a bin with a negative background is skipped in the same way by both modes
+
+        time_series = nai3._time_series
+
+        get_information_dicts = time_series.get_information_dicts
+
+        def get_information_dicts_with_negative_background(*args, **kwargs):
+
+            information_dicts = get_information_dicts(*args, **kwargs)
+
+            if "use_poly" in kwargs:
+
+                information_dicts[3] = dict(information_dicts[3])
+                information_dicts[3]["counts"] = -np.ones_like(
+                    information_dicts[3]["counts"]
+                )
+
+            return information_dicts
+
+        time_series.get_information_dicts = (
+            get_information_dicts_with_negative_background
+        )
+
+        try:
+
+            with pytest.warns(UserWarning, match="skipping"):
+
+                plugins = nai3.to_spectrumlike(from_bins=True)
+
+            with pytest.warns(UserWarning, match="skipping"):
+
+                lazy_plugins = nai3.to_spectrumlike(from_bins=True, lazy=True)
+
+            assert len(plugins) == len(lazy_plugins) == 9
+
+            expected_names = ["NAI3_interval%d" % i for i in range(10) if i != 3]
+
+            assert [x.name for x in plugins] == expected_names
+            assert [x.name for x in lazy_plugins] == expected_names
+
+            # the bad bin would have raised when built
+
+            with pytest.raises(NegativeBackground):
+
+                nai3._get_bin_plugin_factory(nai3.bins, "_interval", False)[0](3)
+
+        finally:
+
+            del time_series.get_information_dicts
+
+        # the active interval is left untouched
+
+        assert nai3._active_interval == ("0-1",)
+
         assert nai3.bins.argsort() == list(range(len(nai3.bins)))
 
         nai3.create_time_bins(start=0, stop=10, method="bayesblocks", p0=0.1)
@@ -238,8 +528,13 @@ def test_reading_of_written_pha():
         # check the number of items written
 
         with fits.open("test_from_nai3.rsp") as f:
-            # 2 ext + 5 rsp ext
-            assert len(f) == 7
+            # 2 ext + 1 rsp ext: the 5 spectra are all within the same matrix
+            # of the RSP2, so the response is written only once
+            assert len(f) == 3
+
+        with fits.open("test_from_nai3.pha") as f:
+
+            assert list(f["SPECTRUM"].data["RESPFILE"]) == ["test_from_nai3.rsp{1}"] * 5
 
         # make sure we can read spectrum number
 
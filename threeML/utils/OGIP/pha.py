@@ -1,6 +1,7 @@
 from builtins import object
 import astropy.io.fits as fits
 import astropy.units as u
+import hashlib
 import numpy as np
 import os
 import warnings
@@ -17,8 +18,12 @@ class PHAWrite(object):
          in general can be used to save an entire series of OGIPLikes to PHAs which can be used for time-resolved style
          plugins. An example implentation is given in FermiGBMTTELike.
 
+        All the spectra are written in a single PHA Type II file (plus one for the backgrounds, if needed). Any
+        DispersionSpectrumLike plugin can be written (not only OGIPLike), and responses which have to be written
+        are written only once even if they are shared by several spectra.
 
-        :param ogiplike: OGIPLike plugin(s) to be written to disk
+
+        :param ogiplike: OGIPLike (or DispersionSpectrumLike) plugin(s) to be written to disk
         """
 
         self._ogiplike = ogiplike
@@ -84,12 +89,48 @@ class PHAWrite(object):
 
         self._out_rsp = []
 
+        # index of each response in the output RSP file, keyed by their content
+
+        self._out_rsp_index = {}
+
         for ogip in self._ogiplike:
 
             self._append_ogip(ogip, force_rsp_write)
 
         self._write_phaII(overwrite)
 
+    @staticmethod
+    def _get_response_key(rsp):
+
+        # two responses are the same if they have the same matrix and energy bounds
+
+        digest = hashlib.sha1()
+
+        for array in (rsp.matrix, rsp.ebounds, rsp.monte_carlo_energies):
+
+            digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+
+        return digest.hexdigest()
+
+    def _get_response_number(self, rsp):
+        """
+        Return the number of the extension of the output RSP file containing the response, adding the response
+        to the list of those to be written if it is not there yet
+
+        :param rsp: an InstrumentResponse instance
+        :return: the extension number (starting from 1)
+        """
+
+        key = self._get_response_key(rsp)
+
+        if key not in self._out_rsp_index:
+
+            self._out_rsp.append(rsp)
+
+            self._out_rsp_index[key] = len(self._out_rsp)
+
+        return self._out_rsp_index[key]
+
     def _append_ogip(self, ogip, force_rsp_write):
         """
         Add an ogip instance's data into the data list
@@ -104,15 +145,29 @@ class PHAWrite(object):
 
         first_channel = pha_info["rsp"].first_channel
 
+        # OGIPLike instances keep the grouping of the spectrum, other plugins use all the channels
+
+        grouping = getattr(ogip, "grouping", None)
+
+        if grouping is None:
+
+            grouping = np.ones(pha_info["pha"].n_channels)
+
+        quality = ogip.quality.to_ogip()
+
+        rsp_number = None
+
         for key in ["pha", "bak"]:
             if key not in pha_info:
                 continue
 
             if key == "pha" and "bak" in pha_info:
 
-                if pha_info[key].background_file is not None:
+                background_file = getattr(pha_info[key], "background_file", None)
 
-                    self._backfile[key].append(pha_info[key].background_file)
+                if background_file is not None:
+
+                    self._backfile[key].append(background_file)
 
                 else:
 
@@ -128,9 +183,11 @@ class PHAWrite(object):
 
                 self._backfile[key] = None
 
-            if pha_info[key].ancillary_file is not None:
+            ancillary_file = getattr(pha_info[key], "ancillary_file", None)
+
+            if ancillary_file is not None:
 
-                self._ancrfile[key].append(pha_info[key].ancillary_file)
+                self._ancrfile[key].append(ancillary_file)
 
             else:
 
@@ -146,19 +203,17 @@ class PHAWrite(object):
 
                 # This will be reached in the case that a response was generated from a plugin
                 # e.g. if we want to use weighted DRMs from GBM.
+                # Identical responses are written only once
 
-                rsp_file_name = "%s.rsp{%d}" % (
-                    self._outfile_basename,
-                    self._spec_iterator,
-                )
+                if rsp_number is None:
 
-                self._respfile[key].append(rsp_file_name)
+                    rsp_number = self._get_response_number(pha_info["rsp"])
 
-                if key == "pha":
+                rsp_file_name = "%s.rsp{%d}" % (self._outfile_basename, rsp_number,)
 
-                    self._out_rsp.append(pha_info["rsp"])
+                self._respfile[key].append(rsp_file_name)
 
-            self._rate[key].append(pha_info[key].rates.tolist())
+            self._rate[key].append(pha_info[key].rates)
 
             self._backscal[key].append(pha_info[key].scale_factor)
 
@@ -166,7 +221,7 @@ class PHAWrite(object):
 
                 self._is_poisson[key] = pha_info[key].is_poisson
 
-                self._stat_err[key].append(pha_info[key].rate_errors.tolist())
+                self._stat_err[key].append(pha_info[key].rate_errors)
 
             else:
 
@@ -177,21 +232,19 @@ class PHAWrite(object):
             # simply adds systematic in quadrature to statistical
             # error.
 
-            if (
-                pha_info[key].sys_errors.tolist() is not None
-            ):  # It returns an array which does not work!
+            if pha_info[key].sys_errors is not None:
 
-                self._sys_err[key].append(pha_info[key].sys_errors.tolist())
+                self._sys_err[key].append(pha_info[key].sys_errors)
 
             else:
 
                 self._sys_err[key].append(
-                    np.zeros_like(pha_info[key].rates, dtype=np.float32).tolist()
+                    np.zeros_like(pha_info[key].rates, dtype=np.float32)
                 )
 
             self._exposure[key].append(pha_info[key].exposure)
-            self._quality[key].append(ogip.quality.to_ogip().tolist())
-            self._grouping[key].append(ogip.grouping.tolist())
+            self._quality[key].append(quality)
+            self._grouping[key].append(grouping)
             self._channel[key].append(
                 np.arange(pha_info[key].n_channels, dtype=np.int32) + first_channel
             )
@@ -10,10 +10,13 @@ import warnings
 import matplotlib.cm as cm
 from matplotlib.colors import SymLogNorm
 import matplotlib.pyplot as plt
-from operator import itemgetter, attrgetter
+from operator import itemgetter
 import copy
 
 import astropy.units as u
+import scipy.sparse
+import hashlib
+import os
 
 from threeML.io.file_utils import file_existing_and_readable, sanitize_filename
 from threeML.io.fits_file import FITSExtension, FITSFile
@@ -41,6 +44,93 @@ class GapInCoverageIntervals(RuntimeError):
     pass
 
 
+def _column_to_2d(column, n_rows):
+    """
+    Return a fixed-width column of a FITS table as a 2d array with one row per table row (scalar columns become
+    a single column, and the spurious trailing dimensions of some files are removed). Variable-length array
+    columns (dtype object) are returned as they are.
+    """
+
+    if column.dtype == np.object:
+
+        return column
+
+    return np.asarray(column).reshape(n_rows, -1)
+
+
+def _first_elements(column, n_elements):
+    """
+    Concatenate the first n_elements[i] elements of each row of a (fixed-width or variable-length) column
+
+    :param column: the column, as returned by _column_to_2d
+    :param n_elements: number of elements to take from each row
+    :return: a 1d array
+    """
+
+    if column.dtype == np.object:
+
+        # variable-length arrays: one (cheap) slice per row
+
+        return np.concatenate(
+            [row[:n] for row, n in zip(column, n_elements)] + [np.zeros(0, dtype=float)]
+        )
+
+    # fixed-width arrays: the elements to keep form a "staircase" mask. The flattening is in row order,
+    # i.e., the same order of the groups and elements in the file
+
+    mask = np.arange(column.shape[1]) < np.asarray(n_elements)[:, np.newaxis]
+
+    return column[mask]
+
+
+def _decompress_ogip_matrix(n_grp, f_chan, n_chan, matrix):
+    """
+    Expand the compressed representation of an OGIP response matrix (N_GRP, F_CHAN, N_CHAN and MATRIX columns).
+    All the groups of all the rows are processed at once.
+
+    :param n_grp: the N_GRP column (number of groups in each row)
+    :param f_chan: the F_CHAN column (first channel of each group, already offset so that the first channel is 0)
+    :param n_chan: the N_CHAN column (number of channels in each group)
+    :param matrix: the MATRIX column
+    :return: (rows, columns, values) of the non-compressed elements, as 1d arrays (rows refer to the rows of the
+    table, i.e., the Monte Carlo energies, and columns to the channels)
+    """
+
+    n_rows = len(n_grp)
+
+    n_grp = np.asarray(n_grp).reshape(n_rows).astype(np.int64)
+
+    f_chan = _column_to_2d(f_chan, n_rows)
+    n_chan = _column_to_2d(n_chan, n_rows)
+    matrix = _column_to_2d(matrix, n_rows)
+
+    # First and size of all the groups, flattened
+
+    group_f_chan = _first_elements(f_chan, n_grp).astype(np.int64)
+    group_n_chan = _first_elements(n_chan, n_grp).astype(np.int64)
+
+    group_row = np.repeat(np.arange(n_rows), n_grp)
+
+    # Number of matrix elements used by each row
+
+    elements_per_row = np.bincount(group_row, weights=group_n_chan, minlength=n_rows)
+
+    values = _first_elements(matrix, elements_per_row.astype(np.int64)).astype(float)
+
+    # Each group of n channels starting at f covers the columns f, f + 1, ..., f + n - 1. The position of
+    # each element within its group is its position in the flattened array minus the start of the group
+
+    group_start = np.cumsum(group_n_chan) - group_n_chan
+
+    rows = np.repeat(group_row, group_n_chan)
+
+    columns = np.repeat(group_f_chan - group_start, group_n_chan) + np.arange(
+        group_n_chan.sum()
+    )
+
+    return rows, columns, values
+
+
 class InstrumentResponse(object):
     def __init__(self, matrix, ebounds, monte_carlo_energies, coverage_interval=None):
         """
@@ -63,19 +153,38 @@ class InstrumentResponse(object):
         :type coverage_interval: TimeInterval
         """
 
-        # we simply store all the variables to the class
+        # we simply store all the variables to the class. A read-only matrix (for example memory-mapped from
+        # a cache) cannot be modified through this response, so it is not copied
+
+        if (
+            isinstance(matrix, np.ndarray)
+            and matrix.dtype == np.float64
+            and not matrix.flags.writeable
+        ):
+
+            self._matrix = np.asarray(matrix)
+
+        else:
 
-        self._matrix = np.array(matrix, float)
+            self._matrix = np.array(matrix, float)
 
         # Make sure there are no nans or inf
         assert np.all(np.isfinite(self._matrix)), "Infinity or nan in matrix"
 
-        self._ebounds = np.array(ebounds, float)
+        # NOTE: the ebounds and the Monte Carlo energies are not copied, so that they can be shared among the
+        # responses of a set (they are never modified)
 
-        self._mc_energies = np.array(monte_carlo_energies)
+        self._ebounds = np.asarray(ebounds, float)
+
+        self._mc_energies = np.asarray(monte_carlo_energies)
 
         self._integral_function = None
 
+        # quantities derived from the matrix and the energies, computed when first needed. The cache is shared
+        # with the clones of this response (see clone)
+
+        self._cache = {}
+
         # Store the time interval
         if coverage_interval is not None:
 
@@ -160,7 +269,9 @@ class InstrumentResponse(object):
     @property
     def matrix(self):
         """
-        Return the matrix representing the response
+        Return the matrix representing the response. The matrix of a clone (see clone) is a read-only view
+        of the matrix of the original response, so modifying the latter in place also modifies the clones:
+        use replace_matrix to change the matrix of a single response.
 
         :return matrix: response matrix
         :type matrix: np.ndarray
@@ -178,6 +289,30 @@ class InstrumentResponse(object):
 
         self._matrix = new_matrix
 
+        # do not touch the cache of the clones
+
+        self._cache = {}
+
+    def clone(self):
+        """
+        Return a new response sharing the matrix, the energies and the derived quantities of this one (nothing is
+        copied), but with its own integral function, so that it can be used by another plugin with a different
+        model. The matrix of the new response is a read-only view of the matrix of this one, which is left
+        untouched.
+
+        :return: a new response of the same type
+        """
+
+        new_response = copy.copy(self)
+
+        new_response._matrix = self._matrix.view()
+
+        new_response._matrix.flags.writeable = False
+
+        new_response._integral_function = None
+
+        return new_response
+
     @property
     def ebounds(self):
         """
@@ -208,7 +343,55 @@ class InstrumentResponse(object):
 
         self._integral_function = integral_function
 
-    def convolve(self):
+    def get_reduced_matrix(self, channels, bin_starts=None):
+        """
+        Return the rows of the matrix corresponding to the provided channels, optionally summed over
+        consecutive groups of them (the bins of a rebinned spectrum). The result is cached, and shared
+        with the clones of this response, until the matrix is replaced
+
+        :param channels: the indexes of the channels to keep
+        :param bin_starts: (optional) the starts of the bins, as indexes in the channels array
+        :return: matrix with shape (n_bins, n_monte_carlo_energies)
+        """
+
+        key = (
+            np.asarray(channels).tobytes(),
+            None if bin_starts is None else np.asarray(bin_starts).tobytes(),
+        )
+
+        reduced_matrices = self._cache.setdefault("reduced_matrices", {})
+
+        # the matrix is part of the entry, so that an entry is never used for another matrix even if the
+        # matrix was replaced without going through replace_matrix
+
+        matrix, reduced_matrix = reduced_matrices.get(key, (None, None))
+
+        if matrix is not self._matrix:
+
+            # do not keep too many of them, if the selections change often
+
+            if len(reduced_matrices) >= 16:
+
+                reduced_matrices.clear()
+
+            reduced_matrix = self._matrix[channels]
+
+            if bin_starts is not None:
+
+                reduced_matrix = np.add.reduceat(reduced_matrix, bin_starts, axis=0)
+
+            reduced_matrices[key] = (self._matrix, reduced_matrix)
+
+        return reduced_matrix
+
+    def convolve(self, channels=None, bin_starts=None):
+        """
+        Fold the current integral function through the response
+
+        :param channels: (optional) compute only the folded counts in these channels (see get_reduced_matrix)
+        :param bin_starts: (optional) sum the folded counts of the channels over these bins (see get_reduced_matrix)
+        :return: the folded counts
+        """
 
         true_fluxes = self._integral_function(
             self._mc_energies[:-1], self._mc_energies[1:]
@@ -223,7 +406,15 @@ class InstrumentResponse(object):
         idx = np.isfinite(true_fluxes)
         true_fluxes[~idx] = 0
 
-        folded_counts = np.dot(true_fluxes, self._matrix.T)
+        if channels is None:
+
+            matrix = self._matrix
+
+        else:
+
+            matrix = self.get_reduced_matrix(channels, bin_starts)
+
+        folded_counts = np.dot(true_fluxes, matrix.T)
 
         return folded_counts
 
@@ -374,49 +565,86 @@ class OGIPResponse(InstrumentResponse):
         # Read the response
         with pyfits.open(rsp_file) as f:
 
-            try:
+            matrix, ebounds, mc_channels, header = self._read_response(
+                f, rsp_number, arf_file
+            )
 
-                # This is usually when the response file contains only the energy dispersion
+        self._setup(
+            matrix,
+            ebounds,
+            mc_channels,
+            header.get("TSTART", None),
+            header.get("TSTOP", None),
+            arf_file,
+        )
 
-                data = f["MATRIX", rsp_number].data
-                header = f["MATRIX", rsp_number].header
+    def _read_response(
+        self, f, rsp_number, arf_file=None, ebounds=None, mc_channels=None
+    ):
+        """
+        Read one response from an open FITS file
+
+        :param f: the open FITS file
+        :param rsp_number: the number of the MATRIX (or SPECRESP MATRIX) extension to read
+        :param arf_file: the ARF file, if any
+        :param ebounds: (default: None) if provided, these ebounds are used instead of reading the EBOUNDS extension
+        :param mc_channels: (default: None) if provided and equal to the Monte Carlo energies of this matrix, this
+        array is used instead of a new one (so that it can be shared among responses)
+        :return: (matrix, ebounds, mc_channels, header)
+        """
 
-                if arf_file is None:
-                    warnings.warn(
-                        "The response is in an extension called MATRIX, which usually means you also "
-                        "need an ancillary file (ARF) which you didn't provide. You should refer to the "
-                        "documentation  of the instrument and make sure you don't need an ARF."
-                    )
+        try:
+
+            # This is usually when the response file contains only the energy dispersion
 
-            except Exception as e:
+            data = f["MATRIX", rsp_number].data
+            header = f["MATRIX", rsp_number].header
+
+            if arf_file is None:
                 warnings.warn(
-                    "The default choice for MATRIX extension failed:"
-                    + repr(e)
-                    + "available: "
-                    + " ".join([repr(e.header.get("EXTNAME")) for e in f])
+                    "The response is in an extension called MATRIX, which usually means you also "
+                    "need an ancillary file (ARF) which you didn't provide. You should refer to the "
+                    "documentation  of the instrument and make sure you don't need an ARF."
                 )
 
-                # Other detectors might use the SPECRESP MATRIX name instead, usually when the response has been
-                # already convoluted with the effective area
+        except Exception as e:
+            warnings.warn(
+                "The default choice for MATRIX extension failed:"
+                + repr(e)
+                + "available: "
+                + " ".join([repr(e.header.get("EXTNAME")) for e in f])
+            )
+
+            # Other detectors might use the SPECRESP MATRIX name instead, usually when the response has been
+            # already convoluted with the effective area
+
+            # Note that here we are not catching any exception, because
+            # we have to fail if we cannot read the matrix
 
-                # Note that here we are not catching any exception, because
-                # we have to fail if we cannot read the matrix
+            data = f["SPECRESP MATRIX", rsp_number].data
+            header = f["SPECRESP MATRIX", rsp_number].header
 
-                data = f["SPECRESP MATRIX", rsp_number].data
-                header = f["SPECRESP MATRIX", rsp_number].header
+        # These 3 operations must be executed when the file is still open
 
-            # These 3 operations must be executed when the file is still open
+        matrix = self._read_matrix(data, header)
 
-            matrix = self._read_matrix(data, header)
+        if ebounds is None:
 
             ebounds = self._read_ebounds(f["EBOUNDS"])
 
-            mc_channels = self._read_mc_channels(data)
+        this_mc_channels = self._read_mc_channels(data)
 
-        # Now, if there is information on the coverage interval, let's use it
+        if mc_channels is None or not np.array_equal(mc_channels, this_mc_channels):
+
+            mc_channels = this_mc_channels
+
+        return matrix, ebounds, mc_channels, header
+
+    def _setup(
+        self, matrix, ebounds, mc_channels, header_start, header_stop, arf_file=None
+    ):
 
-        header_start = header.get("TSTART", None)
-        header_stop = header.get("TSTOP", None)
+        # Now, if there is information on the coverage interval, let's use it
 
         if header_start is not None and header_stop is not None:
 
@@ -444,6 +672,57 @@ class OGIPResponse(InstrumentResponse):
 
             self._arf_file = None
 
+    @classmethod
+    def _from_open_file(cls, rsp_file, f, rsp_number, ebounds=None, mc_channels=None):
+        """
+        Read one of the responses contained in an already open file (for example a RSP2 file), without
+        opening and parsing the file again
+
+        :param rsp_file: the name of the file
+        :param f: the open FITS file
+        :param rsp_number: the number of the response to read
+        :param ebounds: (default: None) ebounds to be shared with other responses from the same file
+        :param mc_channels: (default: None) Monte Carlo energies to be shared with other responses from the same file
+        :return: an OGIPResponse instance
+        """
+
+        instance = cls.__new__(cls)
+
+        instance._rsp_file = rsp_file
+
+        matrix, ebounds, mc_channels, header = instance._read_response(
+            f, rsp_number, None, ebounds, mc_channels
+        )
+
+        instance._setup(
+            matrix,
+            ebounds,
+            mc_channels,
+            header.get("TSTART", None),
+            header.get("TSTOP", None),
+        )
+
+        return instance
+
+    @classmethod
+    def _from_arrays(
+        cls, rsp_file, matrix, ebounds, mc_channels, first_channel, tstart, tstop
+    ):
+        """
+        Build a response which has already been read (for example from a cache)
+
+        :return: an OGIPResponse instance
+        """
+
+        instance = cls.__new__(cls)
+
+        instance._rsp_file = rsp_file
+        instance._first_channel = first_channel
+
+        instance._setup(matrix, ebounds, mc_channels, tstart, tstop)
+
+        return instance
+
     @staticmethod
     def _are_contiguous(arr1, arr2):
 
@@ -500,7 +779,17 @@ class OGIPResponse(InstrumentResponse):
         """
         return int(self._first_channel)
 
-    def _read_matrix(self, data, header, column_name="MATRIX"):
+    def _read_matrix(self, data, header, column_name="MATRIX", sparse=False):
+        """
+        Read and decompress the response matrix
+
+        :param data: data from a RSP MATRIX
+        :param header: header of the RSP MATRIX extension
+        :param column_name: the name of the column containing the matrix
+        :param sparse: (default: False) if True, return a scipy.sparse.csr_matrix instead of a dense array (without
+        allocating the dense matrix)
+        :return: the n_channels x n_mc_energies matrix
+        """
 
         n_channels = header.get("DETCHANS")
 
@@ -526,48 +815,40 @@ class OGIPResponse(InstrumentResponse):
         # Store the first channel as a property
         self._first_channel = tlmin_fchan
 
-        rsp = np.zeros([data.shape[0], n_channels], float)
-
-        n_grp = data.field("N_GRP")  # type: np.ndarray
-
         # The numbering of channels could start at 0, or at some other number (usually 1). Of course the indexing
         # of arrays starts at 0. So let's offset the F_CHAN column to account for that
 
-        f_chan = data.field("F_CHAN") - tlmin_fchan  # type: np.ndarray
-        n_chan = data.field("N_CHAN")  # type: np.ndarray
+        f_chan = data.field("F_CHAN")  # type: np.ndarray
 
-        # In certain matrices where compression has not been used, n_grp, f_chan and n_chan are not array columns,
-        # but simple scalars. Expand then their dimensions so that we don't need to customize the code below.
-        # However, if the columns are variable-length arrays, then they do have ndmin = 1 but have dtype 'object'.
-        # In that case we don't want to add a dimension, as they are essentially a list of arrays.
+        if f_chan.dtype == np.object:
 
-        if n_grp.ndim == 1 and data.field("N_CHAN").dtype != np.object:
-            n_grp = np.expand_dims(n_grp, 1)
+            f_chan = np.array(
+                [np.asarray(x) - tlmin_fchan for x in f_chan], dtype=object
+            )
 
-        if f_chan.ndim == 1 and data.field("N_CHAN").dtype != np.object:
-            f_chan = np.expand_dims(f_chan, 1)
+        else:
 
-        if n_chan.ndim == 1 and data.field("N_CHAN").dtype != np.object:
-            n_chan = np.expand_dims(n_chan, 1)
+            f_chan = f_chan - tlmin_fchan
 
-        matrix = data.field(column_name)
+        # Expand all the groups at once. Some files (for example from Fermi/GBM) contain vector columns for
+        # n_chan and f_chan even if there is only one group, others use scalar columns when compression has not
+        # been used, and others variable-length arrays: all these cases are handled by _decompress_ogip_matrix
 
-        for i, row in enumerate(data):
+        rows, columns, values = _decompress_ogip_matrix(
+            data.field("N_GRP"), f_chan, data.field("N_CHAN"), data.field(column_name)
+        )
 
-            m_start = 0
+        if sparse:
 
-            for j in range(np.squeeze(n_grp[i])):
+            # channels x monte carlo energies, like the dense matrix
 
-                # This np.squeeze call is needed because some files (for example from Fermi/GBM) contains a vector
-                # column for n_chan, even though all elements are of size 1
-                this_n_chan = int(np.squeeze(n_chan[i][j]))
-                this_f_chan = int(np.squeeze(f_chan[i][j]))
+            return scipy.sparse.csr_matrix(
+                (values, (columns, rows)), shape=(n_channels, data.shape[0])
+            )
 
-                rsp[i, this_f_chan : this_f_chan + this_n_chan] = matrix[i][
-                    m_start : m_start + this_n_chan
-                ]
+        rsp = np.zeros([data.shape[0], n_channels], float)
 
-                m_start += this_n_chan
+        rsp[rows, columns] = values
 
         return rsp.T
 
@@ -652,6 +933,137 @@ class OGIPResponse(InstrumentResponse):
         self.replace_matrix(matrix)
 
 
+def _get_response_cache_stem(rsp_file, cache_directory):
+    """
+    Return the path (without extension) of the cache files for the given response file. The name contains the
+    SHA-256 digest of the absolute path, the size and the modification time of the file, so that the file does
+    not need to be read to find its cache.
+    """
+
+    cache_directory = sanitize_filename(cache_directory, abspath=True)
+
+    if not os.path.exists(cache_directory):
+
+        os.makedirs(cache_directory)
+
+    rsp_file = os.path.abspath(rsp_file)
+
+    file_stat = os.stat(rsp_file)
+
+    key = "%s:%i:%i" % (rsp_file, file_stat.st_size, file_stat.st_mtime_ns)
+
+    return os.path.join(
+        cache_directory,
+        "%s_%s"
+        % (os.path.basename(rsp_file), hashlib.sha256(key.encode()).hexdigest()),
+    )
+
+
+def _write_responses_to_cache(responses, cache_stem):
+    """
+    Store the stack of matrices (as a .npy file, which can be memory-mapped) and the rest of the information
+    (in a .npz file) of a list of responses read from the same file
+    """
+
+    # all the matrices must have the same shape and share the same energies
+
+    if any(
+        x.matrix.shape != responses[0].matrix.shape
+        or not np.array_equal(x.monte_carlo_energies, responses[0].monte_carlo_energies)
+        for x in responses
+    ):
+
+        return
+
+    start = [
+        np.nan if x.coverage_interval is None else x.coverage_interval.start_time
+        for x in responses
+    ]
+    stop = [
+        np.nan if x.coverage_interval is None else x.coverage_interval.stop_time
+        for x in responses
+    ]
+
+    # write to temporary files first, so that other processes never see incomplete files
+
+    for extension, writer in [
+        ("npy", lambda fh: np.save(fh, np.stack([x.matrix for x in responses])),),
+        (
+            "npz",
+            lambda fh: np.savez(
+                fh,
+                ebounds=responses[0].ebounds,
+                mc_energies=responses[0].monte_carlo_energies,
+                first_channel=[x.first_channel for x in responses],
+                start=start,
+                stop=stop,
+            ),
+        ),
+    ]:
+
+        file_name = "%s.%s" % (cache_stem, extension)
+        tmp_file = "%s.%i.tmp" % (file_name, os.getpid())
+
+        with open(tmp_file, "wb") as fh:
+
+            writer(fh)
+
+        os.replace(tmp_file, file_name)
+
+
+def _read_responses_from_cache(rsp_file, cache_stem):
+    """
+    Read back the responses stored by _write_responses_to_cache. The matrices are rows of the memory-mapped
+    stack (they are not copied)
+
+    :return: (a list of OGIPResponse instances, the memory-mapped stack of matrices), or None if the cache does
+    not exist
+    """
+
+    matrices_file = "%s.npy" % cache_stem
+    info_file = "%s.npz" % cache_stem
+
+    # the .npz file is written last
+
+    if not (
+        file_existing_and_readable(info_file)
+        and file_existing_and_readable(matrices_file)
+    ):
+
+        return None
+
+    matrices = np.load(matrices_file, mmap_mode="r")
+
+    with np.load(info_file) as info:
+
+        ebounds = info["ebounds"]
+        mc_energies = info["mc_energies"]
+        first_channel = info["first_channel"]
+        start = info["start"]
+        stop = info["stop"]
+
+    responses = []
+
+    for i in range(matrices.shape[0]):
+
+        this_start = None if np.isnan(start[i]) else float(start[i])
+        this_stop = None if np.isnan(stop[i]) else float(stop[i])
+
+        responses.append(
+            OGIPResponse._from_arrays(
+                rsp_file,
+                matrices[i],
+                ebounds,
+                mc_energies,
+                int(first_channel[i]),
+                this_start,
+                this_stop,
+            )
+        )
+
+    return responses, matrices
+
+
 class InstrumentResponseSet(object):
     """
     A set of responses
@@ -675,20 +1087,20 @@ class InstrumentResponseSet(object):
 
         self._matrix_list = list(matrix_list)  # type: list[InstrumentResponse]
 
-        # Create the corresponding list of coverage intervals
-
-        self._coverage_intervals = TimeIntervalSet(
-            [x.coverage_interval for x in self._matrix_list]
-        )
-
         # Make sure that all matrices have coverage interval set
 
-        if None in self._coverage_intervals:
+        if any(x.coverage_interval is None for x in self._matrix_list):
 
             raise NoCoverageIntervals(
                 "You need to specify the coverage interval for all matrices in the matrix_list"
             )
 
+        # Create the corresponding list of coverage intervals
+
+        self._coverage_intervals = TimeIntervalSet(
+            [x.coverage_interval for x in self._matrix_list]
+        )
+
         # Remove from the list matrices that cover intervals of zero duration (yes, the GBM publishes those too,
         # one example is in data/ogip_test_gbm_b0.rsp2)
         to_be_removed = []
@@ -736,6 +1148,27 @@ class InstrumentResponseSet(object):
         # Apply the reference time shift, if any
         self._coverage_intervals -= reference_time
 
+        # Keep the boundaries of the coverage intervals as arrays, for the vectorized weighting
+
+        self._coverage_starts = np.array(
+            [x.start_time for x in self._coverage_intervals], float
+        )
+        self._coverage_stops = np.array(
+            [x.stop_time for x in self._coverage_intervals], float
+        )
+
+        # The stack of matrices is built the first time it is needed (unless the matrices are the rows of a
+        # memory-mapped stack read from a cache, see from_rsp2_file)
+
+        self._matrix_stack = None
+
+        self._memory_mapped_stack = None
+
+        # The responses of intervals entirely within the coverage of one matrix are all clones of the same
+        # response, built the first time it is needed (see _get_single_response)
+
+        self._single_responses = {}
+
         # Store callable
 
         self._exposure_getter = exposure_getter  # type: callable
@@ -767,7 +1200,23 @@ class InstrumentResponseSet(object):
         counts_getter,
         reference_time=0.0,
         half_shifted=True,
+        cache_directory=None,
     ):
+        """
+        Build a response set from a RSP2 file (the format used by Fermi/GBM). All the matrices are read from the
+        same open file, and share the same ebounds and Monte Carlo energies.
+
+        :param rsp2_file: the RSP2 file
+        :param exposure_getter: a function returning the exposure between t1 and t2
+        :param counts_getter: a function returning the number of counts between t1 and t2
+        :param reference_time: a reference time (see the constructor)
+        :param half_shifted: whether the matrices cover from the half time of the previous one to their half time
+        (as in the GBM format)
+        :param cache_directory: (default: None) if provided, the decompressed matrices are stored in (and read back
+        from) this directory, keyed by the path, the size and the modification time of the RSP2 file. The cached
+        matrices are memory-mapped
+        :return: an InstrumentResponseSet instance
+        """
 
         # This assumes the Fermi/GBM rsp2 file format
 
@@ -778,20 +1227,50 @@ class InstrumentResponseSet(object):
             "OGIPResponse file %s not existing or not readable" % rsp_file
         )
 
-        # Will fill up the list of matrices
-        list_of_matrices = []
+        list_of_matrices = None
 
-        # Read the response
-        with pyfits.open(rsp_file) as f:
+        matrix_stack = None
+
+        if cache_directory is not None:
+
+            cache_stem = _get_response_cache_stem(rsp_file, cache_directory)
+
+            from_cache = _read_responses_from_cache(rsp_file, cache_stem)
+
+            if from_cache is not None:
 
-            n_responses = f["PRIMARY"].header["DRM_NUM"]
+                list_of_matrices, matrix_stack = from_cache
 
-            # we will read all the matrices and save them
-            for rsp_number in range(1, n_responses + 1):
+        if list_of_matrices is None:
 
-                this_response = OGIPResponse(rsp2_file + "{%i}" % rsp_number)
+            # Will fill up the list of matrices
+            list_of_matrices = []
 
-                list_of_matrices.append(this_response)
+            # Read the response
+            with pyfits.open(rsp_file) as f:
+
+                n_responses = f["PRIMARY"].header["DRM_NUM"]
+
+                ebounds = None
+                mc_channels = None
+
+                # we will read all the matrices and save them
+                for rsp_number in range(1, n_responses + 1):
+
+                    this_response = OGIPResponse._from_open_file(
+                        rsp_file, f, rsp_number, ebounds, mc_channels
+                    )
+
+                    # The next matrices will share these arrays
+
+                    ebounds = this_response.ebounds
+                    mc_channels = this_response.monte_carlo_energies
+
+                    list_of_matrices.append(this_response)
+
+            if cache_directory is not None:
+
+                _write_responses_to_cache(list_of_matrices, cache_stem)
 
         if half_shifted:
 
@@ -825,10 +1304,14 @@ class InstrumentResponseSet(object):
                             this_matrix.coverage_interval.half_time,
                         )
 
-        return InstrumentResponseSet(
+        response_set = InstrumentResponseSet(
             list_of_matrices, exposure_getter, counts_getter, reference_time
         )
 
+        response_set._memory_mapped_stack = matrix_stack
+
+        return response_set
+
     # I didn't re-implement this at the moment
     # def _display_response_weighting(self, weights, tstarts, tstops):
     #
@@ -856,7 +1339,64 @@ class InstrumentResponseSet(object):
 
         return self._get_weighted_matrix("counts", *intervals)
 
-    def _get_weighted_matrix(self, switch, *intervals):
+    def weight_by_exposure_many(self, intervals):
+        """
+        Same as weight_by_exposure, for many selections at once
+
+        :param intervals: a list of selections. Each selection can be an interval (like "0.0-10.0") or a list of
+        intervals (which are combined, as in weight_by_exposure)
+        :return: a list of InstrumentResponse instances, one for each selection
+        """
+
+        return self._get_weighted_matrices("exposure", intervals)
+
+    def weight_by_counts_many(self, intervals):
+        """
+        Same as weight_by_counts, for many selections at once. All the weighted matrices are computed with a single
+        tensor contraction of the weights with the stack of matrices.
+
+        :param intervals: a list of selections. Each selection can be an interval (like "0.0-10.0") or a list of
+        intervals (which are combined, as in weight_by_counts)
+        :return: a list of InstrumentResponse instances, one for each selection
+        """
+
+        return self._get_weighted_matrices("counts", intervals)
+
+    def _get_matrix_stack(self):
+        """
+        Return the matrices as a contiguous (n_matrices, n_channels, n_mc_energies) array, which is built only once
+
+        :return: the stack of matrices
+        """
+
+        if self._matrix_stack is None:
+
+            matrices = [x.matrix for x in self._matrix_list]
+
+            stack = self._memory_mapped_stack
+
+            # If the matrices are still all the rows of the memory-mapped stack, in order (none was removed
+            # or replaced), use it instead of copying them
+
+            if (
+                stack is not None
+                and stack.shape[0] == len(matrices)
+                and all(
+                    x.__array_interface__["data"][0]
+                    == stack[i].__array_interface__["data"][0]
+                    for i, x in enumerate(matrices)
+                )
+            ):
+
+                self._matrix_stack = stack
+
+            else:
+
+                self._matrix_stack = np.ascontiguousarray(np.stack(matrices))
+
+        return self._matrix_stack
+
+    def _get_weights(self, switch, *intervals):
 
         assert len(intervals) > 0, "You have to provide at least one interval"
 
@@ -865,37 +1405,103 @@ class InstrumentResponseSet(object):
         # Compute a set of weights for each interval
         weights = np.zeros(len(self._matrix_list))
 
+        # (with only one interval, the weights do not need to be comparable with those of other intervals)
+
+        single_interval = len(intervals_set) == 1
+
         for interval in intervals_set:
 
-            weights += self._weight_response(interval, switch)
+            weights += self._weight_response(interval, switch, single_interval)
 
         # Normalize to 1
         weights /= np.sum(weights)
 
+        return weights
+
+    def _make_response(self, matrix):
+
+        # get EBOUNDS and mc channels from the first matrix
+
+        return InstrumentResponse(
+            matrix,
+            self._matrix_list[0].ebounds,
+            self._matrix_list[0].monte_carlo_energies,
+        )
+
+    def _get_single_response(self, index):
+        """
+        Return a clone of the response of the index-th matrix (see InstrumentResponse.clone), so that all the
+        responses of intervals covered by the same matrix share it instead of holding a copy each
+
+        :param index: index of the matrix
+        :return: an InstrumentResponse instance
+        """
+
+        if index not in self._single_responses:
+
+            self._single_responses[index] = self._make_response(
+                self._get_matrix_stack()[index]
+            )
+
+        return self._single_responses[index].clone()
+
+    def _get_weighted_matrix(self, switch, *intervals):
+
+        weights = self._get_weights(switch, *intervals)
+
+        if np.count_nonzero(weights) == 1:
+
+            return self._get_single_response(int(np.flatnonzero(weights)[0]))
+
         # Weight matrices
-        matrix = np.dot(
-            np.array(list(map(attrgetter("matrix"), self._matrix_list))).T, weights.T
-        ).T
+        matrix = np.tensordot(weights, self._get_matrix_stack(), axes=(0, 0))
 
         # Now generate the instance of the response
 
-        # get EBOUNDS from the first matrix
-        ebounds = self._matrix_list[0].ebounds
+        return self._make_response(matrix)
 
-        # Get mc channels from the first matrix
-        mc_channels = self._matrix_list[0].monte_carlo_energies
+    def _get_weighted_matrices(self, switch, intervals):
+
+        weights = np.array(
+            [
+                self._get_weights(
+                    switch, *([selection] if isinstance(selection, str) else selection)
+                )
+                for selection in intervals
+            ]
+        )
 
-        matrix_instance = InstrumentResponse(matrix, ebounds, mc_channels)
+        single = np.count_nonzero(weights, axis=1) == 1
 
-        return matrix_instance
+        responses = [None] * len(weights)
 
-    def _weight_response(self, interval_of_interest, switch):
+        for i in np.flatnonzero(single):
+
+            responses[i] = self._get_single_response(int(np.argmax(weights[i])))
+
+        # (n_selections, n_matrices) x (n_matrices, n_channels, n_mc_energies)
+
+        if not np.all(single):
+
+            matrices = np.tensordot(
+                weights[~single], self._get_matrix_stack(), axes=(1, 0)
+            )
+
+            for i, matrix in zip(np.flatnonzero(~single), matrices):
+
+                responses[i] = self._make_response(matrix)
+
+        return responses
+
+    def _weight_response(self, interval_of_interest, switch, single_interval=False):
 
         """
 
         :param interval_start : start time of the interval
         :param interval_stop : stop time of the interval
         :param switch: either 'counts' or 'exposure'
+        :param single_interval: whether this is the only interval of the selection. If it is and it is covered by a
+        single matrix, that matrix gets a weight of one without computing the counts or the exposure
 
         """
 
@@ -904,12 +1510,20 @@ class InstrumentResponseSet(object):
         # more than one interval
         #######################
 
-        # Now mark all responses which overlap with the interval of interest
+        assert switch in ["counts", "exposure"], "switch must be 'counts' or 'exposure'"
+
+        start = interval_of_interest.start_time
+        stop = interval_of_interest.stop_time
+
+        # Now mark all responses which overlap with the interval of interest (with the same definition of
+        # TimeInterval.overlaps_with, but for all the coverage intervals at once)
         # NOTE: this is a mask of the same length as _matrix_list and _coverage_intervals
 
-        matrices_mask = [
-            c_i.overlaps_with(interval_of_interest) for c_i in self._coverage_intervals
-        ]
+        matrices_mask = (
+            (self._coverage_starts == start)
+            | (self._coverage_stops == stop)
+            | ((self._coverage_starts < stop) & (self._coverage_stops > start))
+        )
 
         # Check that we have at least one matrix
 
@@ -923,87 +1537,72 @@ class InstrumentResponseSet(object):
                 )
             )
 
-        # Compute the weights
-
-        weights = np.empty_like(self._matrix_list, float)
-
         # These "effective intervals" are how much of the coverage interval is really used for each matrix
-        # NOTE: the length of effective_intervals list *will not be* the same as the weight mask or the matrix_list.
-        # There are as many effective intervals as matrices with weight > 0
+        # NOTE: there are as many effective intervals as matrices with weight > 0
 
-        effective_intervals = []
+        idx = np.flatnonzero(matrices_mask)
 
-        for i, matrix in enumerate(self._matrix_list):
-
-            if matrices_mask[i]:
-
-                # A matrix of interest
-                this_coverage_interval = self._coverage_intervals[i]
-
-                # See how much it overlaps with the interval of interest
-                this_effective_interval = this_coverage_interval.intersect(
-                    interval_of_interest
-                )
-
-                effective_intervals.append(this_effective_interval)
-
-                # Now compute the weight
-
-                if switch == "counts":
-
-                    # Weight according to the number of events
-                    weights[i] = self._counts_getter(
-                        this_effective_interval.start_time,
-                        this_effective_interval.stop_time,
-                    )
-
-                elif switch == "exposure":
-
-                    # Weight according to the exposure
-                    weights[i] = self._exposure_getter(
-                        this_effective_interval.start_time,
-                        this_effective_interval.stop_time,
-                    )
-
-            else:
-
-                # Uninteresting matrix
-                weights[i] = 0.0
-
-        # if all weights are zero, there is something clearly wrong with the exposure or the counts computation
-        assert (
-            np.sum(weights) > 0
-        ), "All weights are zero. There must be a bug in the exposure or counts computation"
+        effective_starts = np.maximum(self._coverage_starts[idx], start)
+        effective_stops = np.minimum(self._coverage_stops[idx], stop)
 
         # Check that the first matrix with weight > 0 has an effective interval starting at the beginning of
         # the interval of interest (otherwise it means that part of the interval of interest is not covered!)
 
-        if effective_intervals[0].start_time != interval_of_interest.start_time:
+        if effective_starts[0] != start:
 
             raise IntervalOfInterestNotCovered(
                 "The interval of interest (%s) is not covered by %s"
-                % (interval_of_interest, effective_intervals[0])
+                % (
+                    interval_of_interest,
+                    TimeInterval(effective_starts[0], effective_stops[0]),
+                )
             )
 
         # Check that the last matrix with weight > 0 has an effective interval starting at the beginning of
         # the interval of interest (otherwise it means that part of the interval of interest is not covered!)
 
-        if effective_intervals[-1].stop_time != interval_of_interest.stop_time:
+        if effective_stops[-1] != stop:
             raise IntervalOfInterestNotCovered(
                 "The interval of interest (%s) is not covered by %s"
-                % (interval_of_interest, effective_intervals[0])
+                % (
+                    interval_of_interest,
+                    TimeInterval(effective_starts[0], effective_stops[0]),
+                )
             )
 
         # Lastly, check that there is no interruption in coverage (bad time intervals are *not* supported)
-        all_tstarts = np.array([x.start_time for x in effective_intervals])
-        all_tstops = np.array([x.stop_time for x in effective_intervals])
 
-        if not np.all((all_tstops[:-1] == all_tstarts[1:])):
+        if not np.all((effective_stops[:-1] == effective_starts[1:])):
 
             raise GapInCoverageIntervals(
                 "Gap in coverage! Bad time intervals are not supported!"
             )
 
+        # Now compute the weights, according to the number of events or to the exposure
+
+        weights = np.zeros(len(self._matrix_list))
+
+        if single_interval and idx.shape[0] == 1:
+
+            # the interval is entirely covered by one matrix, which gets all the weight
+            # (there is no need to count events or to compute the exposure)
+
+            weights[idx] = 1.0
+
+            return weights
+
+        getter = self._counts_getter if switch == "counts" else self._exposure_getter
+
+        weights[idx] = [
+            getter(float(t1), float(t2))
+            for t1, t2 in zip(effective_starts, effective_stops)
+        ]
+
+        # if all weights are zero, there is something clearly wrong with the exposure or the counts computation
+        assert (
+            np.sum(weights) > 0
+        ), "All weights are zero. There must be a bug in the exposure or counts computation"
+
         return weights
 
     @property
@@ -46,95 +46,205 @@ class Rebinner(object):
 
         self._mask = mask
 
-        # Rebin taking the mask into account
+        # Rebin taking the mask into account. Each contiguous run of elements included by the
+        # mask is divided greedily in bins, each bin being closed as soon as its total reaches
+        # min_value_per_bin (the last bin of the run is closed at the end of the run in any case,
+        # see _split_run)
+
+        vector_to_rebin_on = np.asarray(vector_to_rebin_on)
+
+        n_elements = vector_to_rebin_on.shape[0]
+
+        # Boundaries of the runs of included elements
+
+        padded_mask = np.concatenate(([False], mask, [False])).astype(np.int8)
+
+        run_boundaries = np.flatnonzero(np.diff(padded_mask))
+
+        starts = [np.zeros(0, dtype=int)]
+        stops = [np.zeros(0, dtype=int)]
+        is_complete = [np.zeros(0, dtype=bool)]
+
+        for run_start, run_stop in zip(run_boundaries[::2], run_boundaries[1::2]):
+
+            this_starts, this_stops, this_complete = self._split_run(
+                vector_to_rebin_on[run_start:run_stop], min_value_per_bin
+            )
+
+            starts.append(this_starts + run_start)
+            stops.append(this_stops + run_start)
+            is_complete.append(this_complete)
+
+        self._starts = np.concatenate(starts).astype(int)
+        self._stops = np.concatenate(stops).astype(int)
+
+        is_complete = np.concatenate(is_complete).astype(bool)
+
+        # OGIP-like grouping: in a bin made of more than one element, the last element is flagged
+        # with 1 and the others with -1. For incomplete bins closed by the mask, the flags are
+        # shifted by one element (the excluded element following the bin is flagged with 1)
 
-        self._starts = []
-        self._stops = []
         self._grouping = np.zeros_like(vector_to_rebin_on)
 
-        n = 0
-        bin_open = False
+        shift = np.where(is_complete, 0, 1)
 
-        n_grouped_bins = 0
+        is_grouped = (self._stops - self._starts >= 2) & (
+            is_complete | (self._stops < n_elements)
+        )
 
-        for index, b in enumerate(vector_to_rebin_on):
+        first = (self._starts + shift)[is_grouped]
+        last = (self._stops - 1 + shift)[is_grouped]
 
-            if not mask[index]:
+        # the ranges [first, last) do not overlap: mark them all at once
 
-                # This element is excluded by the mask
+        in_range = np.zeros(n_elements + 1, dtype=int)
 
-                if not bin_open:
+        np.add.at(in_range, first, 1)
+        np.add.at(in_range, last, -1)
 
-                    # Do nothing
-                    continue
+        self._grouping[np.cumsum(in_range)[:-1] > 0] = -1
+        self._grouping[last] = 1
 
-                else:
+        # Indexes used to rebin with np.add.reduceat: summing between each start and the
+        # corresponding stop gives the bins (even positions), while the odd positions
+        # correspond to the excluded elements in between and are discarded
 
-                    # We need to close the bin here
-                    self._stops.append(index)
-                    n = 0
-                    bin_open = False
+        reduce_indices = np.empty(2 * len(self._starts), dtype=int)
+        reduce_indices[::2] = self._starts
+        reduce_indices[1::2] = self._stops
 
-                    # If we have grouped more than one bin
+        if reduce_indices.shape[0] > 0 and reduce_indices[-1] == n_elements:
 
-                    if n_grouped_bins > 1:
+            reduce_indices = reduce_indices[:-1]
 
-                        # group all these bins
-                        self._grouping[index - n_grouped_bins + 1 : index] = -1
-                        self._grouping[index] = 1
+        self._reduce_indices = reduce_indices
 
-                    # reset the number of bins in this group
+        assert np.sum(self._stops - self._starts) == np.sum(
+            mask
+        ), "This is a bug: the bins do not cover all the elements selected by the mask"
 
-                    n_grouped_bins = 0
+        self._min_value_per_bin = min_value_per_bin
 
-            else:
+    @staticmethod
+    def _split_run(values, min_value):
+        """
+        Divide a vector in consecutive bins, closing each bin as soon as its total reaches min_value
+
+        The total of each bin is accumulated from its start, exactly as when filling the bin element by
+        element (a cumulative sum of the whole vector would round differently). When the bins are
+        expected to be short, this is what is done, on native python numbers which is much faster
+        than on numpy scalars. For long bins, the sum is computed with numpy on a window twice as long
+        as the previous bin, which is extended if the bin turns out to be longer
+
+        :param values: the vector
+        :param min_value: minimum total per bin
+        :return: (starts, stops, is_complete): the starts and stops (excluded) of the bins, and whether
+        each bin reached min_value
+        """
 
-                # This element is included by the mask
+        n_values = values.shape[0]
 
-                if not bin_open:
-                    # Open a new bin
-                    bin_open = True
+        mean_value = np.mean(np.clip(values, 0, None)) if n_values > 0 else 0
 
-                    self._starts.append(index)
-                    n = 0
+        if mean_value * 32 > min_value:
 
-                # Add the current value to the open bin
+            return Rebinner._split_run_by_element(values, min_value)
 
-                n += b
+        # With no negative values the running sum is monotonic and we can search it directly.
+        # Otherwise we search its running maximum (the first element where the running sum
+        # reaches a value is also the first element where its running maximum does)
 
-                n_grouped_bins += 1
+        is_monotonic = np.all(values >= 0)
 
-                # If we are beyond the requested value, close the bin
+        starts = []
+        stops = []
+        is_complete = []
 
-                if n >= min_value_per_bin:
-                    self._stops.append(index + 1)
+        start = 0
+        window = 64
 
-                    n = 0
+        while start < n_values:
 
-                    bin_open = False
+            while True:
 
-                    # If we have grouped more than one bin
+                window_stop = min(start + window, n_values)
 
-                    if n_grouped_bins > 1:
+                last = start + Rebinner._first_reaching(
+                    values[start:window_stop], min_value, is_monotonic
+                )
 
-                        # group all these bins
-                        self._grouping[index - n_grouped_bins + 1 : index] = -1
-                        self._grouping[index] = 1
+                if last < window_stop or window_stop == n_values:
 
-                    # reset the number of bins in this group
+                    break
 
-                    n_grouped_bins = 0
+                window *= 2
 
-        # At the end of the loop, see if we left a bin open, if we did, close it
+            starts.append(start)
 
-        if bin_open:
-            self._stops.append(len(vector_to_rebin_on))
+            if last >= n_values:
 
-        assert len(self._starts) == len(self._stops), (
-            "This is a bug: the starts and stops of the bins are not in " "equal number"
-        )
+                # Not enough left for a complete bin: close it at the end of the run
 
-        self._min_value_per_bin = min_value_per_bin
+                stops.append(n_values)
+                is_complete.append(False)
+
+                break
+
+            stops.append(last + 1)
+            is_complete.append(True)
+
+            window = 2 * (last + 1 - start) + 2
+            start = last + 1
+
+        return np.array(starts, dtype=int), np.array(stops, dtype=int), is_complete
+
+    @staticmethod
+    def _split_run_by_element(values, min_value):
+
+        starts = []
+        stops = []
+
+        start = 0
+        total = 0
+
+        for index, value in enumerate(values.tolist()):
+
+            total += value
+
+            if total >= min_value:
+
+                starts.append(start)
+                stops.append(index + 1)
+
+                start = index + 1
+                total = 0
+
+        is_complete = [True] * len(starts)
+
+        if start < values.shape[0]:
+
+            # Not enough left for a complete bin: close it at the end of the run
+
+            starts.append(start)
+            stops.append(values.shape[0])
+            is_complete.append(False)
+
+        return np.array(starts, dtype=int), np.array(stops, dtype=int), is_complete
+
+    @staticmethod
+    def _first_reaching(values, min_value, is_monotonic):
+        """
+        :return: the index of the first element where the running sum of values (started from zero)
+        reaches min_value, or len(values) if it never does
+        """
+
+        sums = np.cumsum(values)
+
+        if not is_monotonic:
+
+            sums = np.maximum.accumulate(sums)
+
+        return np.searchsorted(sums, min_value, side="left")
 
     @property
     def n_bins(self):
@@ -151,41 +261,42 @@ class Rebinner(object):
 
         return self._grouping
 
-    def rebin(self, *vectors):
+    @property
+    def masked_bin_starts(self):
+        """
+        The starts of the bins in the vector of the elements selected by the mask (vector[mask]). As the
+        bins cover exactly these elements, each bin stops where the next one starts, so that
+        np.add.reduceat(vector[mask], masked_bin_starts) gives the same result as rebin(vector)
 
-        rebinned_vectors = []
+        :return: array of indexes
+        """
 
-        for vector in vectors:
+        bin_sizes = self._stops - self._starts
 
-            assert len(vector) == len(self._mask), (
-                "The vector to rebin must have the same number of elements of the"
-                "original (not-rebinned) vector"
-            )
+        return np.cumsum(bin_sizes) - bin_sizes
 
-            # Transform in array because we need to use the mask
-            vector_a = np.array(vector)
+    def _check_vector(self, vector):
 
-            rebinned_vector = []
+        vector = np.asarray(vector)
 
-            for low_bound, hi_bound in zip(self._starts, self._stops):
+        assert vector.shape[0] == self._mask.shape[0], (
+            "The vector to rebin must have the same number of elements of the"
+            "original (not-rebinned) vector"
+        )
 
-                rebinned_vector.append(np.sum(vector_a[low_bound:hi_bound]))
+        return vector
 
-            # Vector might not contain counts, so we use a relative comparison to check that we didn't miss
-            # anything.
-            # NOTE: we add 1e-100 because if both rebinned_vector and vector_a contains only 0, the check would
-            # fail when it shouldn't
+    def rebin(self, *vectors):
 
-            assert (
-                abs(
-                    (np.sum(rebinned_vector) + 1e-100)
-                    / (np.sum(vector_a[self._mask]) + 1e-100)
-                    - 1
-                )
-                < 1e-4
-            )
+        rebinned_vectors = []
+
+        for vector in vectors:
+
+            vector = self._check_vector(vector)
 
-            rebinned_vectors.append(np.array(rebinned_vector))
+            # The bins cover exactly the elements selected by the mask, so nothing can be missed
+
+            rebinned_vectors.append(np.add.reduceat(vector, self._reduce_indices)[::2])
 
         return rebinned_vectors
 
@@ -205,18 +316,11 @@ class Rebinner(object):
 
         for vector in vectors:  # type: np.ndarray[np.ndarray]
 
-            assert len(vector) == len(self._mask), (
-                "The vector to rebin must have the same number of elements of the"
-                "original (not-rebinned) vector"
-            )
-
-            rebinned_vector = []
-
-            for low_bound, hi_bound in zip(self._starts, self._stops):
-
-                rebinned_vector.append(np.sqrt(np.sum(vector[low_bound:hi_bound] ** 2)))
+            vector = self._check_vector(vector)
 
-            rebinned_vectors.append(np.array(rebinned_vector))
+            rebinned_vectors.append(
+                np.sqrt(np.add.reduceat(vector ** 2, self._reduce_indices)[::2])
+            )
 
         return rebinned_vectors
 
@@ -224,12 +328,8 @@ class Rebinner(object):
 
         assert len(old_start) == len(self._mask) and len(old_stop) == len(self._mask)
 
-        new_start = np.zeros(len(self._starts))
-        new_stop = np.zeros(len(self._starts))
-
-        for i, (low_bound, hi_bound) in enumerate(zip(self._starts, self._stops)):
-            new_start[i] = old_start[low_bound]
-            new_stop[i] = old_stop[hi_bound - 1]
+        new_start = np.asarray(old_start, dtype=float)[self._starts]
+        new_stop = np.asarray(old_stop, dtype=float)[self._stops - 1]
 
         return new_start, new_stop
 
@@ -291,225 +391,209 @@ class TemporalBinner(TimeIntervalSet):
         method. If a background error function is given then it is assumed that the error distribution
         is gaussian. Otherwise, the error distribution is assumed to be Poisson.
 
-        :param background_getter: function of a start and stop time that returns background counts
-        :param background_error_getter: function of a start and stop time that returns background count errors
+        Each bin starts at an event and stops at the first following event for which the significance
+        of the bin reaches the requested level. The cumulative background from the first event is
+        computed once, so that the counts and the background of any trial bin are simple differences,
+        and all the trial stops of a bin are tested at once.
+
+        Several detectors can be binned jointly, on the significance of their summed counts and
+        backgrounds, by providing lists of arrival times and of background getters (one per detector).
+
+        :param arrival_times: sorted array of arrival times, or list of arrays (one per detector)
+        :param background_getter: function of a start and stop time that returns background counts. It must
+        accept an array of stop times. For a joint binning, a list with one function per detector
+        :param background_error_getter: function of a start and stop time that returns background count errors.
+        It must accept an array of stop times. For a joint binning, a list with one function per detector
         :param sigma_level: the sigma level of the intervals
         :param min_counts: the minimum counts per bin
+        :param tstart: (optional) ignore events before tstart
+        :param tstop: (optional) ignore events after tstop
 
         :return:
         """
 
-        if tstart is None:
+        if isinstance(arrival_times, (list, tuple)):
 
-            tstart = arrival_times.min()
+            n_detectors = len(arrival_times)
 
-        else:
-
-            tstart = float(tstart)
-
-        if tstop is None:
-
-            tstop = arrival_times.max()
+            assert (
+                isinstance(background_getter, (list, tuple))
+                and len(background_getter) == n_detectors
+            ), "For a joint binning, you need one background getter per detector"
 
-        else:
+            background_getters = list(background_getter)
 
-            tstop = float(tstop)
+            if background_error_getter is not None:
 
-        starts = []
+                assert (
+                    isinstance(background_error_getter, (list, tuple))
+                    and len(background_error_getter) == n_detectors
+                ), "For a joint binning, you need one background error getter per detector"
 
-        stops = []
+                background_error_getters = list(background_error_getter)
 
-        # Switching to a fast search
-        # Idea inspired by Damien Begue
+            else:
 
-        # these factors change the time steps
-        # in the fast search. should experiment
-        if sigma_level > 25:
+                background_error_getters = None
 
-            increase_factor = 0.5
-            decrease_factor = 0.5
+            events = np.sort(np.concatenate(arrival_times))
 
         else:
 
-            increase_factor = 0.25
-            decrease_factor = 0.25
+            background_getters = [background_getter]
 
-        current_start = arrival_times[0]
+            if background_error_getter is not None:
 
-        # first we need to see if the interval provided has enough counts
+                background_error_getters = [background_error_getter]
 
-        _, counts = TemporalBinner._select_events(
-            arrival_times, current_start, arrival_times[-1]
-        )
+            else:
 
-        # if it does not, the flag for the big loop never gets set
-        end_all_search = not TemporalBinner._check_exceeds_sigma_interval(
-            current_start,
-            arrival_times[-1],
-            counts,
-            sigma_level,
-            background_getter,
-            background_error_getter,
-        )
+                background_error_getters = None
 
-        # We will start the search at the mid point of the whole interval
+            events = np.asarray(arrival_times)
 
-        mid_point = 0.5 * (arrival_times[-1] + current_start)
+        if tstart is not None:
 
-        current_stop = mid_point
+            events = events[events >= float(tstart)]
 
-        # initialize the fast search flag
+        if tstop is not None:
 
-        end_fast_search = False
+            events = events[events <= float(tstop)]
 
-        # resolve once for functions used in the loop
-        searchsorted = np.searchsorted
+        n_events = events.shape[0]
 
-        # this is the main loop
-        # as long as we have not reached the end of the interval
-        # the loop will run
-        with progress_bar(arrival_times.shape[0]) as pbar:
-            while not end_all_search:
+        starts = []
 
-                # start of the fast search
-                # we reset the flag for the interval
-                # having been decreased in the last pass
-                decreased_interval = False
+        stops = []
 
-                while not end_fast_search:
+        if n_events > 1:
 
-                    # we calculate the sigma of the current region
-                    _, counts = TemporalBinner._select_events(
-                        arrival_times, current_start, current_stop
-                    )
+            # The background between the events i and j is the difference of the cumulative background
+            # from the first event
 
-                    sigma_exceeded = TemporalBinner._check_exceeds_sigma_interval(
-                        current_start,
-                        current_stop,
-                        counts,
-                        sigma_level,
-                        background_getter,
-                        background_error_getter,
-                    )
+            cumulative_background = np.zeros(n_events)
 
-                    time_step = abs(current_stop - current_start)
+            for getter in background_getters:
 
-                    # if we do not exceed the sigma
-                    # we need to increase the time interval
-                    if not sigma_exceeded:
+                cumulative_background += getter(events[0], events)
 
-                        # however, if in the last pass we had to decrease
-                        # the interval, it means we have found where we
-                        # we need to start the slow search
-                        if decreased_interval:
+            # The bins include both their first and their last event, and they have at least two
+            # events (the last event of a bin is also the first event of the next one)
 
-                            # mark where we are in the list
-                            start_idx = searchsorted(arrival_times, current_stop)
+            min_length = max(int(min_counts) - 1, 1)
 
-                            # end the fast search
-                            end_fast_search = True
+            # index of the first event of the current bin
 
-                        # otherwise we increase the interval
-                        else:
+            first = 0
 
-                            # unless, we would increase it too far
-                            if (
-                                current_stop + time_step * increase_factor
-                            ) >= arrival_times[-1]:
+            with progress_bar(n_events) as pbar:
 
-                                # mark where we are in the interval
-                                start_idx = searchsorted(arrival_times, current_stop)
+                while first + min_length < n_events:
 
-                                # then we also want to go ahead and get out of the fast search
-                                end_fast_search = True
+                    last = cls._find_significant_stop(
+                        events,
+                        first,
+                        min_length,
+                        cumulative_background,
+                        background_error_getters,
+                        sigma_level,
+                    )
 
-                            else:
+                    # if we never exceeded the sigma level by the
+                    # end of the events, we never will
 
-                                # increase the interval
-                                current_stop += time_step * increase_factor
+                    if last is None:
 
-                    # if we did exceede the sigma level we will need to step
-                    # back in time to find where it was NOT exceeded
-                    else:
+                        break
 
-                        # decrease the interval
-                        current_stop -= time_step * decrease_factor
+                    starts.append(events[first])
+                    stops.append(events[last])
 
-                        # inform the loop that we have been back stepping
-                        decreased_interval = True
+                    pbar.increase(last - first)
 
-                # Now we are ready for the slow forward search
-                # where we count up all the photons
+                    first = last
 
-                # we have already counted up the photons to this point
-                total_counts = counts
+        if not starts:
 
-                # start searching from where the fast search ended
-                pbar.increase(counts)
+            print(
+                "The requested sigma level could not be achieved in the interval. Try decreasing it."
+            )
 
-                for time in arrival_times[start_idx:]:
+        else:
 
-                    total_counts += 1
-                    pbar.increase()
-                    if total_counts < min_counts:
+            return cls.from_starts_and_stops(starts, stops)
 
-                        continue
+    @staticmethod
+    def _find_significant_stop(
+        events,
+        first,
+        min_length,
+        cumulative_background,
+        background_error_getters,
+        sigma_level,
+        initial_batch_size=256,
+    ):
+        """
+        Find the first event closing a bin opened at events[first] with the requested significance.
+        The trial stops are tested in batches of increasing size
 
-                    else:
+        :return: the index of the event, or None if the significance is never reached
+        """
 
-                        # first use the background function to know the number of background counts
-                        bkg = background_getter(current_start, time)
+        n_events = events.shape[0]
 
-                        sig = Significance(total_counts, bkg)
+        batch_start = first + min_length
 
-                        if background_error_getter is not None:
+        batch_size = initial_batch_size
 
-                            bkg_error = background_error_getter(current_start, time)
+        while batch_start < n_events:
 
-                            sigma = sig.li_and_ma_equivalent_for_gaussian_background(
-                                bkg_error
-                            )[0]
+            batch_stop = min(batch_start + batch_size, n_events)
 
-                        else:
+            trial_stops = np.arange(batch_start, batch_stop)
 
-                            sigma = sig.li_and_ma()[0]
+            counts = trial_stops - first + 1
 
-                            # now test if we have enough sigma
+            background = (
+                cumulative_background[trial_stops] - cumulative_background[first]
+            )
 
-                        if sigma >= sigma_level:
+            sig = Significance(counts, background)
 
-                            # if we succeeded we want to mark the time bins
-                            stops.append(time)
+            with np.errstate(all="ignore"):
 
-                            starts.append(current_start)
+                if background_error_getters is not None:
 
-                            # set up the next fast search
-                            # by looking past this interval
-                            current_start = time
+                    background_error = np.sqrt(
+                        sum(
+                            getter(events[first], events[trial_stops]) ** 2
+                            for getter in background_error_getters
+                        )
+                    )
 
-                            current_stop = 0.5 * (arrival_times[-1] + time)
+                    sigma = sig.li_and_ma_equivalent_for_gaussian_background(
+                        background_error
+                    )
 
-                            end_fast_search = False
+                else:
 
-                            # get out of the for loop
-                            break
+                    sigma = sig.li_and_ma()
 
-                # if we never exceeded the sigma level by the
-                # end of the search, we never will
-                if end_fast_search:
+                # no bins of zero duration
 
-                    # so lets kill the main search
-                    end_all_search = True
+                exceeded = (sigma >= sigma_level) & (
+                    events[trial_stops] > events[first]
+                )
 
-        if not starts:
+            if np.any(exceeded):
 
-            print(
-                "The requested sigma level could not be achieved in the interval. Try decreasing it."
-            )
+                return batch_start + int(np.argmax(exceeded))
 
-        else:
+            batch_start = batch_stop
 
-            return cls.from_starts_and_stops(starts, stops)
+            batch_size *= 2
+
+        return None
 
     @classmethod
     def bin_by_constant(cls, arrival_times, dt):
@@ -598,69 +682,3 @@ class TemporalBinner(TimeIntervalSet):
         """
 
         return cls.from_starts_and_stops(starts, stops)
-
-    @staticmethod
-    def _check_exceeds_sigma_interval(
-        start,
-        stop,
-        counts,
-        sigma_level,
-        background_getter,
-        background_error_getter=None,
-    ):
-
-        """
-
-        see if an interval exceeds a given sigma level
-
-
-        :param start:
-        :param stop:
-        :param counts:
-        :param sigma_level:
-        :param background_getter:
-        :param background_error_getter:
-        :return:
-        """
-
-        bkg = background_getter(start, stop)
-
-        sig = Significance(counts, bkg)
-
-        if background_error_getter is not None:
-
-            bkg_error = background_error_getter(start, stop)
-
-            sigma = sig.li_and_ma_equivalent_for_gaussian_background(bkg_error)[0]
-
-        else:
-
-            sigma = sig.li_and_ma()[0]
-
-        # now test if we have enough sigma
-
-        if sigma >= sigma_level:
-
-            return True
-
-        else:
-
-            return False
-
-    @staticmethod
-    def _select_events(arrival_times, start, stop):
-        """
-        get the events and total counts over an interval
-
-        :param start:
-        :param stop:
-        :param events:
-        :return:
-        """
-
-        lt_idx = start <= arrival_times
-        gt_idx = arrival_times <= stop
-
-        idx = np.logical_and(lt_idx, gt_idx)
-
-        return idx, arrival_times[idx].shape[0]
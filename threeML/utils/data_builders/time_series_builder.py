@@ -8,7 +8,6 @@ from threeML.exceptions.custom_exceptions import custom_warnings
 from threeML.io.file_utils import file_existing_and_readable
 from threeML.io.progress_bar import progress_bar
 from threeML.plugins.DispersionSpectrumLike import DispersionSpectrumLike
-from threeML.plugins.OGIPLike import OGIPLike
 from threeML.plugins.SpectrumLike import NegativeBackground, SpectrumLike
 from threeML.utils.data_builders.fermi.gbm_data import GBMCdata, GBMTTEFile
 from threeML.utils.data_builders.fermi.lat_data import LLEFile
@@ -20,6 +19,7 @@ from threeML.utils.polarization.binned_polarization import \
     BinnedModulationCurve
 from threeML.utils.spectrum.binned_spectrum import (
     BinnedSpectrum, BinnedSpectrumWithDispersion)
+from threeML.utils.spectrum.binned_spectrum_set import LazyBinnedSpectrumList
 from threeML.utils.statistics.stats_tools import Significance
 from threeML.utils.time_interval import TimeIntervalSet
 from threeML.utils.time_series.binned_spectrum_series import \
@@ -56,6 +56,19 @@ class BinningMethodError(RuntimeError):
     pass
 
 
+class LazyPluginList(LazyBinnedSpectrumList):
+    def __init__(self, plugin_factory, n_plugins):
+        """
+        A sequence of plugins which are built only when they are accessed (and then kept),
+        as returned by TimeSeriesBuilder.to_spectrumlike(from_bins=True, lazy=True)
+
+        :param plugin_factory: a function returning the i-th plugin
+        :param n_plugins: the number of plugins
+        """
+
+        super(LazyPluginList, self).__init__(plugin_factory, n_plugins)
+
+
 class TimeSeriesBuilder(object):
     def __init__(
         self,
@@ -260,6 +273,8 @@ class TimeSeriesBuilder(object):
 
         setBackgroundInterval("-10.0-0.0","10.-15.")
 
+        Besides unbinned, the options are passed to the set_polynomial_fit_interval method of the
+        time series (e.g., bin_width to set the width of the bins of a binned fit of an event list)
 
         :param *intervals:
         :param **options:
@@ -275,7 +290,7 @@ class TimeSeriesBuilder(object):
             unbinned = self._default_unbinned
 
         self._time_series.set_polynomial_fit_interval(
-            *intervals, unbinned=unbinned)
+            *intervals, unbinned=unbinned, **options)
 
         # In theory this will automatically get the poly counts if a
         # time interval already exists
@@ -327,21 +342,19 @@ class TimeSeriesBuilder(object):
         :return: None
         """
 
-        # we simply create a bunch of dispersion plugins and convert them to OGIP
+        # we simply create a bunch of dispersion plugins and write them all at once
+        # (there is no need to convert them to OGIP first)
 
-        ogip_list = [
-            OGIPLike.from_general_dispersion_spectrum(sl)
-            for sl in self.to_spectrumlike(
-                from_bins=True,
-                start=start,
-                stop=stop,
-                extract_measured_background=extract_measured_background,
-            )
-        ]
+        plugin_list = self.to_spectrumlike(
+            from_bins=True,
+            start=start,
+            stop=stop,
+            extract_measured_background=extract_measured_background,
+        )
 
         # write out the PHAII file
 
-        pha_writer = PHAWrite(*ogip_list)
+        pha_writer = PHAWrite(*plugin_list)
 
         pha_writer.write(
             file_name, overwrite=overwrite, force_rsp_write=force_rsp_write
@@ -608,6 +621,7 @@ class TimeSeriesBuilder(object):
         stop=None,
         interval_name="_interval",
         extract_measured_background=False,
+        lazy=False,
     ):
         """
         Create plugin(s) from either the current active selection or the time bins.
@@ -620,6 +634,9 @@ class TimeSeriesBuilder(object):
         :param stop: optional stop time of the bins
         :param extract_measured_background: Use the selected background rather than a polynomial fit to the background
         :param interval_name: the name of the interval
+        :param lazy: (with from_bins) return a sequence of plugins which are only built when accessed. The spectra
+        of all the bins are computed at once in any case, and the bins with a negative background are skipped (with a
+        warning) as when the plugins are built at once, so that the two sequences are the same
         :return: SpectrumLike plugin(s)
         """
 
@@ -696,16 +713,6 @@ class TimeSeriesBuilder(object):
                 self._time_series.bins is not None
             ), "This time series does not have any bins!"
 
-            # save the original interval if there is one
-            old_interval = copy.copy(self._active_interval)
-            old_verbose = copy.copy(self._verbose)
-
-            # we will keep it quiet to keep from being annoying
-
-            self._verbose = False
-
-            list_of_speclikes = []
-
             # get the bins from the time series
             # for event lists, these are from created bins
             # for binned spectra sets, these are the native bines
@@ -721,72 +728,38 @@ class TimeSeriesBuilder(object):
                 these_bins = these_bins.containing_interval(
                     start, stop, inner=False)
 
-            # loop through the intervals and create spec likes
+            # the spectra of all the bins are computed at once, the
+            # active time interval is left untouched
 
-            with progress_bar(len(these_bins), title="Creating plugins") as p:
+            plugin_factory, has_negative_background = self._get_bin_plugin_factory(
+                these_bins, interval_name, extract_measured_background
+            )
 
-                for i, interval in enumerate(these_bins):
+            for i in np.flatnonzero(has_negative_background):
 
-                    self.set_active_time_interval(interval.to_string())
+                custom_warnings.warn(
+                    "Something is wrong with interval %s. skipping." % these_bins[i]
+                )
 
-                    assert isinstance(
-                        self._observed_spectrum, BinnedSpectrum
-                    ), "You are attempting to create a SpectrumLike plugin from the wrong data type"
+            good_bins = np.flatnonzero(~has_negative_background)
 
-                    if extract_measured_background:
+            if lazy:
 
-                        this_background_spectrum = self._measured_background_spectrum
+                return LazyPluginList(plugin_factory, len(these_bins))[good_bins]
 
-                    else:
+            list_of_speclikes = []
 
-                        this_background_spectrum = self._background_spectrum
+            # loop through the intervals and create spec likes
 
-                    if this_background_spectrum is None:
-                        custom_warnings.warn(
-                            "No bakckground selection has been made. This plugin will contain no background!"
-                        )
+            with progress_bar(len(good_bins), title="Creating plugins") as p:
+
+                for i in good_bins:
+
+                    interval = these_bins[i]
 
                     try:
 
-                        if self._response is None:
-
-                            sl = SpectrumLike(
-                                name="%s%s%d" % (self._name, interval_name, i),
-                                observation=self._observed_spectrum,
-                                background=this_background_spectrum,
-                                verbose=self._verbose,
-                                tstart=self._tstart,
-                                tstop=self._tstop,
-                            )
-
-                        else:
-
-                            if not self._use_balrog:
-
-                                sl = DispersionSpectrumLike(
-                                    name="%s%s%d" % (
-                                        self._name, interval_name, i),
-                                    observation=self._observed_spectrum,
-                                    background=this_background_spectrum,
-                                    verbose=self._verbose,
-                                    tstart=self._tstart,
-                                    tstop=self._tstop,
-                                )
-
-                            else:
-
-                                sl = gbm_drm_gen.BALROGLike(
-                                    name="%s%s%d" % (
-                                        self._name, interval_name, i),
-                                    observation=self._observed_spectrum,
-                                    background=this_background_spectrum,
-                                    verbose=self._verbose,
-                                    time=0.5 * (self._tstart + self._tstop),
-                                    tstart=self._tstart,
-                                    tstop=self._tstop,
-                                )
-
-                        list_of_speclikes.append(sl)
+                        list_of_speclikes.append(plugin_factory(i))
 
                     except (NegativeBackground):
 
@@ -796,19 +769,143 @@ class TimeSeriesBuilder(object):
 
                     p.increase()
 
-            # restore the old interval
+            return list_of_speclikes
 
-            if old_interval is not None:
+    def _get_bin_plugin_factory(
+        self, these_bins, interval_name, extract_measured_background
+    ):
+        """
+        Compute the observed and background spectra of all the bins in one go (without
+        changing the active time interval) and return a function building the plugin
+        of the i-th bin
 
-                self.set_active_time_interval(*old_interval)
+        :param these_bins: the time bins
+        :param interval_name: the name of the interval
+        :param extract_measured_background: Use the selected background rather than a polynomial fit to the background
+        :return: (a function of the index of the bin, a boolean mask of the bins whose plugin cannot be built
+        because their background is negative)
+        """
+
+        starts = these_bins.start_times
+        stops = these_bins.stop_times
+
+        observed_information = self._time_series.get_information_dicts(starts, stops)
+
+        use_poly = not extract_measured_background
+
+        if self._time_series.poly_fit_exists:
+
+            background_information = self._time_series.get_information_dicts(
+                starts,
+                stops,
+                use_poly=use_poly,
+                extract=extract_measured_background,
+            )
+
+        else:
+
+            background_information = None
+
+        # the same checks on the background counts as SpectrumLike (which raises NegativeBackground),
+        # made before building any plugin
+
+        def is_negative(counts):
+
+            counts = np.asarray(counts)
+
+            if not use_poly:
+
+                # Poisson background
+
+                counts = counts.astype(np.int64)
+
+            return np.any(counts < 0)
+
+        if background_information is None:
+
+            has_negative_background = np.zeros(len(these_bins), dtype=bool)
+
+        else:
+
+            has_negative_background = np.array(
+                [is_negative(x["counts"]) for x in background_information], dtype=bool
+            )
+
+        def plugin_factory(i):
+
+            # the plugins share the matrix of the response, but not
+            # the model folded through it
+
+            if self._rsp_is_weighted:
+                response = self._weighted_rsp.weight_by_counts(
+                    these_bins[i].to_string()
+                )
+
+            elif self._response is not None and not self._use_balrog:
+                response = self._response.clone()
 
             else:
+                response = self._response
 
-                self._active_interval = None
+            observed_spectrum = self._container_type.from_information_dict(
+                observed_information[i], response
+            )
 
-            self._verbose = old_verbose
+            assert isinstance(
+                observed_spectrum, BinnedSpectrum
+            ), "You are attempting to create a SpectrumLike plugin from the wrong data type"
 
-            return list_of_speclikes
+            if background_information is None:
+
+                custom_warnings.warn(
+                    "No bakckground selection has been made. This plugin will contain no background!"
+                )
+
+                background_spectrum = None
+
+            else:
+
+                background_spectrum = self._container_type.from_information_dict(
+                    background_information[i], response, use_poly
+                )
+
+            name = "%s%s%d" % (self._name, interval_name, i)
+
+            if self._response is None:
+
+                return SpectrumLike(
+                    name=name,
+                    observation=observed_spectrum,
+                    background=background_spectrum,
+                    verbose=False,
+                    tstart=starts[i],
+                    tstop=stops[i],
+                )
+
+            elif not self._use_balrog:
+
+                return DispersionSpectrumLike(
+                    name=name,
+                    observation=observed_spectrum,
+                    background=background_spectrum,
+                    verbose=False,
+                    tstart=starts[i],
+                    tstop=stops[i],
+                )
+
+            else:
+
+                return gbm_drm_gen.BALROGLike(
+                    name=name,
+                    observation=observed_spectrum,
+                    background=background_spectrum,
+                    verbose=False,
+                    time=0.5 * (starts[i] + stops[i]),
+                    tstart=starts[i],
+                    tstop=stops[i],
+                )
+
+        return plugin_factory, has_negative_background
 
     @classmethod
     def from_gbm_tte(
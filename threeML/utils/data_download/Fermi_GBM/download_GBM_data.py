@@ -49,7 +49,12 @@ _detector_list = "n0,n1,n2,n3,n4,n5,n6,n7,n8,n9,na,nb,b0,b1".split(",")
 
 
 def download_GBM_trigger_data(
-    trigger_name, detectors=None, destination_directory=".", compress_tte=True
+    trigger_name,
+    detectors=None,
+    destination_directory=".",
+    compress_tte=True,
+    n_connections=4,
+    cache_directory=None,
 ):
     """
     Download the latest GBM TTE and RSP files from the HEASARC server. Will get the
@@ -63,6 +68,8 @@ def download_GBM_trigger_data(
     :param detectors: list of detectors, default is all detectors
     :param destination_directory: download directory
     :param compress_tte: compress the TTE files via gzip (default True)
+    :param n_connections: maximum number of files to download at the same time
+    :param cache_directory: (default: None) directory of the content-addressed cache of the downloads
     :return: a dictionary with information about the download
     """
 
@@ -181,36 +188,50 @@ def download_GBM_trigger_data(
         [(det, DictWithPrettyPrint()) for det in detectors]
     )
 
+    # Collect all the files first, so that they can be downloaded concurrently
+
+    remote_files = []
+    compress = []
+    destinations = []
+
     for detector in list(remote_files_info.keys()):
 
         remote_detector_info = remote_files_info[detector]
-        local_detector_info = download_info[detector]
 
         # Get CSPEC file
-        local_detector_info["cspec"] = downloader.download(
-            remote_detector_info["cspec"], destination_directory, progress=True
-        )
+        remote_files.append(remote_detector_info["cspec"])
+        compress.append(False)
+        destinations.append((detector, "cspec"))
 
         # Get the RSP2 file if it exists, otherwise get the RSP file
         if "rsp2" in remote_detector_info:
 
-            local_detector_info["rsp"] = downloader.download(
-                remote_detector_info["rsp2"], destination_directory, progress=True
-            )
+            remote_files.append(remote_detector_info["rsp2"])
 
         else:
 
-            local_detector_info["rsp"] = downloader.download(
-                remote_detector_info["rsp"], destination_directory, progress=True
-            )
+            remote_files.append(remote_detector_info["rsp"])
+
+        compress.append(False)
+        destinations.append((detector, "rsp"))
 
         # Get TTE file (compressing it if requested)
-        local_detector_info["tte"] = downloader.download(
-            remote_detector_info["tte"],
-            destination_directory,
-            progress=True,
-            compress=compress_tte,
-        )
+        remote_files.append(remote_detector_info["tte"])
+        compress.append(compress_tte)
+        destinations.append((detector, "tte"))
+
+    local_files = downloader.download_files(
+        remote_files,
+        destination_directory,
+        progress=True,
+        compress=compress,
+        n_connections=n_connections,
+        cache_directory=cache_directory,
+    )
+
+    for (detector, file_type), local_file in zip(destinations, local_files):
+
+        download_info[detector][file_type] = local_file
 
     return download_info
 
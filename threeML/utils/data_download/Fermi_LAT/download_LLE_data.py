@@ -18,7 +18,9 @@ _trigger_name_match = re.compile("^(bn|grb?)? ?(\d{9})$")
 _file_type_match = re.compile("gll_(\D{2,5})_bn\d{9}_v\d{2}\.\D{3}")
 
 
-def download_LLE_trigger_data(trigger_name, destination_directory="."):
+def download_LLE_trigger_data(
+    trigger_name, destination_directory=".", n_connections=4, cache_directory=None
+):
     """
     Download the latest Fermi LAT LLE and RSP files from the HEASARC server. Will get the
     latest file versions. If the files already exist in your destination
@@ -29,6 +31,8 @@ def download_LLE_trigger_data(trigger_name, destination_directory="."):
 
     :param trigger_name: trigger number (str) with no leading letter e.g. '080916009'
     :param destination_directory: download directory
+    :param n_connections: maximum number of files to download at the same time
+    :param cache_directory: (default: None) directory of the content-addressed cache of the downloads
     :return: a dictionary with information about the download
     """
 
@@ -63,7 +67,11 @@ def download_LLE_trigger_data(trigger_name, destination_directory="."):
     destination_directory_sanitized = sanitize_filename(destination_directory)
 
     downloaded_files = downloader.download_all_files(
-        destination_directory_sanitized, progress=True, pattern=pattern
+        destination_directory_sanitized,
+        progress=True,
+        pattern=pattern,
+        n_connections=n_connections,
+        cache_directory=cache_directory,
     )
 
     # Put the files in a structured dictionary
@@ -1,6 +1,5 @@
 import re
 import copy
-from operator import itemgetter, attrgetter
 import numpy as np
 
 
@@ -163,13 +162,78 @@ class IntervalSet(object):
     """
     A set of intervals
 
+    The starts and stops of the intervals are stored in two contiguous float64 arrays, which are never
+    modified in place (they are replaced by new arrays when the set changes), so that they can be shared
+    between sets. Interval instances (of type INTERVAL_TYPE) are only created when the elements of the set
+    are accessed.
+
     """
 
     INTERVAL_TYPE = Interval
 
     def __init__(self, list_of_intervals=()):
 
-        self._intervals = list(list_of_intervals)
+        if isinstance(list_of_intervals, IntervalSet):
+
+            # no need to copy, the arrays are read-only
+
+            self._set_arrays(list_of_intervals._starts, list_of_intervals._stops)
+
+        else:
+
+            list_of_intervals = list(list_of_intervals)
+
+            self._set_arrays(
+                np.array(
+                    [interval.start for interval in list_of_intervals], dtype=float
+                ),
+                np.array(
+                    [interval.stop for interval in list_of_intervals], dtype=float
+                ),
+            )
+
+    def _set_arrays(self, starts, stops):
+
+        starts.flags.writeable = False
+        stops.flags.writeable = False
+
+        self._starts = starts
+        self._stops = stops
+
+        # quantities derived from the arrays, computed when first needed
+
+        self._cache = {}
+
+    @classmethod
+    def _from_arrays(cls, starts, stops):
+        """
+        Create a new interval set of this type from arrays of starts and stops, without
+        creating the intervals
+
+        :param starts: array of starts
+        :param stops: array of stops
+        :return: interval set
+        """
+
+        starts = np.array(starts, dtype=float, ndmin=1)
+        stops = np.array(stops, dtype=float, ndmin=1)
+
+        inverted = stops < starts
+
+        if np.any(inverted):
+
+            idx = np.argmax(inverted)
+
+            raise RuntimeError(
+                "Invalid time interval! TSTART must be before TSTOP and TSTOP-TSTART >0. "
+                "Got tstart = %s and tstop = %s" % (starts[idx], stops[idx])
+            )
+
+        interval_set = IntervalSet.__new__(IntervalSet)
+
+        interval_set._set_arrays(starts, stops)
+
+        return cls.new(interval_set)
 
     @classmethod
     def new(cls, *args, **kwargs):
@@ -240,12 +304,7 @@ class IntervalSet(object):
             % (len(starts), len(stops))
         )
 
-        list_of_intervals = []
-
-        for imin, imax in zip(starts, stops):
-            list_of_intervals.append(cls.new_interval(imin, imax))
-
-        return cls(list_of_intervals)
+        return cls._from_arrays(starts, stops)
 
     @classmethod
     def from_list_of_edges(cls, edges):
@@ -260,14 +319,9 @@ class IntervalSet(object):
         """
         # sort the time edges
 
-        edges.sort()
+        edges = np.sort(np.array(edges, dtype=float))
 
-        list_of_intervals = []
-
-        for imin, imax in zip(edges[:-1], edges[1:]):
-            list_of_intervals.append(cls.new_interval(imin, imax))
-
-        return cls(list_of_intervals)
+        return cls._from_arrays(edges[:-1], edges[1:])
 
     def merge_intersecting_intervals(self, in_place=False):
         """
@@ -278,103 +332,122 @@ class IntervalSet(object):
         :return:
         """
 
-        # get a copy of the sorted intervals
-
-        sorted_intervals = self.sort()
+        order = np.argsort(self._starts, kind="mergesort")
 
-        new_intervals = []
+        starts = self._starts[order]
+        stops = self._stops[order]
 
-        while len(sorted_intervals) > 1:
+        # An interval starts a new group if it does not overlap with any of the previous ones,
+        # i.e., if it starts after (or exactly at) the largest stop seen so far. Intervals with
+        # the same start always overlap
 
-            # pop the first interval off the stack
+        max_stops = np.maximum.accumulate(stops)
 
-            this_interval = sorted_intervals.pop(0)
+        new_group = np.ones(len(starts), dtype=bool)
 
-            # see if that interval overlaps with the the next one
+        new_group[1:] = (starts[1:] >= max_stops[:-1]) & (starts[1:] != starts[:-1])
 
-            if this_interval.overlaps_with(sorted_intervals[0]):
+        group_starts = np.flatnonzero(new_group)
 
-                # if so, pop the next one
+        group_stops = np.append(group_starts[1:], len(starts)) - 1
 
-                next_interval = sorted_intervals.pop(0)
+        new_starts = starts[group_starts]
+        new_stops = max_stops[group_stops]
 
-                # and merge the two, appending them to the new intervals
-
-                new_intervals.append(this_interval.merge(next_interval))
-
-            else:
+        if in_place:
 
-                # otherwise just append this interval
+            self._set_arrays(new_starts, new_stops)
 
-                new_intervals.append(this_interval)
+        else:
 
-                # now if there is only one interval left
-                # it should not overlap with any other interval
-                # and the loop will stop
-                # otherwise, we continue
+            return self._from_arrays(new_starts, new_stops)
 
-        # if there was only one interval
-        # or a leftover from the merge
-        # we append it
-        if sorted_intervals:
+    def intersect(self, other):
+        """
+        Returns the intersection of this set with the provided one, i.e., the regions covered by both. The
+        intersecting intervals within each set are merged first, so the result is a sorted set of
+        non-overlapping intervals
 
-            assert (
-                len(sorted_intervals) == 1
-            ), "there should only be one interval left over, this is a bug"  # pragma: no cover
+        :param other: an IntervalSet instance (or a list of intervals)
+        :return: a new interval set
+        """
 
-            # we want to make sure that the last new interval did not
-            # overlap with the final interval
-            if new_intervals:
+        this = IntervalSet(self).merge_intersecting_intervals()
+        other = IntervalSet(other).merge_intersecting_intervals()
 
-                if new_intervals[-1].overlaps_with(sorted_intervals[0]):
+        # the intervals are now sorted and disjoint, hence their stops are sorted as well.
+        # For each interval of this set find the range [first, last) of intervals of the
+        # other set that overlap with it
 
-                    new_intervals[-1] = new_intervals[-1].merge(sorted_intervals[0])
+        first = np.searchsorted(other._stops, this._starts, side="right")
+        last = np.searchsorted(other._starts, this._stops, side="left")
 
-                else:
+        n_overlaps = np.maximum(last - first, 0)
 
-                    new_intervals.append(sorted_intervals[0])
+        # Expand into all the (i, j) pairs of overlapping intervals
 
-            else:
+        i = np.repeat(np.arange(len(this)), n_overlaps)
 
-                new_intervals.append(sorted_intervals[0])
+        offsets = np.repeat(np.cumsum(n_overlaps) - n_overlaps, n_overlaps)
 
-        if in_place:
+        j = np.arange(n_overlaps.sum()) - offsets + np.repeat(first, n_overlaps)
 
-            self.__init__(new_intervals)
+        starts = np.maximum(this._starts[i], other._starts[j])
+        stops = np.minimum(this._stops[i], other._stops[j])
 
-        else:
+        overlap = stops > starts
 
-            return self.new(new_intervals)
+        return self._from_arrays(starts[overlap], stops[overlap])
 
     def extend(self, list_of_intervals):
 
-        self._intervals.extend(list_of_intervals)
+        other = IntervalSet(list_of_intervals)
+
+        self._set_arrays(
+            np.concatenate((self._starts, other._starts)),
+            np.concatenate((self._stops, other._stops)),
+        )
 
     def __len__(self):
 
-        return len(self._intervals)
+        return self._starts.shape[0]
 
     def __iter__(self):
 
-        for interval in self._intervals:
-            yield interval
+        for start, stop in zip(self._starts, self._stops):
+            yield self.new_interval(start, stop)
 
     def __getitem__(self, item):
 
-        return self._intervals[item]
+        if isinstance(item, slice):
+
+            return [
+                self.new_interval(start, stop)
+                for start, stop in zip(self._starts[item], self._stops[item])
+            ]
+
+        return self.new_interval(self._starts[item], self._stops[item])
 
     def __eq__(self, other):
 
-        for interval_this, interval_other in zip(self.argsort(), other.argsort()):
+        if not isinstance(other, IntervalSet) or len(self) != len(other):
 
-            if not self[interval_this] == other[interval_other]:
-                return False
+            return False
+
+        this_order = self.argsort()
+        other_order = other.argsort()
 
-        return True
+        return np.array_equal(
+            self._starts[this_order], other._starts[other_order]
+        ) and np.array_equal(self._stops[this_order], other._stops[other_order])
 
     def pop(self, index):
 
-        return self._intervals.pop(index)
+        interval = self[index]
+
+        self._set_arrays(np.delete(self._starts, index), np.delete(self._stops, index))
+
+        return interval
 
     def sort(self):
         """
@@ -389,7 +462,9 @@ class IntervalSet(object):
 
         else:
 
-            return self.new(np.atleast_1d(itemgetter(*self.argsort())(self._intervals)))
+            order = self.argsort()
+
+            return self._from_arrays(self._starts[order], self._stops[order])
 
     def argsort(self):
         """
@@ -398,10 +473,9 @@ class IntervalSet(object):
         :return:
         """
 
-        # Gather all tstarts
-        tstarts = [x.start for x in self._intervals]
+        # a stable sort, so that intervals with the same start keep their order
 
-        return [x[0] for x in sorted(enumerate(tstarts), key=itemgetter(1))]
+        return np.argsort(self._starts, kind="mergesort").tolist()
 
     def is_contiguous(self, relative_tolerance=1e-5):
         """
@@ -411,10 +485,7 @@ class IntervalSet(object):
         :return: True or False
         """
 
-        starts = [attrgetter("start")(x) for x in self._intervals]
-        stops = [attrgetter("stop")(x) for x in self._intervals]
-
-        return np.allclose(starts[1:], stops[:-1], rtol=relative_tolerance)
+        return np.allclose(self._starts[1:], self._stops[:-1], rtol=relative_tolerance)
 
     @property
     def is_sorted(self):
@@ -423,7 +494,13 @@ class IntervalSet(object):
         :return: True or False
         """
 
-        return np.all(self.argsort() == np.arange(len(self)))
+        if "is_sorted" not in self._cache:
+
+            self._cache["is_sorted"] = bool(
+                np.all(self._starts[1:] >= self._starts[:-1])
+            )
+
+        return self._cache["is_sorted"]
 
     def containing_bin(self, value):
         """
@@ -451,12 +528,18 @@ class IntervalSet(object):
         :return:
         """
 
-        # loop only once because every call unpacks the array
         # we need to round for the comparison because we may have read from
-        # strings which are rounded to six decimals
+        # strings which are rounded to six decimals. The rounded arrays are
+        # computed only once
 
-        starts = np.round(self.starts, decimals=6)
-        stops = np.round(self.stops, decimals=6)
+        if "rounded" not in self._cache:
+
+            self._cache["rounded"] = (
+                np.round(self._starts, decimals=6),
+                np.round(self._stops, decimals=6),
+            )
+
+        starts, stops = self._cache["rounded"]
 
         start = np.round(start, decimals=6)
         stop = np.round(stop, decimals=6)
@@ -480,37 +563,37 @@ class IntervalSet(object):
 
         else:
 
-            return self.new(np.asarray(self._intervals)[condition])
+            return self._from_arrays(self._starts[condition], self._stops[condition])
 
     @property
     def starts(self):
         """
         Return the starts fo the set
 
-        :return: list of start times
+        :return: (read-only) array of start times
         """
 
-        return [interval.start for interval in self._intervals]
+        return self._starts
 
     @property
     def stops(self):
         """
         Return the stops of the set
 
-        :return:
+        :return: (read-only) array of stop times
         """
 
-        return [interval.stop for interval in self._intervals]
+        return self._stops
 
     @property
     def mid_points(self):
 
-        return np.array([interval.mid_point for interval in self._intervals])
+        return (self._starts + self._stops) / 2.0
 
     @property
     def widths(self):
 
-        return np.array([interval._get_width() for interval in self._intervals])
+        return self._stops - self._starts
 
     @property
     def absolute_start(self):
@@ -519,7 +602,7 @@ class IntervalSet(object):
         :return:
         """
 
-        return min(self.starts)
+        return self._starts.min()
 
     @property
     def absolute_stop(self):
@@ -528,7 +611,7 @@ class IntervalSet(object):
         :return:
         """
 
-        return max(self.stops)
+        return self._stops.max()
 
     @property
     def edges(self):
@@ -537,26 +620,23 @@ class IntervalSet(object):
         :return:
         """
 
-        if self.is_contiguous() and self.is_sorted:
+        if "edges" not in self._cache:
 
-            edges = [
-                interval.start
-                for interval in itemgetter(*self.argsort())(self._intervals)
-            ]
-            edges.append(
-                [
-                    interval.stop
-                    for interval in itemgetter(*self.argsort())(self._intervals)
-                ][-1]
-            )
+            if self.is_contiguous() and self.is_sorted:
 
-        else:
+                edges = np.append(self._starts, self._stops[-1:])
 
-            raise IntervalsNotContiguous(
-                "Cannot return edges for non-contiguous intervals"
-            )
+                edges.flags.writeable = False
 
-        return edges
+                self._cache["edges"] = edges
+
+            else:
+
+                raise IntervalsNotContiguous(
+                    "Cannot return edges for non-contiguous intervals"
+                )
+
+        return self._cache["edges"]
 
     def to_string(self):
         """
@@ -566,7 +646,9 @@ class IntervalSet(object):
         :return:
         """
 
-        return ",".join([interval.to_string() for interval in self._intervals])
+        return ",".join(
+            ["%f-%f" % (start, stop) for start, stop in zip(self._starts, self._stops)]
+        )
 
     @property
     def bin_stack(self):
@@ -578,4 +660,4 @@ class IntervalSet(object):
         :return:
         """
 
-        return np.vstack((self.starts, self.stops)).T
+        return np.vstack((self._starts, self._stops)).T
@@ -3,6 +3,8 @@ from builtins import zip
 from builtins import range
 from past.utils import old_div
 from builtins import object
+import copy
+
 import numpy as np
 import pandas as pd
 
@@ -33,14 +35,23 @@ class ChannelSet(IntervalSet):
         :return:
         """
 
-        new_ebounds = cls.from_list_of_edges(instrument_response.ebounds)
+        # the channel set is built only once for a response and its clones (see InstrumentResponse.clone),
+        # since interval sets are never modified in place
+
+        cache = getattr(instrument_response, "_cache", {})
+
+        key = ("channel_set", cls)
+
+        if key not in cache:
+
+            cache[key] = cls.from_list_of_edges(instrument_response.ebounds)
 
-        return new_ebounds
+        return cache[key]
 
     @property
     def channels_widths(self):
 
-        return np.array([channel.channel_width for channel in self._intervals])
+        return self.widths
 
 
 class Quality(object):
@@ -411,7 +422,8 @@ class BinnedSpectrum(Histogram):
     ):
         """
         make a new spectrum with new counts and errors and all other
-        parameters the same
+        parameters the same. The clone shares the energy boundaries, the quality
+        and the systematic errors with this spectrum (see _copy_with_new_counts)
 
 
         :param new_counts: new counts for the spectrum
@@ -430,19 +442,56 @@ class BinnedSpectrum(Histogram):
 
             new_scale_factor = self._scale_factor
 
-        return BinnedSpectrum(
-            counts=new_counts,
-            ebounds=ChannelSet.from_list_of_edges(self.edges),
-            exposure=new_exposure,
-            count_errors=new_count_errors,
-            sys_errors=self._sys_errors,
-            quality=self._quality,
-            scale_factor=new_scale_factor,
-            is_poisson=self._is_poisson,
-            mission=self._mission,
-            instrument=self._instrument,
+        return self._copy_with_new_counts(
+            new_counts, new_count_errors, new_exposure, new_scale_factor
         )
 
+    def _copy_with_new_counts(
+        self, new_counts, new_count_errors, new_exposure, new_scale_factor
+    ):
+        """
+        Make a shallow copy of this spectrum with new counts. Everything which does not
+        depend on the counts (the channel boundaries and their derived quantities, the quality,
+        the systematic errors, the response...) is shared with this spectrum and is not
+        validated again: only the new rates and rate errors are allocated.
+
+        NOTE: the shared members must never be modified in place
+
+        :param new_counts: new counts for the spectrum
+        :param new_count_errors: new count errors (None for Poisson spectra)
+        :param new_exposure: the exposure of the new spectrum
+        :param new_scale_factor: the scale factor of the new spectrum
+        :return: the new spectrum
+        """
+
+        assert len(new_counts) == len(
+            self._contents
+        ), "contents and intervals are not the same dimension "
+
+        new_spectrum = copy.copy(self)
+
+        new_spectrum._exposure = new_exposure
+
+        new_spectrum._scale_factor = new_scale_factor
+
+        new_spectrum._contents = np.array(old_div(new_counts, new_exposure))
+
+        if new_count_errors is not None:
+
+            assert not self._is_poisson, "Read count errors but spectrum marked Poisson"
+
+            assert len(new_count_errors) == len(
+                new_counts
+            ), "contents and errors are not the same dimension "
+
+            new_spectrum._errors = np.array(old_div(new_count_errors, new_exposure))
+
+        else:
+
+            new_spectrum._errors = None
+
+        return new_spectrum
+
     @classmethod
     def from_pandas(
         cls,
@@ -596,7 +645,7 @@ class BinnedSpectrum(Histogram):
         if new_sys_errors is None:
             new_sys_errors = other.sys_errors
         elif other.sys_errors is not None:
-            new_sys_errors += other.sys_errors
+            new_sys_errors = new_sys_errors + other.sys_errors
 
         new_exposure = self.exposure + other.exposure
 
@@ -658,7 +707,7 @@ class BinnedSpectrum(Histogram):
         if new_sys_errors is None:
             new_sys_errors = other.sys_errors
         elif other.sys_errors is not None:
-            new_sys_errors += other.sys_errors
+            new_sys_errors = new_sys_errors + other.sys_errors
 
         new_exposure = self.exposure + other.exposure
 
@@ -802,6 +851,20 @@ class BinnedSpectrumWithDispersion(BinnedSpectrum):
 
         pha_information = time_series.get_information_dict(use_poly, extract)
 
+        return cls.from_information_dict(pha_information, response, use_poly)
+
+    @classmethod
+    def from_information_dict(cls, pha_information, response=None, use_poly=False):
+        """
+        Build the spectrum from an information dict of a time series (see
+        TimeSeries.get_information_dict and TimeSeries.get_information_dicts)
+
+        :param pha_information: the information dict
+        :param response: the response of the spectrum
+        :param use_poly: whether the dict was built from the polynomial fits
+        :return:
+        """
+
         is_poisson = True
 
         if use_poly:
@@ -833,7 +896,8 @@ class BinnedSpectrumWithDispersion(BinnedSpectrum):
     ):
         """
         make a new spectrum with new counts and errors and all other
-        parameters the same
+        parameters the same. The clone shares the response, the energy boundaries
+        and the quality with this spectrum (see _copy_with_new_counts)
 
 
         :param new_sys_errors:
@@ -858,19 +922,20 @@ class BinnedSpectrumWithDispersion(BinnedSpectrum):
 
             new_scale_factor = self._scale_factor
 
-        return BinnedSpectrumWithDispersion(
-            counts=new_counts,
-            exposure=new_exposure,
-            response=self._rsp,
-            count_errors=new_count_errors,
-            sys_errors=new_sys_errors,
-            quality=self._quality,
-            scale_factor=new_scale_factor,
-            is_poisson=self._is_poisson,
-            mission=self._mission,
-            instrument=self._instrument,
+        new_spectrum = self._copy_with_new_counts(
+            new_counts, new_count_errors, new_exposure, new_scale_factor
         )
 
+        if new_sys_errors is not self._sys_errors:
+
+            assert len(new_sys_errors) == len(
+                new_counts
+            ), "contents and errors are not the same dimension "
+
+            new_spectrum._sys_errors = np.array(new_sys_errors)
+
+        return new_spectrum
+
     def __add__(self, other):
         # TODO implement equality in InstrumentResponse class
         assert self.response is other.response
@@ -5,19 +5,90 @@ from threeML.utils.spectrum.binned_spectrum import BinnedSpectrum
 from threeML.utils.time_interval import TimeIntervalSet
 
 
+class LazyBinnedSpectrumList(object):
+    def __init__(self, spectrum_factory, n_spectra):
+        """
+        A sequence of binned spectra which are built only when they are accessed (and then kept). This
+        is used for large sets (for example PHA II time series) whose data are already stored in columns,
+        so that thousands of spectra do not need to be built if only their columns are used.
+
+        :param spectrum_factory: a function returning the i-th spectrum
+        :param n_spectra: the number of spectra
+        """
+
+        self._spectrum_factory = spectrum_factory
+        self._indices = np.arange(n_spectra)
+        self._spectra = {}
+
+    def __len__(self):
+
+        return len(self._indices)
+
+    def __getitem__(self, item):
+
+        if isinstance(item, (int, np.integer)):
+
+            idx = int(self._indices[item])
+
+            if idx not in self._spectra:
+
+                self._spectra[idx] = self._spectrum_factory(idx)
+
+            return self._spectra[idx]
+
+        # a slice, a mask or an array of indices: return a (lazy) view sharing the spectra built so far
+
+        new_list = type(self)(self._spectrum_factory, 0)
+
+        new_list._indices = self._indices[item]
+        new_list._spectra = self._spectra
+
+        return new_list
+
+    def __iter__(self):
+
+        for i in range(len(self)):
+
+            yield self[i]
+
+
 class BinnedSpectrumSet(object):
-    def __init__(self, binned_spectrum_list, reference_time=0.0, time_intervals=None):
+    def __init__(
+        self,
+        binned_spectrum_list,
+        reference_time=0.0,
+        time_intervals=None,
+        columns=None,
+    ):
         """
         a set of binned spectra with optional time intervals
 
+        The per-bin quantities (counts, exposure...) are stored as (n_bins, ...) arrays, which are built only
+        once. They can also be provided directly through columns (for example when reading a PHA II file), in
+        which case the binned spectra themselves do not need to be built (see LazyBinnedSpectrumList)
+
         :param binned_spectrum_list: lit of binned spectal
         :param reference_time: reference time for time intervals
         :param time_intervals: optional timeinterval set
+        :param columns: (optional) dictionary of per-bin arrays, with keys among counts, count_errors, rates,
+        rate_errors, sys_errors and exposure
         """
 
         self._binned_spectrum_list = binned_spectrum_list  # type: list(BinnedSpectrum)
         self._reference_time = reference_time
 
+        self._columns = {}
+
+        if columns is not None:
+
+            for key, value in columns.items():
+
+                assert len(value) == len(
+                    binned_spectrum_list
+                ), "columns must be the same length as binned spectra"
+
+                self._columns[key] = value
+
         # normalize the time intervals if there are any
 
         if time_intervals is not None:
@@ -79,10 +150,24 @@ class BinnedSpectrumSet(object):
 
         self._binned_spectrum_list = self._binned_spectrum_list[idx]
 
+        self._columns = dict(
+            (key, column[idx]) for key, column in self._columns.items()
+        )
+
         # sort the time intervals in place
 
         self._time_intervals.sort()
 
+    def _get_column(self, name):
+
+        if name not in self._columns:
+
+            self._columns[name] = np.array(
+                [getattr(spectrum, name) for spectrum in self._binned_spectrum_list]
+            )
+
+        return self._columns[name]
+
     @property
     def quality_per_bin(self):
 
@@ -96,38 +181,32 @@ class BinnedSpectrumSet(object):
     @property
     def counts_per_bin(self):
 
-        return np.array([spectrum.counts for spectrum in self._binned_spectrum_list])
+        return self._get_column("counts")
 
     @property
     def count_errors_per_bin(self):
 
-        return np.array(
-            [spectrum.count_errors for spectrum in self._binned_spectrum_list]
-        )
+        return self._get_column("count_errors")
 
     @property
     def rates_per_bin(self):
 
-        return np.array([spectrum.rates for spectrum in self._binned_spectrum_list])
+        return self._get_column("rates")
 
     @property
     def rate_errors_per_bin(self):
 
-        return np.array(
-            [spectrum.rate_errors for spectrum in self._binned_spectrum_list]
-        )
+        return self._get_column("rate_errors")
 
     @property
     def sys_errors_per_bin(self):
 
-        return np.array(
-            [spectrum.sys_errors for spectrum in self._binned_spectrum_list]
-        )
+        return self._get_column("sys_errors")
 
     @property
     def exposure_per_bin(self):
 
-        return np.array([spectrum.exposure for spectrum in self._binned_spectrum_list])
+        return self._get_column("exposure")
 
     @property
     def time_intervals(self):
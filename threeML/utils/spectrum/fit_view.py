@@ -0,0 +1,109 @@
+import numpy as np
+
+
+class FitView(object):
+    def __init__(self, mask, channel_set, rebinner=None):
+        """
+        The channels of a spectrum which are used in the fit, compiled once for a given mask and rebinner
+        so that the likelihood does not have to select (and rebin) all the channels at every evaluation.
+
+        The model is evaluated on the active channels only (see emin and emax), and then summed over the
+        bins of the rebinner (if any) with rebin. A vector defined on all the channels is reduced in the
+        same way with reduce.
+
+        :param mask: boolean array selecting the active channels
+        :param channel_set: the channels of the spectrum (an IntervalSet, like the spectrum itself)
+        :param rebinner: (optional) the Rebinner in use. Its bins must cover the channels selected by the mask
+        """
+
+        self._mask = np.array(mask, dtype=bool)
+
+        self._channels = np.flatnonzero(self._mask)
+
+        self._emin = channel_set.starts[self._channels]
+        self._emax = channel_set.stops[self._channels]
+
+        if rebinner is not None:
+
+            self._bin_starts = rebinner.masked_bin_starts
+
+            assert rebinner.n_bins == 0 or self._bin_starts[-1] < len(
+                self._channels
+            ), "The bins of the rebinner do not match the mask"
+
+            self._n_bins = rebinner.n_bins
+
+        else:
+
+            self._bin_starts = None
+
+            self._n_bins = len(self._channels)
+
+    @property
+    def mask(self):
+
+        return self._mask
+
+    @property
+    def channels(self):
+        """
+        :return: the indexes of the active channels
+        """
+
+        return self._channels
+
+    @property
+    def bin_starts(self):
+        """
+        :return: the starts of the bins in the vector of the active channels (None if there is no rebinning)
+        """
+
+        return self._bin_starts
+
+    @property
+    def n_bins(self):
+        """
+        :return: number of elements in the fit (bins if rebinned, active channels otherwise)
+        """
+
+        return self._n_bins
+
+    @property
+    def emin(self):
+        """
+        :return: the low energy boundaries of the active channels
+        """
+
+        return self._emin
+
+    @property
+    def emax(self):
+        """
+        :return: the high energy boundaries of the active channels
+        """
+
+        return self._emax
+
+    def rebin(self, active_vector):
+        """
+        Sum a vector defined on the active channels over the bins of the rebinner (if any)
+
+        :param active_vector: vector with one element per active channel
+        :return: the rebinned vector
+        """
+
+        if self._bin_starts is None:
+
+            return active_vector
+
+        return np.add.reduceat(active_vector, self._bin_starts)
+
+    def reduce(self, vector):
+        """
+        Select the active channels of a vector defined on all the channels, and rebin it (if needed)
+
+        :param vector: vector with one element per channel
+        :return: the reduced vector
+        """
+
+        return self.rebin(np.asarray(vector)[self._channels])
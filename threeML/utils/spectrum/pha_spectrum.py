@@ -10,11 +10,13 @@ import warnings
 import six
 
 
-from threeML.io.progress_bar import progress_bar
 from threeML.utils.OGIP.response import OGIPResponse, InstrumentResponse
 from threeML.utils.OGIP.pha import PHAII
 from threeML.utils.spectrum.binned_spectrum import BinnedSpectrumWithDispersion, Quality
-from threeML.utils.spectrum.binned_spectrum_set import BinnedSpectrumSet
+from threeML.utils.spectrum.binned_spectrum_set import (
+    BinnedSpectrumSet,
+    LazyBinnedSpectrumList,
+)
 from threeML.utils.time_interval import TimeIntervalSet
 
 _required_keywords = {}
@@ -64,18 +66,20 @@ def _read_pha_or_pha2_file(
     used for reading time series (MUCH faster than building a lot of individual spectra) and single spectra.
 
 
-    :param pha_file_or_instance: either a PHA file name or threeML.plugins.OGIP.pha.PHAII instance
+    :param pha_file_or_instance: either a PHA file name, threeML.plugins.OGIP.pha.PHAII instance or an opened
+    FITS file (astropy HDUList)
     :param spectrum_number: (optional) the spectrum number of the TypeII file to be used
     :param file_type: observed or background
     :param rsp_file: RMF filename or threeML.plugins.OGIP.response.InstrumentResponse instance
     :param arf_file: (optional) and ARF filename
-    :param treat_as_time_series:
+    :param treat_as_time_series: read all the spectra of a TypeII file at once. The counts are then
+    returned as a (n_spectra, n_channels) array (the COUNTS column itself, if the file has one)
     :return:
     """
 
-    assert isinstance(pha_file_or_instance, six.string_types) or isinstance(
-        pha_file_or_instance, PHAII
-    ), "Must provide a FITS file name or PHAII instance"
+    assert isinstance(
+        pha_file_or_instance, (six.string_types, PHAII, fits.HDUList)
+    ), "Must provide a FITS file name, PHAII instance or an open FITS file"
 
     if isinstance(pha_file_or_instance, six.string_types):
 
@@ -102,6 +106,16 @@ def _read_pha_or_pha2_file(
 
         filename = "pha_instance"
 
+    elif isinstance(pha_file_or_instance, fits.HDUList):
+
+        # an already opened FITS file (the columns are used as they are, so they can be memory-mapped)
+
+        filename = pha_file_or_instance.filename()
+
+        if filename is None:
+
+            filename = "pha_instance"
+
     else:
 
         raise RuntimeError("This is a bug")
@@ -451,14 +465,19 @@ def _read_pha_or_pha2_file(
 
             else:
 
-                rates = old_div(data.field(data_column_name), np.atleast_2d(exposure).T)
+                # keep the columns as they are, there is no need to go through the rates
+
+                raw_counts = data.field(data_column_name)
+
+                rates = raw_counts / np.atleast_2d(exposure).T
 
                 rate_errors = None
 
                 if not is_poisson:
-                    rate_errors = old_div(
-                        data.field("STAT_ERR"), np.atleast_2d(exposure).T
-                    )
+
+                    raw_count_errors = data.field("STAT_ERR")
+
+                    rate_errors = raw_count_errors / np.atleast_2d(exposure).T
 
         if "SYS_ERR" in data.columns.names:
 
@@ -516,12 +535,11 @@ def _read_pha_or_pha2_file(
 
                 else:
 
-                    quality = np.zeros_like(rates, dtype=int)
+                    # one QUALITY value per spectrum
 
-                    for i, q in enumerate(quality_element):
+                    quality = np.zeros_like(rates, dtype=int)
 
-                        if q != 0:
-                            quality[i, :] = 5
+                    quality[np.asarray(quality_element) != 0, :] = 5
 
         else:
 
@@ -673,11 +691,17 @@ def _read_pha_or_pha2_file(
 
         exposure = np.atleast_2d(exposure).T
 
-        counts = rates * exposure
+        if has_rates:
+
+            counts = rates * exposure
+
+        else:
+
+            counts = raw_counts
 
         if not is_poisson:
 
-            count_errors = rate_errors * exposure
+            count_errors = rate_errors * exposure if has_rates else raw_count_errors
 
         else:
 
@@ -854,7 +878,10 @@ p
     ):
         """
         make a new spectrum with new counts and errors and all other
-        parameters the same
+        parameters the same. The clone shares the response, the energy boundaries
+        and the quality with this spectrum, instead of going through a new PHAII
+        instance. As it does not come from a file, it has no background, response or
+        ancillary file
 
 
         :param new_exposure: the new exposure for the clone
@@ -873,13 +900,6 @@ p
             new_counts = self.counts
             new_count_errors = self.count_errors
 
-        if new_count_errors is None:
-            stat_err = None
-
-        else:
-
-            stat_err = old_div(new_count_errors, new_exposure)
-
         if self._tstart is None:
 
             tstart = 0
@@ -890,36 +910,43 @@ p
 
         if self._tstop is None:
 
-            telapse = new_exposure
+            tstop = tstart + new_exposure
 
         else:
 
-            telapse = self._tstop - tstart
+            tstop = self._tstop
 
         if new_scale_factor is None:
 
             new_scale_factor = self.scale_factor
 
-        # create a new PHAII instance
-
-        pha = PHAII(
-            instrument_name=self.instrument,
-            telescope_name=self.mission,
-            tstart=tstart,
-            telapse=telapse,
-            channel=list(range(1, len(self) + 1)),
-            rate=old_div(new_counts, self.exposure),
-            stat_err=stat_err,
-            quality=self.quality.to_ogip(),
-            grouping=self.grouping,
-            exposure=new_exposure,
-            backscale=new_scale_factor,
-            respfile=None,
-            ancrfile=None,
-            is_poisson=self.is_poisson,
+        new_spectrum = self._copy_with_new_counts(
+            new_counts, new_count_errors, new_exposure, new_scale_factor
         )
 
-        return pha
+        new_spectrum._tstart = tstart
+
+        new_spectrum._tstop = tstop
+
+        new_spectrum._grouping = np.ones_like(new_spectrum._contents)
+
+        new_spectrum._file_name = "pha_instance"
+
+        gathered_keywords = dict(self._gathered_keywords)
+
+        gathered_keywords["exposure"] = new_exposure
+
+        gathered_keywords["backscal"] = new_scale_factor
+
+        for key in ["backfile", "respfile", "ancrfile"]:
+
+            if key in gathered_keywords:
+
+                gathered_keywords[key] = None
+
+        new_spectrum._gathered_keywords = gathered_keywords
+
+        return new_spectrum
 
     @classmethod
     def from_dispersion_spectrum(cls, dispersion_spectrum, file_type="observed"):
@@ -976,7 +1003,12 @@ p
 
 class PHASpectrumSet(BinnedSpectrumSet):
     def __init__(
-        self, pha_file_or_instance, file_type="observed", rsp_file=None, arf_file=None
+        self,
+        pha_file_or_instance,
+        file_type="observed",
+        rsp_file=None,
+        arf_file=None,
+        memory_map=False,
     ):
         """
         A spectrum with dispersion build from an OGIP-compliant PHA FITS file. Both Type I & II files can be read. Type II
@@ -984,12 +1016,17 @@ class PHASpectrumSet(BinnedSpectrumSet):
         in XSPEC. If the file_type is background, a 3ML InstrumentResponse or subclass must be passed so that the energy
         bounds can be obtained.
 
+        The data are kept in columns, i.e., the counts are a single (n_spectra, n_channels) array, and the
+        individual spectra are built only if they are accessed.
+
 
         :param pha_file_or_instance: either a PHA file name or threeML.plugins.OGIP.pha.PHAII instance
         :param spectrum_number: (optional) the spectrum number of the TypeII file to be used
         :param file_type: observed or background
         :param rsp_file: RMF filename or threeML.plugins.OGIP.response.InstrumentResponse instance
         :param arf_file: (optional) and ARF filename
+        :param memory_map: (optional) if True, the COUNTS column is memory-mapped from the file instead of
+        being read in memory
         """
 
         # extract the spectrum number if needed
@@ -998,59 +1035,35 @@ class PHASpectrumSet(BinnedSpectrumSet):
             pha_file_or_instance, PHAII
         ), "Must provide a FITS file name or PHAII instance"
 
-        with fits.open(pha_file_or_instance) as f:
-
-            try:
+        if isinstance(pha_file_or_instance, six.string_types):
 
-                HDUidx = f.index_of("SPECTRUM")
+            with fits.open(pha_file_or_instance, memmap=memory_map) as f:
 
-            except:
-
-                raise RuntimeError(
-                    "The input file %s is not in PHA format" % (pha2_file)
+                pha_information, time_intervals, header = self._read_columns(
+                    f, file_type, rsp_file, arf_file
                 )
 
-            spectrum = f[HDUidx]
-            data = spectrum.data
-
-            if "COUNTS" in data.columns.names:
-
-                has_rates = False
-                data_column_name = "COUNTS"
-
-            elif "RATE" in data.columns.names:
-
-                has_rates = True
-                data_column_name = "RATE"
-
-            else:
+        else:
 
-                raise RuntimeError(
-                    "This file does not contain a RATE nor a COUNTS column. "
-                    "This is not a valid PHA file"
-                )
+            pha_information, time_intervals, header = self._read_columns(
+                pha_file_or_instance, file_type, rsp_file, arf_file
+            )
 
-                # Determine if this is a PHA I or PHA II
-            if len(data.field(data_column_name).shape) == 2:
+        counts = pha_information["counts"]
 
-                num_spectra = data.field(data_column_name).shape[0]
+        if not memory_map:
 
-            else:
+            counts = np.array(counts, dtype=float)
 
-                raise RuntimeError("This appears to be a PHA I and not PHA II file")
+        num_spectra = counts.shape[0]
 
-        pha_information = _read_pha_or_pha2_file(
-            pha_file_or_instance,
-            None,
-            file_type,
-            rsp_file,
-            arf_file,
-            treat_as_time_series=True,
-        )
+        exposure = np.broadcast_to(
+            pha_information["exposure"][:, 0], (num_spectra,)
+        ).astype(float)
 
         # default the grouping to all open bins
         # this will only be altered if the spectrum is rebinned
-        self._grouping = np.ones_like(pha_information["counts"])
+        self._grouping = np.ones_like(counts)
 
         # this saves the extra properties to the class
 
@@ -1058,6 +1071,15 @@ class PHASpectrumSet(BinnedSpectrumSet):
 
         self._file_type = file_type
 
+        self._file_name = pha_information["file_name"]
+
+        columns = dict(
+            counts=counts,
+            rates=pha_information["rates"],
+            sys_errors=pha_information["sys_errors"],
+            exposure=exposure,
+        )
+
         # need to see if we have count errors, tstart, tstop
         # if not, we create an list of None
 
@@ -1069,6 +1091,9 @@ class PHASpectrumSet(BinnedSpectrumSet):
 
             count_errors = pha_information["count_errors"]
 
+            columns["count_errors"] = count_errors
+            columns["rate_errors"] = pha_information["rate_errors"]
+
         if pha_information["tstart"] is None:
 
             tstart = [None] * num_spectra
@@ -1085,56 +1110,90 @@ class PHASpectrumSet(BinnedSpectrumSet):
 
             tstop = pha_information["tstop"]
 
-        # now build the list of binned spectra
-
-        list_of_binned_spectra = []
-
-        with progress_bar(num_spectra, title="Loading PHAII spectra") as p:
-            for i in range(num_spectra):
-
-                list_of_binned_spectra.append(
-                    BinnedSpectrumWithDispersion(
-                        counts=pha_information["counts"][i],
-                        exposure=pha_information["exposure"][i, 0],
-                        response=pha_information["rsp"],
-                        count_errors=count_errors[i],
-                        sys_errors=pha_information["sys_errors"][i],
-                        is_poisson=pha_information["is_poisson"],
-                        quality=pha_information["quality"].get_slice(i),
-                        mission=pha_information["gathered_keywords"]["mission"],
-                        instrument=pha_information["gathered_keywords"]["instrument"],
-                        tstart=tstart[i],
-                        tstop=tstop[i],
-                    )
-                )
-
-                p.increase()
-
-        # now get the time intervals
-
-        start_times = data.field("TIME")
-        stop_times = data.field("ENDTIME")
-
-        time_intervals = TimeIntervalSet.from_starts_and_stops(start_times, stop_times)
+        # the binned spectra are built only if they are accessed
+
+        def spectrum_factory(i):
+
+            return BinnedSpectrumWithDispersion(
+                counts=counts[i],
+                exposure=exposure[i],
+                response=pha_information["rsp"],
+                count_errors=count_errors[i],
+                sys_errors=pha_information["sys_errors"][i],
+                is_poisson=pha_information["is_poisson"],
+                quality=pha_information["quality"].get_slice(i),
+                mission=pha_information["gathered_keywords"]["mission"],
+                instrument=pha_information["gathered_keywords"]["instrument"],
+                tstart=tstart[i],
+                tstop=tstop[i],
+            )
 
         reference_time = 0
 
         # see if there is a reference time in the file
 
-        if "TRIGTIME" in spectrum.header:
-            reference_time = spectrum.header["TRIGTIME"]
+        if "TRIGTIME" in header:
+            reference_time = header["TRIGTIME"]
 
-        for t_number in range(spectrum.header["TFIELDS"]):
+        for t_number in range(header["TFIELDS"]):
 
-            if "TZERO%d" % t_number in spectrum.header:
-                reference_time = spectrum.header["TZERO%d" % t_number]
+            if "TZERO%d" % t_number in header:
+                reference_time = header["TZERO%d" % t_number]
 
         super(PHASpectrumSet, self).__init__(
-            list_of_binned_spectra,
+            LazyBinnedSpectrumList(spectrum_factory, num_spectra),
             reference_time=reference_time,
             time_intervals=time_intervals,
+            columns=columns,
+        )
+
+    @staticmethod
+    def _read_columns(pha_file, file_type, rsp_file, arf_file):
+
+        try:
+
+            HDUidx = pha_file.index_of("SPECTRUM")
+
+        except:
+
+            raise RuntimeError("The input file %s is not in PHA format" % (pha_file))
+
+        spectrum = pha_file[HDUidx]
+        data = spectrum.data
+
+        if "COUNTS" in data.columns.names:
+
+            data_column_name = "COUNTS"
+
+        elif "RATE" in data.columns.names:
+
+            data_column_name = "RATE"
+
+        else:
+
+            raise RuntimeError(
+                "This file does not contain a RATE nor a COUNTS column. "
+                "This is not a valid PHA file"
+            )
+
+        # Determine if this is a PHA I or PHA II
+
+        if len(data.field(data_column_name).shape) != 2:
+
+            raise RuntimeError("This appears to be a PHA I and not PHA II file")
+
+        pha_information = _read_pha_or_pha2_file(
+            pha_file, None, file_type, rsp_file, arf_file, treat_as_time_series=True,
         )
 
+        # now get the time intervals
+
+        time_intervals = TimeIntervalSet.from_starts_and_stops(
+            data.field("TIME"), data.field("ENDTIME")
+        )
+
+        return pha_information, time_intervals, spectrum.header
+
     def _return_file(self, key):
 
         if key in self._gathered_keywords:
@@ -0,0 +1,259 @@
+import numpy as np
+
+from threeML.utils.statistics.stats_tools import Significance
+
+
+class SpectrumResiduals(object):
+    def __init__(
+        self,
+        observed_counts,
+        model_counts,
+        observation_noise_model,
+        background_noise_model=None,
+        background_counts=None,
+        background_errors=None,
+        observed_count_errors=None,
+        scale_factor=1.0,
+    ):
+        """
+        Residuals and significances of a count spectrum, computed for all the channels (or bins) at once.
+        The same quantities for groups of channels are obtained from the instance returned by rebin, which sums
+        all the vectors in one pass.
+
+        :param observed_counts: the observed counts
+        :param model_counts: the counts expected from the model (can be None if only the significance is needed)
+        :param observation_noise_model: the noise model of the observation (poisson or gaussian)
+        :param background_noise_model: the noise model of the background (poisson, gaussian, ideal, modeled or None)
+        :param background_counts: the background counts (not rescaled)
+        :param background_errors: the errors on the background counts
+        :param observed_count_errors: the errors on the observed counts
+        :param scale_factor: the ratio between the source and the background exposure and area
+        """
+
+        self._observed_counts = np.asarray(observed_counts, dtype=float)
+
+        n_elements = self._observed_counts.shape[0]
+
+        self._model_counts = self._as_array(model_counts, n_elements)
+
+        self._observation_noise_model = observation_noise_model
+        self._background_noise_model = background_noise_model
+
+        self._background_counts = self._as_array(background_counts, n_elements)
+        self._background_errors = self._as_array(background_errors, n_elements)
+        self._observed_count_errors = self._as_array(observed_count_errors, n_elements)
+
+        self._scale_factor = scale_factor
+
+    @staticmethod
+    def _as_array(vector, n_elements):
+
+        if vector is None:
+
+            return None
+
+        vector = np.asarray(vector, dtype=float)
+
+        assert (
+            vector.shape[0] == n_elements
+        ), "All the vectors must have the same number of elements"
+
+        return vector
+
+    @property
+    def observed_counts(self):
+
+        return self._observed_counts
+
+    @property
+    def model_counts(self):
+
+        return self._model_counts
+
+    @property
+    def background_counts(self):
+
+        return self._background_counts
+
+    @property
+    def background_errors(self):
+
+        return self._background_errors
+
+    @property
+    def observed_count_errors(self):
+
+        return self._observed_count_errors
+
+    def rebin(self, fit_view):
+        """
+        Sum the counts over the bins of a FitView (selecting its active channels), and the errors in quadrature.
+
+        :param fit_view: the FitView instance
+        :return: a new SpectrumResiduals instance for the bins
+        """
+
+        # stack the vectors, so that all of them are rebinned at once
+
+        counts = [
+            x
+            for x in (
+                self._observed_counts,
+                self._model_counts,
+                self._background_counts,
+            )
+            if x is not None
+        ]
+
+        errors = [
+            x
+            for x in (self._background_errors, self._observed_count_errors)
+            if x is not None
+        ]
+
+        rebinned_counts = iter(fit_view.reduce(np.vstack(counts).T).T)
+
+        if errors:
+
+            rebinned_errors = iter(
+                np.sqrt(fit_view.reduce(np.square(np.vstack(errors)).T).T)
+            )
+
+        else:
+
+            rebinned_errors = iter([])
+
+        def next_or_none(vector, rebinned_vectors):
+
+            return None if vector is None else next(rebinned_vectors)
+
+        observed_counts = next(rebinned_counts)
+        model_counts = next_or_none(self._model_counts, rebinned_counts)
+        background_counts = next_or_none(self._background_counts, rebinned_counts)
+        background_errors = next_or_none(self._background_errors, rebinned_errors)
+        observed_count_errors = next_or_none(
+            self._observed_count_errors, rebinned_errors
+        )
+
+        return SpectrumResiduals(
+            observed_counts,
+            model_counts,
+            self._observation_noise_model,
+            self._background_noise_model,
+            background_counts,
+            background_errors,
+            observed_count_errors,
+            self._scale_factor,
+        )
+
+    def get_residuals(self, ratio_residuals=False):
+        """
+        Compute the residuals of the observed counts with respect to the model, according to the noise models:
+        significance in sigma units (Li & Ma, or the Poisson probability for a known background) for Poisson
+        observations, (observed - model) / error for Gaussian ones
+
+        :param ratio_residuals: return the residuals as (observed - model) / model instead
+        :return: (residuals, residual_errors). The errors are None unless ratio_residuals is True
+        """
+
+        assert self._model_counts is not None, "No model counts provided"
+
+        if ratio_residuals:
+
+            residuals = (
+                self._observed_counts - self._model_counts
+            ) / self._model_counts
+
+            residual_errors = self._observed_count_errors / self._model_counts
+
+            return residuals, residual_errors
+
+        if self._observation_noise_model == "poisson":
+
+            if self._background_noise_model is None:
+
+                background_counts = np.zeros_like(self._observed_counts)
+
+            else:
+
+                background_counts = self._background_counts
+
+            # the model is treated as part of the background, so that the significance is the one of
+            # the data over the whole expected counts
+
+            significance_calc = Significance(
+                self._observed_counts,
+                background_counts + self._model_counts / self._scale_factor,
+                min([self._scale_factor, 1.0]),
+            )
+
+            if self._background_noise_model == "poisson":
+
+                residuals = significance_calc.li_and_ma()
+
+            elif self._background_noise_model == "gaussian":
+
+                residuals = significance_calc.li_and_ma_equivalent_for_gaussian_background(
+                    self._background_errors
+                )
+
+            elif self._background_noise_model in [None, "ideal", "modeled"]:
+
+                residuals = significance_calc.known_background()
+
+            else:
+
+                raise RuntimeError("This is a bug")
+
+        else:
+
+            if self._background_noise_model is None:
+
+                residuals = (
+                    self._observed_counts - self._model_counts
+                ) / self._observed_count_errors
+
+            else:
+
+                raise NotImplementedError("Not yet implemented")
+
+        return residuals, None
+
+    def get_significance(self):
+        """
+        Compute the significance of the observed counts over the background (the model is not used)
+
+        :return: the significance of each element
+        """
+
+        assert (
+            self._background_counts is not None
+        ), "Cannot compute the significance without a background"
+
+        if self._observation_noise_model != "poisson":
+
+            raise NotImplementedError("We haven't put in other significances yet")
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+
+            significance_calc = Significance(
+                Non=self._observed_counts,
+                Noff=self._background_counts,
+                alpha=self._scale_factor,
+            )
+
+            if self._background_noise_model == "poisson":
+
+                # use simple li & ma
+
+                return significance_calc.li_and_ma()
+
+            elif self._background_noise_model == "gaussian":
+
+                return significance_calc.li_and_ma_equivalent_for_gaussian_background(
+                    self._background_errors
+                )
+
+            else:
+
+                raise NotImplementedError("We haven't put in other significances yet")
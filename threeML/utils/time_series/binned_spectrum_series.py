@@ -1,8 +1,6 @@
 from __future__ import print_function
 from __future__ import division
 from builtins import zip
-from builtins import range
-from past.utils import old_div
 import numpy as np
 
 from threeML.config.config import threeML_config
@@ -42,7 +40,7 @@ class BinnedSpectrumSeries(TimeSeries):
             binned_spectrum_set.time_intervals.absolute_start,
             binned_spectrum_set.time_intervals.absolute_stop,
             binned_spectrum_set.n_channels,
-            binned_spectrum_set.quality_per_bin[0],
+            binned_spectrum_set[0].quality,
             first_channel,
             ra,
             dec,
@@ -84,29 +82,26 @@ class BinnedSpectrumSeries(TimeSeries):
 
         # git a set of bins containing the intervals
 
+        mask = self._select_bins(start, stop)
+
         bins = self._binned_spectrum_set.time_intervals.containing_interval(
             start, stop
         )  # type: TimeIntervalSet
 
-        cnts = []
-        width = []
-
-        for bin in bins:
-
-            cnts.append(self.counts_over_interval(bin.start_time, bin.stop_time))
-            width.append(bin.duration)
+        cnts = self._binned_spectrum_set.counts_per_bin[mask].sum(axis=1)
+        width = bins.widths
 
         # now we want to get the estimated background from the polynomial fit
 
         if self.poly_fit_exists:
 
-            bkg = []
-            for j, tb in enumerate(bins):
-                tmpbkg = 0.0
-                for poly in self.polynomials:
-                    tmpbkg += poly.integral(tb.start_time, tb.stop_time)
-
-                bkg.append(old_div(tmpbkg, width[j]))
+            bkg = (
+                sum(
+                    poly.integral(bins.start_times, bins.stop_times)
+                    for poly in self.polynomials
+                )
+                / width
+            )
 
         else:
 
@@ -134,8 +129,8 @@ class BinnedSpectrumSeries(TimeSeries):
 
         fig = binned_light_curve_plot(
             time_bins=bins.bin_stack,
-            cnts=np.array(cnts),
-            width=np.array(width),
+            cnts=cnts,
+            width=width,
             bkg=bkg,
             selection=selection,
             bkg_selections=bkg_selection,
@@ -156,15 +151,9 @@ class BinnedSpectrumSeries(TimeSeries):
 
         bins = self._select_bins(start, stop)
 
-        total_counts = 0
+        # sum over time and channels because we just want the total counts
 
-        for idx in np.where(bins)[0]:
-
-            # sum over channels because we just want the total counts
-
-            total_counts += self._binned_spectrum_set[idx].counts.sum()
-
-        return total_counts
+        return self._binned_spectrum_set.counts_per_bin[bins].sum()
 
     def count_per_channel_over_interval(self, start, stop):
         """
@@ -179,14 +168,11 @@ class BinnedSpectrumSeries(TimeSeries):
 
         bins = self._select_bins(start, stop)
 
-        total_counts = np.zeros(self._n_channels)
+        # don't sum over channels because we want the spectrum
 
-        for idx in np.where(bins)[0]:
-
-            # don't sum over channels because we want the spectrum
-            total_counts += self._binned_spectrum_set[idx].counts
-
-        return total_counts
+        return np.sum(
+            self._binned_spectrum_set.counts_per_bin[bins], axis=0, dtype=float
+        )
 
     def _select_bins(self, start, stop):
         """
@@ -200,47 +186,61 @@ class BinnedSpectrumSeries(TimeSeries):
             start, stop, as_mask=True
         )
 
-    def _adjust_to_true_intervals(self, time_intervals):
+    def _select_bins_of_intervals(self, time_intervals):
         """
-
-        adjusts time selections to those of the Binned spectrum set
-
+        return the indices of the bins selected by each interval of the set, concatenated
+        (in the order of the intervals)
 
         :param time_intervals: a time interval set
-        :return: an adjusted time interval set
+        :return: int indices
         """
 
-        # get all the starts and stops from these time intervals
+        masks = [
+            self._select_bins(start, stop)
+            for start, stop in zip(
+                time_intervals.start_times, time_intervals.stop_times
+            )
+        ]
 
-        true_starts = np.array(self._binned_spectrum_set.time_intervals.start_times)
-        true_stops = np.array(self._binned_spectrum_set.time_intervals.stop_times)
+        if len(masks) == 0:
 
-        new_starts = []
-        new_stops = []
+            return np.array([], dtype=int)
+
+        return np.nonzero(masks)[1]
+
+    def _adjust_to_true_intervals(self, time_intervals):
+        """
 
-        # now go thru all the intervals
-        for interval in time_intervals:
+        adjusts time selections to those of the Binned spectrum set
 
-            # find where the suggest intervals hits the true interval
 
-            # searchsorted is fast, but is not returing what we want
-            # we want the actaul values of the bins closest to the input
+        :param time_intervals: a time interval set
+        :return: an adjusted time interval set
+        """
 
-            # idx = np.searchsorted(true_starts, interval.start_time,side)
+        # get all the starts and stops from these time intervals
 
-            idx = (np.abs(true_starts - interval.start_time)).argmin()
+        true_starts = self._binned_spectrum_set.time_intervals.start_times
+        true_stops = self._binned_spectrum_set.time_intervals.stop_times
 
-            new_start = true_starts[idx]
+        # find the bin edges closest to the suggested ones (for all the intervals at once)
 
-            # idx = np.searchsorted(true_stops, interval.stop_time)
+        # searchsorted is fast, but is not returing what we want
+        # we want the actaul values of the bins closest to the input
 
-            idx = (np.abs(true_stops - interval.stop_time)).argmin()
+        idx = np.abs(
+            true_starts[np.newaxis, :]
+            - np.asarray(time_intervals.start_times)[:, np.newaxis]
+        ).argmin(axis=1)
 
-            new_stop = true_stops[idx]
+        new_starts = true_starts[idx]
 
-            new_starts.append(new_start)
+        idx = np.abs(
+            true_stops[np.newaxis, :]
+            - np.asarray(time_intervals.stop_times)[:, np.newaxis]
+        ).argmin(axis=1)
 
-            new_stops.append(new_stop)
+        new_stops = true_stops[idx]
 
         # alright, now we can make appropriate time intervals
 
@@ -273,30 +273,15 @@ class BinnedSpectrumSeries(TimeSeries):
         # now lets get all the counts, exposure and midpoints for the
         # selection
 
-        selected_counts = []
-        selected_exposure = []
-        selected_midpoints = []
-
-        for selection in poly_intervals:
+        idx = self._select_bins_of_intervals(poly_intervals)
 
-            # get the mask of these bins
+        # the counts will be (time, channel) here,
+        # so the index is selecting time.
+        # a sum along axis=0 is a sum in time, while axis=1 is a sum in energy
 
-            mask = self._select_bins(selection.start_time, selection.stop_time)
-
-            # the counts will be (time, channel) here,
-            # so the mask is selecting time.
-            # a sum along axis=0 is a sum in time, while axis=1 is a sum in energy
-
-            selected_counts.extend(self._binned_spectrum_set.counts_per_bin[mask])
-
-            selected_exposure.extend(self._binned_spectrum_set.exposure_per_bin[mask])
-            selected_midpoints.extend(
-                self._binned_spectrum_set.time_intervals.mid_points[mask]
-            )
-
-        selected_counts = np.array(selected_counts)
-        selected_midpoints = np.array(selected_midpoints)
-        selected_exposure = np.array(selected_exposure)
+        selected_counts = self._binned_spectrum_set.counts_per_bin[idx]
+        selected_exposure = self._binned_spectrum_set.exposure_per_bin[idx]
+        selected_midpoints = self._binned_spectrum_set.time_intervals.mid_points[idx]
 
         # Now we will find the the best poly order unless the use specified one
         # The total cnts (over channels) is binned
@@ -361,25 +346,16 @@ class BinnedSpectrumSeries(TimeSeries):
 
         time_intervals = self._adjust_to_true_intervals(time_intervals)
 
-        # start out with no time bins selection
-        all_idx = np.zeros(len(self._binned_spectrum_set.time_intervals), dtype=bool)
+        # the select bins method is called.
+        # since we are sure that the interval bounds
+        # are aligned with the true ones, we do not care if
+        # it is inner or outer
 
-        # now we need to sum up the counts and total time
-
-        total_time = 0
-
-        for interval in time_intervals:
-
-            # the select bins method is called.
-            # since we are sure that the interval bounds
-            # are aligned with the true ones, we do not care if
-            # it is inner or outer
+        all_idx = np.zeros(len(self._binned_spectrum_set.time_intervals), dtype=bool)
 
-            all_idx = np.logical_or(
-                all_idx, self._select_bins(interval.start_time, interval.stop_time)
-            )
+        all_idx[self._select_bins_of_intervals(time_intervals)] = True
 
-            total_time += interval.duration
+        total_time = np.sum(time_intervals.widths)
 
         # sum along the time axis
         self._counts = self._binned_spectrum_set.counts_per_bin[all_idx].sum(axis=0)
@@ -388,35 +364,23 @@ class BinnedSpectrumSeries(TimeSeries):
 
         self._time_intervals = time_intervals
 
-        tmp_counts = []
-        tmp_err = []  # Temporary list to hold the err counts per chan
-
         if self._poly_fit_exists:
 
-            if not self._poly_fit_exists:
-                raise RuntimeError("A polynomial fit to the channels does not exist!")
+            # Now integrate the appropriate background polynomial over all the intervals at once
 
-            for chan in range(self._n_channels):
+            starts = self._time_intervals.start_times
+            stops = self._time_intervals.stop_times
 
-                total_counts = 0
-                counts_err = 0
-
-                for tmin, tmax in zip(
-                    self._time_intervals.start_times, self._time_intervals.stop_times
-                ):
-                    # Now integrate the appropriate background polynomial
-                    total_counts += self._polynomials[chan].integral(tmin, tmax)
-                    counts_err += (
-                        self._polynomials[chan].integral_error(tmin, tmax)
-                    ) ** 2
-
-                tmp_counts.append(total_counts)
-
-                tmp_err.append(np.sqrt(counts_err))
-
-            self._poly_counts = np.array(tmp_counts)
+            self._poly_counts = np.array(
+                [np.sum(p.integral(starts, stops)) for p in self._polynomials]
+            )
 
-            self._poly_count_err = np.array(tmp_err)
+            self._poly_count_err = np.sqrt(
+                [
+                    np.sum(p.integral_error(starts, stops) ** 2)
+                    for p in self._polynomials
+                ]
+            )
 
         self._exposure = self._binned_spectrum_set.exposure_per_bin[all_idx].sum()
 
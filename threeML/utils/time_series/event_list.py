@@ -104,6 +104,10 @@ class EventList(TimeSeries):
 
         self._temporal_binner = None
 
+        # built on first use by _get_sorted_events
+
+        self._sorted_events = None
+
         assert self._arrival_times.shape[0] == self._measurement.shape[0], (
             "Arrival time (%d) and energies (%d) have different shapes"
             % (self._arrival_times.shape[0], self._measurement.shape[0])
@@ -164,18 +168,15 @@ class EventList(TimeSeries):
 
         events = events[np.logical_and(events <= stop, events >= start)]
 
-        tmp_bkg_getter = lambda a, b: self.get_total_poly_count(a, b, mask)
-        tmp_err_getter = lambda a, b: self.get_total_poly_error(a, b, mask)
+        # sum the polynomials of the selected channels once, so that the background (and its error)
+        # of many intervals can be computed at once
 
-        # self._temporal_binner.bin_by_significance(tmp_bkg_getter,
-        #                                           background_error_getter=tmp_err_getter,
-        #                                           sigma_level=sigma,
-        #                                           min_counts=min_counts)
+        total_polynomial = self.get_total_polynomial(mask)
 
         self._temporal_binner = TemporalBinner.bin_by_significance(
             events,
-            tmp_bkg_getter,
-            background_error_getter=tmp_err_getter,
+            total_polynomial.integral,
+            background_error_getter=total_polynomial.integral_error,
             sigma_level=sigma,
             min_counts=min_counts,
         )
@@ -266,54 +267,27 @@ class EventList(TimeSeries):
             bins = np.arange(start, stop + dt, dt)
 
         cnts, bins = np.histogram(self.arrival_times, bins=bins)
-        time_bins = np.array([[bins[i], bins[i + 1]] for i in range(len(bins) - 1)])
+        time_bins = np.array([bins[:-1], bins[1:]]).T
+
+        # we will use the exposure for the width
 
-        # width = np.diff(bins)
-        width = []
+        width = self.exposure_over_intervals(bins[:-1], bins[1:])
 
         # now we want to get the estimated background from the polynomial fit
 
         if self.poly_fit_exists:
 
-            # we will store the bkg rate for each time bin
-
-            bkg = []
-
-            for j, tb in enumerate(time_bins):
-
-                # zero out the bkg
-                tmpbkg = 0.0
-
-                # we will use the exposure for the width
-
-                this_width = self.exposure_over_interval(tb[0], tb[1])
-
-                # sum up the counts over this interval
+            # the bkg *rate* in each time bin, from the sum of the polynomials
+            # of all the channels
 
-                for poly in self.polynomials:
-
-                    tmpbkg += poly.integral(tb[0], tb[1])
-
-                # capture the exposure
-
-                width.append(this_width)
-
-                # capture the bkg *rate*
-
-                bkg.append(old_div(tmpbkg, this_width))
+            bkg = old_div(
+                self.get_total_polynomial().integral(bins[:-1], bins[1:]), width
+            )
 
         else:
 
             bkg = None
 
-            for j, tb in enumerate(time_bins):
-
-                this_width = self.exposure_over_interval(tb[0], tb[1])
-
-                width.append(this_width)
-
-        width = np.array(width)
-
         # pass all this to the light curve plotter
 
         if self.time_intervals is not None:
@@ -371,6 +345,89 @@ class EventList(TimeSeries):
 
         return counts_per_channel
 
+    def count_per_channel_over_intervals(self, starts, stops):
+        """
+        return the number of counts per channel in many intervals at once, in one pass over the
+        events: the cumulative histogram of the channels is evaluated only at the edges of the
+        intervals, so that the counts of an interval are the difference of two of its entries
+
+        :param starts: array of start times
+        :param stops: array of stop times
+        :return: array of counts with shape (n_intervals, n_channels)
+        """
+
+        starts = np.atleast_1d(np.asarray(starts, dtype=float))
+        stops = np.atleast_1d(np.asarray(stops, dtype=float))
+
+        assert starts.shape == stops.shape, "starts and stops must have the same shape"
+
+        if starts.shape[0] == 0:
+
+            return np.zeros((0, self._n_channels))
+
+        arrival_times, measurement = self._get_sorted_events()
+
+        # same selection as _select_events, i.e., start <= t <= stop
+
+        first = np.searchsorted(arrival_times, starts, side="left")
+        last = np.searchsorted(arrival_times, stops, side="right")
+
+        edges, edge_idx = np.unique(np.concatenate((first, last)), return_inverse=True)
+
+        # the events between two consecutive edges form a segment
+
+        segment = np.repeat(np.arange(edges.shape[0]), np.diff(edges, prepend=0))
+
+        channel = measurement[: edges[-1]] - self._first_channel
+
+        valid = (channel >= 0) & (channel < self._n_channels)
+
+        if not np.issubdtype(channel.dtype, np.integer):
+
+            valid &= channel == np.floor(channel)
+
+        histogram = np.bincount(
+            segment[valid] * self._n_channels + channel[valid].astype(int),
+            minlength=edges.shape[0] * self._n_channels,
+        ).reshape(edges.shape[0], self._n_channels)
+
+        # number of events per channel before each edge
+
+        cumulative = np.cumsum(histogram, axis=0)
+
+        counts = (
+            cumulative[edge_idx[starts.shape[0] :]]
+            - cumulative[edge_idx[: starts.shape[0]]]
+        )
+
+        return np.where((last > first)[:, np.newaxis], counts, 0).astype(float)
+
+    def _get_sorted_events(self):
+        """
+        Build (once) the arrival times in increasing order and the measurements in that order
+
+        :return: (sorted arrival times, sorted measurements)
+        """
+
+        if self._sorted_events is None:
+
+            arrival_times = self._arrival_times
+            measurement = self._measurement
+
+            # event lists are almost always already sorted in time
+
+            if not np.all(arrival_times[1:] >= arrival_times[:-1]):
+
+                idx = np.argsort(arrival_times, kind="mergesort")
+
+                arrival_times = arrival_times[idx]
+
+                measurement = measurement[idx]
+
+            self._sorted_events = (arrival_times, measurement)
+
+        return self._sorted_events
+
     def _select_events(self, start, stop):
         """
         return an index of the selected events
@@ -432,23 +489,15 @@ class EventList(TimeSeries):
         # so that we are not fitting zero counts. It will be used in the channel calculations
         # as well
 
-        bin_width = 1.0  # seconds
-        these_bins = np.arange(self._start_time, self._stop_time, bin_width)
+        these_bins = np.arange(self._start_time, self._stop_time, self._poly_bin_width)
 
         cnts, bins = np.histogram(total_poly_events, bins=these_bins)
 
         # Find the mean time of the bins and calculate the exposure in each bin
-        mean_time = []
-        exposure_per_bin = []
-        for i in range(len(bins) - 1):
-            m = np.mean((bins[i], bins[i + 1]))
-            mean_time.append(m)
 
-            exposure_per_bin.append(self.exposure_over_interval(bins[i], bins[i + 1]))
+        mean_time = 0.5 * (bins[:-1] + bins[1:])
 
-        mean_time = np.array(mean_time)
-
-        exposure_per_bin = np.array(exposure_per_bin)
+        exposure_per_bin = self.exposure_over_intervals(bins[:-1], bins[1:])
 
         # Remove bins with zero counts
         all_non_zero_mask = []
@@ -539,17 +588,13 @@ class EventList(TimeSeries):
 
         all_bkg_masks = []
 
-        total_duration = 0.0
-
-        poly_exposure = 0
-
-        for selection in self._poly_intervals:
-            total_duration += selection.duration
-
-            poly_exposure += self.exposure_over_interval(
-                selection.start_time, selection.stop_time
+        poly_exposure = np.sum(
+            self.exposure_over_intervals(
+                self._poly_intervals.start_times, self._poly_intervals.stop_times
             )
+        )
 
+        for selection in self._poly_intervals:
             all_bkg_masks.append(
                 np.logical_and(
                     self._arrival_times >= selection.start_time,
@@ -701,26 +746,85 @@ class EventListWithDeadTime(EventList):
 
             self._dead_time = None
 
-    def exposure_over_interval(self, start, stop):
+        # built on first use by _get_cumulative_dead_time
+
+        self._sorted_arrival_times = None
+        self._cumulative_dead_time = None
+
+    def _get_cumulative_dead_time(self):
         """
-        calculate the exposure over the given interval
+        Build (once) the arrival times in increasing order and the cumulative dead time of the
+        events in that order, starting with 0. The dead time of the events with start <= t <= stop
+        is then the difference of two entries of the cumulative array.
 
-        :param start: start time
-        :param stop:  stop time
-        :return:
+        :return: (sorted arrival times, cumulative dead time)
         """
 
-        mask = self._select_events(start, stop)
+        if self._cumulative_dead_time is None:
 
-        if self._dead_time is not None:
+            arrival_times = self._arrival_times
 
-            interval_deadtime = (self._dead_time[mask]).sum()
+            # event lists are almost always already sorted in time
 
-        else:
+            if np.all(arrival_times[1:] >= arrival_times[:-1]):
 
-            interval_deadtime = 0
+                dead_time = self._dead_time
+
+            else:
+
+                idx = np.argsort(arrival_times, kind="mergesort")
+
+                arrival_times = arrival_times[idx]
+
+                dead_time = self._dead_time[idx]
+
+            self._sorted_arrival_times = arrival_times
+
+            self._cumulative_dead_time = np.concatenate(([0.0], np.cumsum(dead_time)))
+
+        return self._sorted_arrival_times, self._cumulative_dead_time
+
+    def exposure_over_intervals(self, starts, stops):
+        """
+        calculate the exposure over many intervals at once
+
+        :param starts: array of start times
+        :param stops: array of stop times
+        :return: array of exposures
+        """
+
+        starts = np.atleast_1d(np.asarray(starts, dtype=float))
+        stops = np.atleast_1d(np.asarray(stops, dtype=float))
+
+        assert starts.shape == stops.shape, "starts and stops must have the same shape"
+
+        if self._dead_time is None:
+
+            return stops - starts
+
+        arrival_times, cumulative_dead_time = self._get_cumulative_dead_time()
+
+        # same selection as _select_events, i.e., start <= t <= stop
+
+        first = np.searchsorted(arrival_times, starts, side="left")
+        last = np.searchsorted(arrival_times, stops, side="right")
+
+        interval_deadtime = np.where(
+            last > first, cumulative_dead_time[last] - cumulative_dead_time[first], 0.0,
+        )
+
+        return (stops - starts) - interval_deadtime
+
+    def exposure_over_interval(self, start, stop):
+        """
+        calculate the exposure over the given interval
+
+        :param start: start time
+        :param stop:  stop time
+        :return:
+        """
 
-        return (stop - start) - interval_deadtime
+        return self.exposure_over_intervals(start, stop)[0]
 
     def set_active_time_intervals(self, *args):
         """Set the time interval(s) to be used during the analysis.
@@ -1073,100 +1177,92 @@ class EventListWithLiveTime(EventList):
         self._live_time_starts = np.asarray(live_time_starts)
         self._live_time_stops = np.asarray(live_time_stops)
 
-    def exposure_over_interval(self, start, stop):
-        """
-
-        :param start: start time of interval
-        :param stop: stop time of interval
-        :return: exposure
-        """
+        # The cumulative live time at the start of each live time bin (ordered in time), so that
+        # the live time up to any time t is found with a binary search plus the linear fraction of
+        # the bin containing t. Gaps between the bins do not contribute.
 
-        # First see if the interval is completely contained inside a
-        # livetime interval. In this case we only compute that.
+        idx = np.argsort(self._live_time_starts, kind="mergesort")
 
-        # Note that this is explicitly on the open boundary of the
-        # intervals because the closed boundary is covered in the
-        # next step
+        self._sorted_live_time_starts = self._live_time_starts[idx]
 
-        inside_idx = np.logical_and(
-            self._live_time_starts < start, stop < self._live_time_stops
+        self._sorted_live_time_widths = (
+            self._live_time_stops[idx] - self._live_time_starts[idx]
         )
 
-        # see if it contains elements
+        self._sorted_live_time = self._live_time[idx]
 
-        if self._live_time[inside_idx].size > 0:
-
-            # we want to take a fraction of the live time covered
-
-            dt = self._live_time_stops[inside_idx] - self._live_time_starts[inside_idx]
+        self._cumulative_live_time = np.concatenate(
+            ([0.0], np.cumsum(self._sorted_live_time))
+        )
 
-            fraction = old_div((stop - start), dt)
+    def _live_time_before(self, times):
+        """
+        compute the live time accumulated from the beginning of the live time bins up to the
+        given times
 
-            total_livetime = self._live_time[inside_idx] * fraction
+        :param times: array of times
+        :return: array of live times
+        """
 
-        else:
+        # index of the bin starting at or before each time (-1 if before the first bin)
 
-            # First we get the live time of bins that are fully contained in the given interval
-            # We now go for the closed interval because it is possible to have overlap with other intervals
-            # when a closed interval exists... but not when there is only an open interval
+        idx = np.searchsorted(self._sorted_live_time_starts, times, side="right") - 1
 
-            full_inclusion_idx = np.logical_and(
-                start <= self._live_time_starts, stop >= self._live_time_stops
-            )
+        in_range = idx >= 0
 
-            full_inclusion_livetime = self._live_time[full_inclusion_idx].sum()
+        idx = np.clip(idx, 0, None)
 
-            # Now we get the fractional parts on the left and right
+        widths = self._sorted_live_time_widths[idx]
 
-            # Get the fractional part of the left bin
+        # fraction of the bin covered up to the time (1 if the time is after the end of the bin)
 
-            left_remainder_idx = np.logical_and(
-                start <= self._live_time_stops, self._live_time_starts <= start
-            )
+        elapsed = times - self._sorted_live_time_starts[idx]
 
-            dt = (
-                self._live_time_stops[left_remainder_idx]
-                - self._live_time_starts[left_remainder_idx]
-            )
+        fraction = np.divide(
+            elapsed, widths, out=np.ones_like(elapsed), where=widths > 0
+        )
 
-            # we want the distance to the stop of this bin
+        fraction = np.minimum(np.maximum(fraction, 0.0), 1.0)
 
-            distance_from_next_bin = self._live_time_stops[left_remainder_idx] - start
+        live_time = (
+            self._cumulative_live_time[idx] + self._sorted_live_time[idx] * fraction
+        )
 
-            fraction = old_div(distance_from_next_bin, dt)
+        return np.where(in_range, live_time, 0.0)
 
-            left_fractional_livetime = self._live_time[left_remainder_idx] * fraction
+    def exposure_over_intervals(self, starts, stops):
+        """
+        calculate the exposure over many intervals at once
 
-            # Get the fractional part of the right bin
+        :param starts: array of start times
+        :param stops: array of stop times
+        :return: array of exposures
+        """
 
-            right_remainder_idx = np.logical_and(
-                self._live_time_starts <= stop, stop <= self._live_time_stops
-            )
+        starts = np.atleast_1d(np.asarray(starts, dtype=float))
+        stops = np.atleast_1d(np.asarray(stops, dtype=float))
 
-            dt = (
-                self._live_time_stops[right_remainder_idx]
-                - self._live_time_starts[right_remainder_idx]
-            )
+        assert starts.shape == stops.shape, "starts and stops must have the same shape"
 
-            # we want the distance from the last full bin
+        if self._sorted_live_time_starts.size == 0:
 
-            distance_from_next_bin = stop - self._live_time_starts[right_remainder_idx]
+            return np.zeros_like(starts)
 
-            fraction = old_div(distance_from_next_bin, dt)
+        # a single lookup for all the edges
 
-            right_fractional_livetime = self._live_time[right_remainder_idx] * fraction
+        live_time = self._live_time_before(np.concatenate((starts, stops)))
 
-            # sum up all the live time
+        return live_time[starts.size :] - live_time[: starts.size]
 
-            total_livetime = (
-                full_inclusion_livetime
-                + left_fractional_livetime
-                + right_fractional_livetime
-            )
+    def exposure_over_interval(self, start, stop):
+        """
 
-        # the sum at the end converts all the arrays to floats
+        :param start: start time of interval
+        :param stop: stop time of interval
+        :return: exposure
+        """
 
-        return total_livetime.sum()
+        return self.exposure_over_intervals(start, stop)[0]
 
     def set_active_time_intervals(self, *args):
         """Set the time interval(s) to be used during the analysis.
@@ -1244,13 +1340,12 @@ class EventListWithLiveTime(EventList):
 
         # Live time correction
 
-        exposure = 0.0
-        total_real_time = 0.0
-        for interval in self._time_intervals:
-            total_real_time += interval.duration
-            exposure += self.exposure_over_interval(
-                interval.start_time, interval.stop_time
+        total_real_time = np.sum(self._time_intervals.widths)
+        exposure = np.sum(
+            self.exposure_over_intervals(
+                self._time_intervals.start_times, self._time_intervals.stop_times
             )
+        )
 
         # In this case the exposure is the total live time
 
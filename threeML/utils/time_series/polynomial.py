@@ -175,21 +175,47 @@ class Polynomial(object):
 
     def _eval_basis(self, x):
 
-        return (1.0 / self._i_plus_1) * np.power(x, self._i_plus_1)
+        # works for arrays of x as well, the basis being along the last axis
+
+        return (1.0 / self._i_plus_1) * np.power(
+            np.asarray(x, dtype=float)[..., np.newaxis], self._i_plus_1
+        )
 
     def integral_error(self, xmin, xmax):
         """
         computes the integral error of an interval
-        :param xmin: start of the interval
-        :param xmax: stop of the interval
+        :param xmin: start of the interval (or array of starts)
+        :param xmax: stop of the interval (or array of stops)
         :return: interval error
         """
         c = self._eval_basis(xmax) - self._eval_basis(xmin)
-        tmp = c.dot(self._cov_matrix)
-        err2 = tmp.dot(c)
+        err2 = np.einsum("...i,ij,...j->...", c, self._cov_matrix, c)
 
         return np.sqrt(err2)
 
+    def __add__(self, other):
+        """
+        Sum of two polynomials (for example the background of two channels). The two polynomials are
+        assumed to come from independent fits, so that their covariance matrices add up
+
+        :param other: another Polynomial
+        :return: a new Polynomial
+        """
+
+        degree = max(self._degree, other.degree)
+
+        coefficients = np.zeros(degree + 1)
+        covariance = np.zeros((degree + 1, degree + 1))
+
+        for polynomial in (self, other):
+
+            n = polynomial.degree + 1
+
+            coefficients[:n] += polynomial.coefficients
+            covariance[:n, :n] += polynomial.covariance_matrix
+
+        return Polynomial.from_previous_fit(coefficients, covariance)
+
 
 class PolyLogLikelihood(object):
     def __init__(self, model, exposure):
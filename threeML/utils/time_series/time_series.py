@@ -8,6 +8,8 @@ from past.utils import old_div
 __author__ = "grburgess"
 
 import collections
+import functools
+import operator
 import os
 
 import numpy as np
@@ -131,6 +133,9 @@ class TimeSeries(object):
         self._time_selection_exists = False
         self._poly_fit_exists = False
 
+        # width (in seconds) of the bins used in binned polynomial fits
+        self._poly_bin_width = 1.0
+
         self._fit_method_info = {"bin type": None, "fit method": None}
 
     def set_active_time_intervals(self, *args):
@@ -213,6 +218,20 @@ class TimeSeries(object):
 
         return total_counts
 
+    def get_total_polynomial(self, mask=None):
+        """
+
+        Get the sum of the polynomials of the selected channels, i.e., the model of the total
+        background rate. Its integral and integral_error methods accept arrays of times
+
+        :param mask: (optional) mask selecting the channels
+        :return: a Polynomial
+        """
+        if mask is None:
+            mask = np.ones_like(self._polynomials, dtype=np.bool)
+
+        return functools.reduce(operator.add, np.asarray(self._polynomials)[mask])
+
     def get_total_poly_error(self, start, stop, mask=None):
         """
 
@@ -264,7 +283,8 @@ class TimeSeries(object):
 
                 self.set_polynomial_fit_interval(
                     *self._poly_intervals.to_string().split(","),
-                    unbinned=self._unbinned
+                    unbinned=self._unbinned,
+                    bin_width=self._poly_bin_width
                 )
 
             else:
@@ -304,6 +324,27 @@ class TimeSeries(object):
 
         raise RuntimeError("Must be implemented in sub class")
 
+    def exposure_over_intervals(self, starts, stops):
+        """
+        calculate the exposure over many intervals at once. Sub classes which can compute
+        the exposure in a vectorized way override this, the default calls
+        exposure_over_interval for each interval
+
+        :param starts: array of start times
+        :param stops: array of stop times
+        :return: array of exposures
+        """
+
+        starts = np.atleast_1d(np.asarray(starts, dtype=float))
+        stops = np.atleast_1d(np.asarray(stops, dtype=float))
+
+        assert starts.shape == stops.shape, "starts and stops must have the same shape"
+
+        return np.array(
+            [self.exposure_over_interval(a, b) for a, b in zip(starts, stops)],
+            dtype=float,
+        )
+
     def counts_over_interval(self, start, stop):
         """
         return the number of counts in the selected interval
@@ -334,6 +375,10 @@ class TimeSeries(object):
 
         set_polynomial_fit_interval("-10.0-0.0","10.-15.")
 
+        The options are unbinned (bool, default True) to choose between an unbinned and a binned fit,
+        and bin_width (default 1 s) to set the width of the bins used in binned fits, which can be
+        increased to fit long observations at a coarser resolution.
+
         :param time_intervals: intervals to fit on
         :param options:
 
@@ -353,6 +398,12 @@ class TimeSeries(object):
 
             unbinned = True
 
+        # the width of the bins of a binned fit (in seconds)
+        bin_width = float(options.pop("bin_width", 1.0))
+        assert bin_width > 0, "bin_width must be positive"
+
+        self._poly_bin_width = bin_width
+
         # we create some time intervals
 
         poly_intervals = TimeIntervalSet.from_strings(*time_intervals)
@@ -444,6 +495,54 @@ class TimeSeries(object):
         if self._time_selection_exists:
             self.set_active_time_intervals(*self._time_intervals.to_string().split(","))
 
+    def count_per_channel_over_intervals(self, starts, stops):
+        """
+        return the number of counts per channel in many intervals at once. Sub classes which can
+        count all the intervals in one pass override this, the default calls
+        count_per_channel_over_interval for each interval
+
+        :param starts: array of start times
+        :param stops: array of stop times
+        :return: array of counts with shape (n_intervals, n_channels)
+        """
+
+        starts = np.atleast_1d(np.asarray(starts, dtype=float))
+        stops = np.atleast_1d(np.asarray(stops, dtype=float))
+
+        assert starts.shape == stops.shape, "starts and stops must have the same shape"
+
+        counts = np.zeros((starts.shape[0], self._n_channels))
+
+        for i, (start, stop) in enumerate(zip(starts, stops)):
+
+            counts[i] = self.count_per_channel_over_interval(start, stop)
+
+        return counts
+
+    def poly_counts_over_intervals(self, starts, stops):
+        """
+        integrate the background polynomials of all the channels over many intervals at once
+
+        :param starts: array of start times
+        :param stops: array of stop times
+        :return: (counts, errors), arrays with shape (n_intervals, n_channels)
+        """
+
+        if not self._poly_fit_exists:
+
+            raise RuntimeError("A polynomial fit to the channels does not exist!")
+
+        starts = np.atleast_1d(np.asarray(starts, dtype=float))
+        stops = np.atleast_1d(np.asarray(stops, dtype=float))
+
+        counts = np.array([p.integral(starts, stops) for p in self._polynomials]).T
+
+        errors = np.array(
+            [p.integral_error(starts, stops) for p in self._polynomials]
+        ).T
+
+        return counts, errors
+
     def get_information_dict(self, use_poly=False, extract=False):
         """
         Return a PHAContainer that can be read by different builders
@@ -494,23 +593,117 @@ class TimeSeries(object):
 
             exposure = self._exposure
 
+        return self._make_information_dict(
+            counts,
+            counts_err,
+            rates,
+            rate_err,
+            exposure,
+            self._time_intervals.absolute_start_time,
+            self._time_intervals.absolute_stop_time,
+            self._get_quality(),
+        )
+
+    def get_information_dicts(self, starts, stops, use_poly=False, extract=False):
+        """
+        Return the information dicts (see get_information_dict) of many intervals at once, without
+        changing the active time selection. The counts of all the intervals are computed in one pass
+        and the polynomials are integrated over all the intervals at once, so this is much faster
+        than selecting the intervals one after the other.
+
+        :param starts: array of start times
+        :param stops: array of stop times
+        :param use_poly: (bool) choose to build from the polynomial fits
+        :param extract: (bool) choose to build from the counts selected for the polynomial fits
+        :return: list of dicts, one per interval
+        """
+
+        starts = np.atleast_1d(np.asarray(starts, dtype=float))
+        stops = np.atleast_1d(np.asarray(stops, dtype=float))
+
+        n_intervals = starts.shape[0]
+
+        if extract:
+
+            # the same spectrum for all the intervals
+
+            counts = [self._poly_selected_counts] * n_intervals
+            counts_err = [None] * n_intervals
+            rates = [self._poly_selected_counts / self._poly_exposure] * n_intervals
+            rate_err = [None] * n_intervals
+            exposure = np.full(n_intervals, self._poly_exposure)
+
+        elif use_poly:
+
+            exposure = self.exposure_over_intervals(starts, stops)
+
+            counts, counts_err = self.poly_counts_over_intervals(starts, stops)
+
+            # removing negative counts
+
+            idx = counts < 0.0
+
+            counts[idx] = 0.0
+            counts_err[idx] = 0.0
+
+            rates = counts / exposure[:, np.newaxis]
+            rate_err = counts_err / exposure[:, np.newaxis]
+
+        else:
+
+            exposure = self.exposure_over_intervals(starts, stops)
+
+            counts = self.count_per_channel_over_intervals(starts, stops)
+            counts_err = [None] * n_intervals
+            rates = counts / exposure[:, np.newaxis]
+            rate_err = [None] * n_intervals
+
+        quality = self._get_quality()
+
+        return [
+            self._make_information_dict(
+                counts[i],
+                counts_err[i],
+                rates[i],
+                rate_err[i],
+                exposure[i],
+                starts[i],
+                stops[i],
+                quality,
+            )
+            for i in range(n_intervals)
+        ]
+
+    def _get_quality(self):
+
         if self._native_quality is None:
 
-            quality = np.zeros_like(counts, dtype=int)
+            quality = np.zeros(self._n_channels, dtype=int)
 
         else:
 
             quality = self._native_quality
 
+        # check to see if we already have a quality object
+
+        if isinstance(quality, Quality):
+
+            return quality
+
+        else:
+
+            return Quality.from_ogip(quality)
+
+    def _make_information_dict(
+        self, counts, counts_err, rates, rate_err, exposure, tstart, tstop, quality
+    ):
+
         container_dict = {}
 
         container_dict["instrument"] = self._instrument
         container_dict["telescope"] = self._mission
-        container_dict["tstart"] = self._time_intervals.absolute_start_time
-        container_dict["telapse"] = (
-            self._time_intervals.absolute_stop_time
-            - self._time_intervals.absolute_start_time
-        )
+        container_dict["tstart"] = tstart
+        container_dict["telapse"] = tstop - tstart
         container_dict["channel"] = np.arange(self._n_channels) + self._first_channel
         container_dict["counts"] = counts
         container_dict["counts error"] = counts_err
@@ -519,15 +712,7 @@ class TimeSeries(object):
 
         container_dict["edges"] = self._edges
 
-        # check to see if we already have a quality object
-
-        if isinstance(quality, Quality):
-
-            container_dict["quality"] = quality
-
-        else:
-
-            container_dict["quality"] = Quality.from_ogip(quality)
+        container_dict["quality"] = quality
 
         # TODO: make sure the grouping makes sense
         container_dict["backfile"] = "NONE"